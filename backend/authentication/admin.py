@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.utils.translation import gettext_lazy as _
 
-from .models import CustomUser, LoginAttempt, UserActivity, TOTPDevice
+from .models import CustomUser, LoginAttempt, UserActivity, TOTPDevice, OutboundEmail, OneTimeToken
 
 @admin.register(CustomUser)
 class CustomUserAdmin(UserAdmin):
@@ -49,6 +49,9 @@ class LoginAttemptAdmin(admin.ModelAdmin):
     search_fields = ('user__username', 'ip_address')
     ordering = ('-timestamp',)
     date_hierarchy = 'timestamp'
+    list_select_related = ('user',)
+    # Skip the COUNT(*) over the whole table on every page
+    show_full_result_count = False
 
 @admin.register(UserActivity)
 class UserActivityAdmin(admin.ModelAdmin):
@@ -60,6 +63,9 @@ class UserActivityAdmin(admin.ModelAdmin):
     search_fields = ('user__username', 'ip_address', 'activity_type')
     ordering = ('-timestamp',)
     date_hierarchy = 'timestamp'
+    list_select_related = ('user',)
+    # Skip the COUNT(*) over the whole table on every page
+    show_full_result_count = False
     
     def has_add_permission(self, request):
         # User activities should only be created through code, not admin
@@ -78,3 +84,27 @@ class TOTPDeviceAdmin(admin.ModelAdmin):
     
     # Ensure security by not displaying the key in list view
     readonly_fields = ('key',)
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    """
+    Admin configuration for OutboundEmail model
+    """
+    list_display = ('to_email', 'purpose', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status', 'purpose')
+    search_fields = ('to_email', 'user__username')
+    ordering = ('-created_at',)
+    # The body of a pending message carries a live token link
+    exclude = ('body',)
+    readonly_fields = ('last_error',)
+
+@admin.register(OneTimeToken)
+class OneTimeTokenAdmin(admin.ModelAdmin):
+    """
+    Admin configuration for OneTimeToken model
+    """
+    list_display = ('user', 'purpose', 'created_at', 'expires_at', 'consumed_at')
+    list_filter = ('purpose',)
+    search_fields = ('user__username',)
+    ordering = ('-created_at',)
+    readonly_fields = ('digest',)
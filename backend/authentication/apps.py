@@ -4,3 +4,15 @@ from django.apps import AppConfig
 class AuthenticationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'authentication'
+
+    def ready(self):
+        from django.contrib.auth import get_user_model
+        from django.contrib.auth.signals import user_login_failed
+        from django.db.models.signals import post_delete, post_save
+
+        from .signals import drop_cached_profile, log_failed_login, update_cached_profile
+
+        User = get_user_model()
+        user_login_failed.connect(log_failed_login, dispatch_uid='authentication.log_failed_login')
+        post_save.connect(update_cached_profile, sender=User, dispatch_uid='authentication.update_cached_profile')
+        post_delete.connect(drop_cached_profile, sender=User, dispatch_uid='authentication.drop_cached_profile')
@@ -0,0 +1,12 @@
+from django.urls import path
+
+from . import async_views
+
+# Async versions of the hot auth endpoints, mounted ahead of the sync
+# views when ASYNC_AUTH_VIEWS is on; the URL names are the same
+urlpatterns = [
+    path('token/', async_views.token_obtain_pair, name='token_obtain_pair'),
+    path('token/refresh/', async_views.token_refresh, name='token_refresh'),
+    path('verify-email/', async_views.verify_email, name='verify-email'),
+    path('verify-2fa/', async_views.verify_2fa, name='verify-2fa'),
+]
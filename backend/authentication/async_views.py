@@ -0,0 +1,187 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import JsonResponse
+from rest_framework import exceptions, status
+from rest_framework.parsers import FormParser, JSONParser
+from rest_framework.request import Request
+from rest_framework.serializers import as_serializer_error
+from rest_framework.settings import api_settings
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from .audit import alog_activity
+from .authentication import CachedJWTAuthentication
+from .instrumentation import timed_serialization
+from .models import TOTPDevice
+from .one_time_tokens import aconsume_token
+from .serializers_jwt import CustomTokenObtainPairSerializer
+from .signing import aprepare_token_backend
+from .throttles import EmailVerificationRateThrottle, LoginRateThrottle
+from .token_views import CustomTokenRefreshView, record_login
+from .totp import ainvalidate_two_factor_state, confirm_totp_device
+from .two_factor_serializers import TOTPVerifySerializer
+from .utils import get_client_ip
+
+# Returned with 401 responses, as JWTAuthentication does
+WWW_AUTHENTICATE = 'Bearer realm="api"'
+
+jwt_auth = CachedJWTAuthentication()
+
+
+def error_response(exc):
+    """
+    Render an API exception the way DRF's exception handler does
+    """
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        exc.auth_header = WWW_AUTHENTICATE
+    response = api_settings.EXCEPTION_HANDLER(exc, {'view': None, 'args': (), 'kwargs': {}, 'request': None})
+    if response is None:
+        raise exc
+    json_response = JsonResponse(response.data, status=response.status_code, safe=False)
+    for header in ('WWW-Authenticate', 'Retry-After'):
+        if header in response:
+            json_response[header] = response[header]
+    return json_response
+
+
+async def check_throttles(request, throttle_classes):
+    """
+    Apply throttles like APIView.check_throttles
+
+    Throttle backends talk to Redis or the cache synchronously, so they
+    run on the request's sync thread.
+    """
+    def wait_times():
+        throttles = [throttle_class() for throttle_class in throttle_classes]
+        return [throttle.wait() for throttle in throttles if not throttle.allow_request(request, None)]
+
+    durations = await sync_to_async(wait_times)()
+    if durations:
+        durations = [duration for duration in durations if duration is not None]
+        raise exceptions.Throttled(max(durations, default=None))
+
+
+def async_api_view(throttle_classes=None, extra_throttle_classes=(), authenticate=False, require_user=False):
+    """
+    Turn a coroutine taking a DRF Request into a POST-only async view
+
+    The request body is parsed by DRF's JSON and form parsers, the bearer
+    token is checked with CachedJWTAuthentication when ``authenticate`` is
+    set, and throttles default to DEFAULT_THROTTLE_CLASSES as on APIView.
+    API exceptions become the same JSON error responses DRF returns.
+    """
+    def decorator(func):
+        @wraps(func)
+        async def view(request, *args, **kwargs):
+            if request.method != 'POST':
+                response = error_response(exceptions.MethodNotAllowed(request.method))
+                response['Allow'] = 'POST, OPTIONS'
+                return response
+
+            drf_request = Request(request, parsers=[JSONParser(), FormParser()], authenticators=())
+            try:
+                drf_request.user = AnonymousUser()
+                if authenticate:
+                    result = await jwt_auth.aauthenticate(drf_request)
+                    if result is not None:
+                        drf_request.user, drf_request.auth = result
+                if require_user and not drf_request.user.is_authenticated:
+                    raise exceptions.NotAuthenticated()
+
+                classes = api_settings.DEFAULT_THROTTLE_CLASSES if throttle_classes is None else throttle_classes
+                await check_throttles(drf_request, [*classes, *extra_throttle_classes])
+                return await func(drf_request, *args, **kwargs)
+            except exceptions.APIException as exc:
+                return error_response(exc)
+
+        # Token clients do not send a CSRF token, as with DRF's views
+        view.csrf_exempt = True
+        return view
+    return decorator
+
+
+@async_api_view(throttle_classes=[LoginRateThrottle])
+async def token_obtain_pair(request):
+    """
+    Async counterpart of CustomTokenObtainPairView
+    """
+    serializer = CustomTokenObtainPairSerializer(data=request.data, context={'request': request})
+    await aprepare_token_backend(signing=True)
+    try:
+        with timed_serialization():
+            attrs = serializer.to_internal_value(request.data)
+        payload = await serializer.avalidate(attrs)
+    except exceptions.ValidationError as exc:
+        raise exceptions.ValidationError(as_serializer_error(exc))
+    except TokenError as e:
+        raise InvalidToken(e.args[0])
+
+    # One transaction, which the async ORM cannot open
+    await sync_to_async(record_login)(
+        serializer.user,
+        get_client_ip(request),
+        serializer.refresh,
+        request.META.get('HTTP_USER_AGENT', ''),
+    )
+    return JsonResponse(payload)
+
+
+@async_api_view()
+async def token_refresh(request):
+    """
+    Async counterpart of CustomTokenRefreshView
+    """
+    serializer = CustomTokenRefreshView().get_serializer_class()(data=request.data)
+    try:
+        # Revoking the old refresh token talks to the revocation store
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+    except TokenError as e:
+        raise InvalidToken(e.args[0])
+    return JsonResponse(serializer.validated_data)
+
+
+@async_api_view(extra_throttle_classes=[EmailVerificationRateThrottle], authenticate=True)
+async def verify_email(request):
+    """
+    Async counterpart of UserViewSet.verify_email
+    """
+    token = request.data.get('token')
+    if not token:
+        return JsonResponse({'error': 'Token is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+    user = await aconsume_token(token, 'email_verification')
+    if user is None:
+        return JsonResponse({'error': 'Invalid token'}, status=status.HTTP_400_BAD_REQUEST)
+
+    user.is_verified = True
+    await user.asave(update_fields=['is_verified'])
+    await alog_activity(user=user, activity_type='email_verification', ip_address=get_client_ip(request))
+
+    return JsonResponse({'message': 'Email verified successfully'})
+
+
+@async_api_view(authenticate=True, require_user=True)
+async def verify_2fa(request):
+    """
+    Async counterpart of UserViewSet.verify_2fa
+    """
+    user = request.user
+    serializer = TOTPVerifySerializer(data=request.data, context={'request': request})
+    serializer.is_valid(raise_exception=True)
+
+    device = await TOTPDevice.objects.filter(user=user, confirmed=False).afirst()
+    if not device:
+        return JsonResponse({
+            'error': '2FA setup not started or already confirmed'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    if not await sync_to_async(confirm_totp_device)(device, serializer.validated_data['token']):
+        return JsonResponse({'error': 'Invalid token'}, status=status.HTTP_400_BAD_REQUEST)
+
+    user.two_factor_enabled = True
+    await user.asave(update_fields=['two_factor_enabled'])
+    await ainvalidate_two_factor_state(user)
+    await alog_activity(user=user, activity_type='2fa_enabled', ip_address=get_client_ip(request))
+
+    return JsonResponse({'message': 'Two-factor authentication enabled successfully'})
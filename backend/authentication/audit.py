@@ -0,0 +1,233 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .models import LoginAttempt, UserActivity
+
+logger = logging.getLogger(__name__)
+
+# Activity types that are always written before the request returns
+SENSITIVE_ACTIVITY_TYPES = frozenset({
+    'password_change',
+    'password_reset',
+    'account_deletion',
+    '2fa_enabled',
+    '2fa_disabled',
+})
+
+_STOP = object()
+
+
+class AuditLogWriter:
+    """
+    Buffered sink for UserActivity and LoginAttempt rows
+
+    Rows are put on a bounded queue and written by a background thread with
+    ``bulk_create`` once ``batch_size`` rows are pending or ``flush_interval``
+    seconds have passed. When the queue is full the row is written inline
+    instead of being dropped, and sensitive rows always bypass the queue.
+    Pending rows are flushed on interpreter shutdown.
+    """
+    def __init__(self, enabled=True, batch_size=100, flush_interval=1.0,
+                 max_queue_size=10000, enqueue_timeout=0.05):
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            enabled=settings.AUDIT_LOG_ASYNC,
+            batch_size=settings.AUDIT_LOG_BATCH_SIZE,
+            flush_interval=settings.AUDIT_LOG_FLUSH_INTERVAL,
+            max_queue_size=settings.AUDIT_LOG_MAX_QUEUE_SIZE,
+        )
+
+    def write(self, instance, sensitive=False):
+        """
+        Persist an unsaved audit row, buffering it unless it is sensitive
+        """
+        if not self.enabled or sensitive:
+            instance.save()
+            return
+
+        self._ensure_worker()
+        try:
+            self.queue.put(instance, timeout=self.enqueue_timeout)
+        except queue.Full:
+            # Backpressure: pay for the insert inline rather than lose the row
+            logger.warning('Audit log queue is full, writing %s inline', type(instance).__name__)
+            instance.save()
+
+    async def awrite(self, instance, sensitive=False):
+        """
+        Async variant of ``write``; only inline inserts leave the event loop
+        """
+        if self.enabled and not sensitive:
+            self._ensure_worker()
+            try:
+                self.queue.put_nowait(instance)
+                return
+            except queue.Full:
+                logger.warning('Audit log queue is full, writing %s inline', type(instance).__name__)
+        await instance.asave()
+
+    def flush(self):
+        """
+        Write every row currently queued from the calling thread
+        """
+        items = []
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                items.append(item)
+        self._write_batch(items)
+
+    def shutdown(self, timeout=5.0):
+        """
+        Stop the worker thread and flush whatever it left behind
+        """
+        thread = self._thread
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            self.queue.put(_STOP)
+            thread.join(timeout)
+        self._thread = None
+        self.flush()
+
+    def _ensure_worker(self):
+        # Threads do not survive a fork, so each gunicorn worker starts its own
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name='audit-log-writer', daemon=True
+            )
+            self._thread.start()
+            atexit.register(self.shutdown)
+
+    def _run(self):
+        while True:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            stopping = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._write_batch(batch)
+            if stopping:
+                close_old_connections()
+                return
+
+    def _write_batch(self, items):
+        if not items:
+            return
+
+        by_model = defaultdict(list)
+        for item in items:
+            by_model[type(item)].append(item)
+
+        try:
+            for model, objs in by_model.items():
+                model.objects.bulk_create(objs, batch_size=self.batch_size)
+        except Exception:
+            logger.exception('Failed to write %d audit log rows', len(items))
+        finally:
+            if threading.current_thread() is self._thread:
+                close_old_connections()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_audit_writer():
+    """
+    Return the process-wide audit log writer
+    """
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = AuditLogWriter.from_settings()
+    return _writer
+
+
+def _activity(user, activity_type, ip_address, additional_info, sensitive):
+    if sensitive is None:
+        sensitive = activity_type in SENSITIVE_ACTIVITY_TYPES
+    instance = UserActivity(
+        user=user,
+        activity_type=activity_type,
+        ip_address=ip_address,
+        additional_info=additional_info,
+    )
+    return instance, sensitive
+
+
+def log_activity(user, activity_type, ip_address, additional_info=None, sensitive=None):
+    """
+    Record a UserActivity row through the audit log writer
+
+    Args:
+        user: The user the activity belongs to
+        activity_type: One of UserActivity.ACTIVITY_TYPES
+        ip_address: The client IP address
+        additional_info: Optional JSON-serialisable details
+        sensitive: Write before returning; defaults to SENSITIVE_ACTIVITY_TYPES
+    """
+    get_audit_writer().write(*_activity(user, activity_type, ip_address, additional_info, sensitive))
+
+
+async def alog_activity(user, activity_type, ip_address, additional_info=None, sensitive=None):
+    """
+    Async variant of log_activity
+    """
+    await get_audit_writer().awrite(*_activity(user, activity_type, ip_address, additional_info, sensitive))
+
+
+def log_login_attempt(user, ip_address, successful, sensitive=False):
+    """
+    Record a LoginAttempt row through the audit log writer
+    """
+    get_audit_writer().write(
+        LoginAttempt(user=user, ip_address=ip_address, successful=successful),
+        sensitive=sensitive,
+    )
+
+
+async def alog_login_attempt(user, ip_address, successful, sensitive=False):
+    """
+    Async variant of log_login_attempt
+    """
+    await get_audit_writer().awrite(
+        LoginAttempt(user=user, ip_address=ip_address, successful=successful),
+        sensitive=sensitive,
+    )
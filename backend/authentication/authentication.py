@@ -0,0 +1,88 @@
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .revocation import ais_token_revoked, is_token_revoked
+from .sessions import is_current_generation
+from .signing import aprepare_token_backend
+from .user_cache import aget_cached_user, build_user_from_claims, get_cached_user
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that avoids re-validating tokens and re-loading users
+
+    When TwoFactorMiddleware has already validated the bearer token and
+    loaded its user for this request, that result is returned as is.
+    Otherwise users are served from the shared user cache, or, with
+    JWT_USER_FROM_CLAIMS, built from the token claims without a query.
+    In that mode deactivation and ending a user's sessions only take
+    effect once the access token expires. Tokens in the revocation store
+    and tokens from an older token generation of the user are rejected.
+    ``aauthenticate`` does the same from async code.
+    """
+    def authenticate(self, request):
+        # DRF passes its Request wrapper, the middleware a plain HttpRequest
+        http_request = getattr(request, '_request', request)
+        cached = getattr(http_request, '_cached_jwt_auth', None)
+        if cached is not None:
+            return cached
+        return super().authenticate(request)
+
+    async def aauthenticate(self, request):
+        http_request = getattr(request, '_request', request)
+        cached = getattr(http_request, '_cached_jwt_auth', None)
+        if cached is not None:
+            return cached
+
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        # Signature and claim checks are CPU only once the key ring is loaded
+        await aprepare_token_backend(raw_token)
+        validated_token = super().get_validated_token(raw_token)
+        if await ais_token_revoked(validated_token):
+            raise InvalidToken(_("Token is blacklisted"))
+        return await self.aget_user(validated_token), validated_token
+
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+        if is_token_revoked(validated_token):
+            raise InvalidToken(_("Token is blacklisted"))
+        return validated_token
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+    def check_user(self, user, validated_token):
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if not is_current_generation(validated_token, user):
+            raise AuthenticationFailed(_("Session has ended"), code="session_ended")
+
+        return user
+
+    def get_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        if settings.JWT_USER_FROM_CLAIMS:
+            return build_user_from_claims(user_id, validated_token)
+        return self.check_user(get_cached_user(user_id), validated_token)
+
+    async def aget_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        if settings.JWT_USER_FROM_CLAIMS:
+            return build_user_from_claims(user_id, validated_token)
+        return self.check_user(await aget_cached_user(user_id), validated_token)
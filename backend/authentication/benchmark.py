@@ -0,0 +1,212 @@
+import json
+import statistics
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.throttling import SimpleRateThrottle
+
+from .models import TOTPDevice
+from .serializers_jwt import CustomTokenObtainPairSerializer
+from .totp import create_totp_device, get_totp_token, invalidate_two_factor_state
+
+BENCHMARK_PASSWORD = 'Bench@12345'
+
+# Rates high enough never to reject, so the limiter still runs on every request
+UNLIMITED_RATE = '1000000/second'
+
+
+class BenchmarkFixtures:
+    """
+    Users, devices and tokens the benchmark scenarios run against
+    """
+    def __init__(self, extra_users=50):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username='bench',
+            email='bench@example.com',
+            password=BENCHMARK_PASSWORD,
+            is_verified=True,
+        )
+        self.admin = User.objects.create_superuser(
+            username='bench_admin',
+            email='bench_admin@example.com',
+            password=BENCHMARK_PASSWORD,
+            is_verified=True,
+        )
+        User.objects.bulk_create([
+            User(username=f'bench_{i}', email=f'bench_{i}@example.com', is_verified=True)
+            for i in range(extra_users)
+        ])
+        self.device = create_totp_device(self.user)
+
+        self.access = str(CustomTokenObtainPairSerializer.get_token(self.user).access_token)
+        self.admin_access = str(CustomTokenObtainPairSerializer.get_token(self.admin).access_token)
+
+    def new_refresh(self):
+        """
+        A refresh token that has not been rotated yet
+        """
+        return str(CustomTokenObtainPairSerializer.get_token(self.user))
+
+    def reset_two_factor(self):
+        """
+        Put the benchmark user back into the middle of 2FA setup
+        """
+        TOTPDevice.objects.filter(pk=self.device.pk).update(
+            confirmed=False,
+            last_verified_interval=None,
+        )
+        get_user_model().objects.filter(pk=self.user.pk).update(two_factor_enabled=False)
+        invalidate_two_factor_state(self.user)
+
+
+class Scenario:
+    """
+    A single endpoint driven by the benchmark
+
+    ``build`` returns the keyword arguments for the client call and runs
+    before the timer starts, so per-request setup is not measured.
+    """
+    def __init__(self, name, method, path, build, expected_status=200):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.build = build
+        self.expected_status = expected_status
+
+    def request(self, client, fixtures):
+        return getattr(client, self.method)(self.path, **self.build(fixtures))
+
+
+def json_body(data, access=None):
+    kwargs = {'data': json.dumps(data), 'content_type': 'application/json'}
+    if access:
+        kwargs['HTTP_AUTHORIZATION'] = f'Bearer {access}'
+    return kwargs
+
+
+def build_verify_2fa(fixtures):
+    fixtures.reset_two_factor()
+    return json_body({'token': '%06d' % get_totp_token(fixtures.device.key)}, fixtures.access)
+
+
+SCENARIOS = [
+    Scenario('token', 'post', '/api/auth/token/', lambda f: json_body({
+        'username': 'bench',
+        'password': BENCHMARK_PASSWORD,
+    })),
+    Scenario('token_refresh', 'post', '/api/auth/token/refresh/', lambda f: json_body({
+        'refresh': f.new_refresh(),
+    })),
+    Scenario('verify_2fa', 'post', '/api/auth/verify-2fa/', build_verify_2fa),
+    Scenario('reset_password_request', 'post', '/api/auth/reset-password-request/', lambda f: json_body({
+        'email': 'bench@example.com',
+    })),
+    Scenario('users_list', 'get', '/api/auth/users/', lambda f: {
+        'HTTP_AUTHORIZATION': f'Bearer {f.admin_access}',
+    }),
+]
+
+
+def percentile(samples, pct):
+    """
+    Nearest-rank percentile of a sorted list
+    """
+    index = max(0, min(len(samples) - 1, int(round(pct / 100 * len(samples))) - 1))
+    return samples[index]
+
+
+def run_scenario(scenario, fixtures, iterations, warmup=5):
+    """
+    Drive one scenario and summarise its latency and query counts
+
+    Returns:
+        A dict with throughput (requests/s), p50/p95/p99 latency (ms),
+        mean and max queries per request and the number of requests that
+        returned an unexpected status
+    """
+    client = Client()
+    for _ in range(warmup):
+        scenario.request(client, fixtures)
+
+    latencies = []
+    queries = []
+    errors = 0
+    for _ in range(iterations):
+        kwargs = scenario.build(fixtures)
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = getattr(client, scenario.method)(scenario.path, **kwargs)
+            latencies.append(time.perf_counter() - start)
+        queries.append(len(captured))
+        if response.status_code != scenario.expected_status:
+            errors += 1
+
+    latencies.sort()
+    return {
+        'iterations': iterations,
+        'throughput': round(iterations / sum(latencies), 2),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'queries_per_request': round(statistics.mean(queries), 2),
+        'max_queries': max(queries),
+        'errors': errors,
+    }
+
+
+def run_benchmarks(iterations=100, names=None, warmup=5):
+    """
+    Run the benchmark scenarios against the current database
+
+    Rate limits are raised so repeated requests are not rejected. The
+    database should be a throwaway one, since fixtures are created in it.
+
+    Args:
+        iterations: Timed requests per scenario
+        names: Only run the scenarios with these names
+        warmup: Untimed requests per scenario before measuring
+
+    Returns:
+        A dict of scenario name to result
+    """
+    rates = {scope: UNLIMITED_RATE for scope in SimpleRateThrottle.THROTTLE_RATES}
+    with mock.patch.dict(SimpleRateThrottle.THROTTLE_RATES, rates):
+        fixtures = BenchmarkFixtures()
+        return {
+            scenario.name: run_scenario(scenario, fixtures, iterations, warmup)
+            for scenario in SCENARIOS
+            if not names or scenario.name in names
+        }
+
+
+def compare_results(baseline, current, max_latency_ratio=1.5):
+    """
+    Compare benchmark results with a baseline
+
+    Any increase in queries per request is a regression; latency is a
+    regression when p95 grows by more than ``max_latency_ratio``.
+
+    Returns:
+        A list of human readable regressions, empty if there are none
+    """
+    regressions = []
+    for name, result in current.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result['max_queries'] > base['max_queries']:
+            regressions.append(
+                f"{name}: {result['max_queries']} queries per request, baseline {base['max_queries']}"
+            )
+        if result['p95_ms'] > base['p95_ms'] * max_latency_ratio:
+            regressions.append(
+                f"{name}: p95 {result['p95_ms']:.1f} ms, baseline {base['p95_ms']:.1f} ms"
+            )
+        if result['errors'] and not base['errors']:
+            regressions.append(f"{name}: {result['errors']} requests failed")
+    return regressions
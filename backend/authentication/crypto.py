@@ -0,0 +1,46 @@
+import base64
+import functools
+import hashlib
+
+from django.conf import settings
+
+
+@functools.lru_cache(maxsize=4)
+def _fernet(secret):
+    from cryptography.fernet import Fernet
+
+    digest = hashlib.sha256(f'authentication.crypto:{secret}'.encode()).digest()
+    return Fernet(base64.urlsafe_b64encode(digest))
+
+
+def get_encryption_secret():
+    """
+    Secret the stored secrets are encrypted with, FIELD_ENCRYPTION_KEY or
+    failing that SECRET_KEY
+    """
+    return settings.FIELD_ENCRYPTION_KEY or settings.SECRET_KEY
+
+
+def derive_password(purpose):
+    """
+    Password derived from the encryption secret for one purpose, e.g. to
+    encrypt a PEM private key
+    """
+    return hashlib.sha256(f'{purpose}:{get_encryption_secret()}'.encode()).hexdigest().encode()
+
+
+def encrypt_text(text):
+    """
+    Encrypt a string for storage
+    """
+    return _fernet(get_encryption_secret()).encrypt(text.encode()).decode()
+
+
+def decrypt_text(token):
+    """
+    Decrypt a string stored by encrypt_text
+
+    Raises:
+        cryptography.fernet.InvalidToken: if it was encrypted with another key
+    """
+    return _fernet(get_encryption_secret()).decrypt(token.encode()).decode()
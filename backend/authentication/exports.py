@@ -0,0 +1,152 @@
+import csv
+import json
+import uuid
+
+from django.db.models import Q
+
+from .models import LoginAttempt, UserActivity
+
+# Exportable audit logs and the columns written for each
+EXPORTS = {
+    'activity': (UserActivity, ('id', 'user_id', 'activity_type', 'ip_address', 'timestamp', 'additional_info')),
+    'login-attempts': (LoginAttempt, ('id', 'user_id', 'ip_address', 'successful', 'timestamp')),
+}
+
+FORMATS = ('ndjson', 'csv')
+
+
+def get_export_queryset(kind, user=None, activity_type=None, since=None, until=None):
+    """
+    Filtered, unordered queryset for an audit log export
+
+    Args:
+        kind: A key of EXPORTS
+        user: Only rows for this user id
+        activity_type: Only activities of this type (activity exports only)
+        since: Only rows at or after this time
+        until: Only rows before this time
+    """
+    model, _ = EXPORTS[kind]
+    queryset = model.objects.order_by()
+    if user is not None:
+        queryset = queryset.filter(user_id=user)
+    if activity_type is not None and model is UserActivity:
+        queryset = queryset.filter(activity_type=activity_type)
+    if since is not None:
+        queryset = queryset.filter(timestamp__gte=since)
+    if until is not None:
+        queryset = queryset.filter(timestamp__lt=until)
+    return queryset
+
+
+def iter_rows(kind, batch_size=2000, **filters):
+    """
+    Yield every matching row as a tuple of the export columns
+
+    Rows are read in (timestamp, id) order one keyset page at a time, so
+    each query starts from an index seek instead of an OFFSET scan and
+    memory use does not grow with the size of the export.
+    """
+    _, fields = EXPORTS[kind]
+    queryset = get_export_queryset(kind, **filters)
+    ts_index = fields.index('timestamp')
+    id_index = fields.index('id')
+    last = None
+
+    while True:
+        page = queryset
+        if last is not None:
+            page = page.filter(
+                Q(timestamp__gt=last[ts_index]) | Q(timestamp=last[ts_index], id__gt=last[id_index])
+            )
+        page = page.order_by('timestamp', 'id').values_list(*fields)[:batch_size]
+
+        count = 0
+        for row in page.iterator(chunk_size=batch_size):
+            count += 1
+            last = row
+            yield row
+        if count < batch_size:
+            return
+
+
+def _serialize(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def ndjson_lines(rows, fields):
+    """
+    Render rows as newline-delimited JSON objects
+    """
+    for row in rows:
+        yield json.dumps(dict(zip(fields, map(_serialize, row)))) + '\n'
+
+
+class _Echo:
+    """
+    File-like object whose write returns the line instead of storing it
+    """
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows, fields):
+    """
+    Render rows as CSV with a header line
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([
+            json.dumps(value) if isinstance(value, (dict, list)) else _serialize(value)
+            for value in row
+        ])
+
+
+def render_lines(rows, fields, output_format):
+    """
+    Render rows as lines of NDJSON or CSV
+    """
+    if output_format == 'csv':
+        return csv_lines(rows, fields)
+    return ndjson_lines(rows, fields)
+
+
+def write_parquet(rows, fields, path, batch_size=2000):
+    """
+    Write rows to a Parquet file, one row group per batch
+
+    Requires pyarrow, which is not installed by default.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {
+        'id': pa.int64(),
+        'successful': pa.bool_(),
+        'timestamp': pa.timestamp('us', tz='UTC'),
+    }
+    schema = pa.schema([(name, types.get(name, pa.string())) for name in fields])
+
+    def to_column(values, name):
+        if name in types:
+            return values
+        return [json.dumps(v) if isinstance(v, (dict, list)) else _serialize(v) for v in values]
+
+    def write(writer, batch):
+        columns = [to_column(column, name) for column, name in zip(zip(*batch), fields)]
+        writer.write_batch(pa.record_batch(columns, schema=schema))
+
+    with pq.ParquetWriter(path, schema) as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                write(writer, batch)
+                batch = []
+        if batch:
+            write(writer, batch)
@@ -0,0 +1,147 @@
+import base64
+import hashlib
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher,
+    PBKDF2PasswordHasher,
+    ScryptPasswordHasher,
+)
+
+# PASSWORD_HASHER profiles that calibrate() can tune
+PROFILES = ('scrypt', 'argon2', 'pbkdf2')
+
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2 with the iteration count from PASSWORD_PBKDF2_ITERATIONS
+    """
+    @property
+    def iterations(self):
+        return settings.PASSWORD_PBKDF2_ITERATIONS
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    """
+    scrypt with N, r and p from the PASSWORD_SCRYPT_* settings
+
+    Hashes made with other parameters still verify, since the parameters
+    are stored in the hash, and are upgraded on the next login.
+    """
+    @property
+    def work_factor(self):
+        return settings.PASSWORD_SCRYPT_WORK_FACTOR
+
+    @property
+    def block_size(self):
+        return settings.PASSWORD_SCRYPT_BLOCK_SIZE
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_SCRYPT_PARALLELISM
+
+    def encode(self, password, salt, n=None, r=None, p=None):
+        self._check_encode_args(password, salt)
+        n = n or self.work_factor
+        r = r or self.block_size
+        p = p or self.parallelism
+        # OpenSSL refuses more than 32MiB unless told otherwise; allow what
+        # the parameters need (128 * N * r for V, 128 * r * p for B) plus slack
+        maxmem = 128 * r * (n + p) + 2 * 1024 * 1024
+        hash_ = hashlib.scrypt(
+            password.encode(), salt=salt.encode(), n=n, r=r, p=p, maxmem=maxmem, dklen=64,
+        )
+        hash_ = base64.b64encode(hash_).decode('ascii').strip()
+        return '%s$%d$%s$%d$%d$%s' % (self.algorithm, n, salt, r, p, hash_)
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """
+    Argon2id with costs from the PASSWORD_ARGON2_* settings
+
+    Requires argon2-cffi.
+    """
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_ARGON2_PARALLELISM
+
+
+def _time_hash(hasher, samples=3):
+    """
+    Best-of-``samples`` wall time for one hash, in seconds
+    """
+    salt = hasher.salt()
+    best = None
+    for _ in range(samples):
+        started = time.perf_counter()
+        hasher.encode('calibration-password', salt)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def calibrate(profile, target, max_memory=64 * 1024 * 1024, samples=3):
+    """
+    Pick hasher parameters that take about ``target`` seconds on this host
+
+    The memory-hard profiles grow their cost in powers of two (scrypt's N)
+    or single passes (Argon2's time cost, with memory fixed at
+    ``max_memory``) until one hash reaches the target; PBKDF2 scales its
+    iteration count linearly from a measured run.
+
+    Returns:
+        A tuple of ({setting name: value}, seconds per hash)
+    """
+    if profile == 'pbkdf2':
+        hasher = PBKDF2PasswordHasher()
+        probe = 100000
+        hasher.iterations = probe
+        elapsed = _time_hash(hasher, samples)
+        hasher.iterations = max(probe, int(probe * target / elapsed) // 1000 * 1000)
+        return {'PASSWORD_PBKDF2_ITERATIONS': hasher.iterations}, _time_hash(hasher, samples)
+
+    if profile == 'scrypt':
+        hasher = ScryptPasswordHasher()
+        hasher.block_size, hasher.parallelism = 8, 1
+        chosen = None
+        n = 2 ** 12
+        while 128 * hasher.block_size * n <= max_memory:
+            hasher.work_factor = n
+            hasher.maxmem = 128 * hasher.block_size * (n + 1) + 2 * 1024 * 1024
+            elapsed = _time_hash(hasher, samples)
+            chosen = (n, elapsed)
+            if elapsed >= target:
+                break
+            n *= 2
+        n, elapsed = chosen
+        return {
+            'PASSWORD_SCRYPT_WORK_FACTOR': n,
+            'PASSWORD_SCRYPT_BLOCK_SIZE': hasher.block_size,
+            'PASSWORD_SCRYPT_PARALLELISM': hasher.parallelism,
+        }, elapsed
+
+    if profile == 'argon2':
+        hasher = Argon2PasswordHasher()
+        hasher.memory_cost = max_memory // 1024
+        hasher.parallelism = 1
+        hasher.time_cost = 1
+        elapsed = _time_hash(hasher, samples)
+        while elapsed < target and hasher.time_cost < 20:
+            hasher.time_cost += 1
+            elapsed = _time_hash(hasher, samples)
+        return {
+            'PASSWORD_ARGON2_TIME_COST': hasher.time_cost,
+            'PASSWORD_ARGON2_MEMORY_COST': hasher.memory_cost,
+            'PASSWORD_ARGON2_PARALLELISM': hasher.parallelism,
+        }, elapsed
+
+    raise ValueError(f'Unknown profile {profile!r}, use one of: {", ".join(PROFILES)}')
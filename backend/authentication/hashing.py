@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, get_hasher, identify_hasher, make_password
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .instrumentation import get_request_metrics
+from .metrics import PASSWORD_HASH_QUEUE_SECONDS, PASSWORD_HASH_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class PasswordHashingBusy(APIException):
+    """
+    Raised when no hashing slot frees up within PASSWORD_HASHING_TIMEOUT
+    """
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many password operations in progress, please try again shortly.'
+    default_code = 'password_hashing_busy'
+
+
+def _timed_call(func, args):
+    """
+    Run a hashing function in a pool process and report when it ran
+    """
+    started = time.time()
+    result = func(*args)
+    return result, started, time.time()
+
+
+class PasswordHasherPool:
+    """
+    Runs password hashing in a bounded process pool
+
+    CPU-bound PBKDF2/scrypt/Argon2 runs move off the request thread, so a
+    worker's other threads keep serving I/O-bound requests during a login
+    burst. At most ``max_pending`` operations per web worker are queued or
+    running; callers get PasswordHashingBusy when their operation has not
+    finished ``timeout`` seconds after they asked for a slot. With
+    ``processes=0`` hashing runs inline.
+
+    The pool is created lazily per process id so forked web workers do
+    not share the parent's executor, and its processes are started with
+    forkserver so they never inherit a threaded worker's locks.
+    """
+    def __init__(self, processes=1, max_pending=8, timeout=10.0):
+        self.processes = processes
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._semaphore = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            processes=settings.PASSWORD_HASHING_PROCESSES,
+            max_pending=settings.PASSWORD_HASHING_MAX_PENDING,
+            timeout=settings.PASSWORD_HASHING_TIMEOUT,
+        )
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                context = multiprocessing.get_context(
+                    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                )
+                self._executor = ProcessPoolExecutor(max_workers=self.processes, mp_context=context)
+                self._pid = os.getpid()
+            return self._executor
+
+    def run(self, func, *args):
+        """
+        Run ``func(*args)`` in the pool and return its result
+
+        Queue time (waiting for a slot and for a free process) and hashing
+        time are reported to the metrics exporter and the current request.
+        """
+        submitted = time.time()
+        deadline = time.monotonic() + self.timeout
+        self._acquire(deadline)
+        try:
+            if self.processes:
+                future = self._get_executor().submit(_timed_call, func, args)
+                result, started, finished = self._result(future, deadline)
+            else:
+                result, started, finished = _timed_call(func, args)
+        finally:
+            self._semaphore.release()
+
+        queue_time = max(0.0, started - submitted)
+        hash_time = finished - started
+        PASSWORD_HASH_QUEUE_SECONDS.observe(queue_time)
+        PASSWORD_HASH_SECONDS.observe(hash_time)
+        metrics = get_request_metrics()
+        if metrics is not None:
+            metrics.hash_queue_time += queue_time
+            metrics.hash_time += hash_time
+        return result
+
+    def _acquire(self, deadline):
+        if not self._semaphore.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            logger.warning('Password hashing pool saturated for %.1fs', self.timeout)
+            raise PasswordHashingBusy()
+
+    def _result(self, future, deadline):
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            future.cancel()
+            logger.warning('Password hashing did not finish within %.1fs', self.timeout)
+            raise PasswordHashingBusy()
+
+    def map(self, func, iterable):
+        """
+        Run ``func`` over an iterable, keeping every pool process busy
+
+        Items are submitted one round of ``processes`` at a time, each round
+        under a single slot with its own timeout, so interactive logins
+        queue behind at most one round of a bulk job.
+        """
+        items = list(iterable)
+        if not self.processes:
+            return [self.run(func, item) for item in items]
+        results = []
+        for offset in range(0, len(items), self.processes):
+            deadline = time.monotonic() + self.timeout
+            self._acquire(deadline)
+            try:
+                executor = self._get_executor()
+                futures = [executor.submit(func, item) for item in items[offset:offset + self.processes]]
+                results.extend(self._result(future, deadline) for future in futures)
+            finally:
+                self._semaphore.release()
+        return results
+
+    async def arun(self, func, *args):
+        """
+        Async variant of ``run`` that does not block the event loop
+
+        The call waits on a plain thread, outside Django's connection
+        handling, so ``func`` must not use the ORM.
+        """
+        return await asyncio.to_thread(self.run, func, *args)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown()
+            self._executor = None
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_hasher_pool():
+    """
+    Return the process-wide password hashing pool
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PasswordHasherPool.from_settings()
+    return _pool
+
+
+def hash_password(raw_password):
+    """
+    Hash a password in the pool, like make_password
+    """
+    return get_hasher_pool().run(make_password, raw_password)
+
+
+def verify_password(raw_password, encoded):
+    """
+    Check a password against an encoded hash in the pool
+    """
+    return get_hasher_pool().run(check_password, raw_password, encoded)
+
+
+def _needs_rehash(encoded):
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return False
+    preferred = get_hasher('default')
+    return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+def check_user_password(user, raw_password):
+    """
+    Pool-backed equivalent of ``user.check_password``
+
+    As with Django's version, a correct password stored with an outdated
+    hasher or parameters is rehashed and saved.
+    """
+    if raw_password is None or not user.has_usable_password():
+        return False
+    if not verify_password(raw_password, user.password):
+        return False
+    if _needs_rehash(user.password):
+        set_user_password(user, raw_password)
+        user.save(update_fields=['password'])
+    return True
+
+
+def set_user_password(user, raw_password):
+    """
+    Pool-backed equivalent of ``user.set_password``; the caller saves
+    """
+    user.password = hash_password(raw_password)
+    user._password = raw_password
+
+
+async def acheck_user_password(user, raw_password):
+    """
+    Async variant of check_user_password
+
+    The hash runs through the pool off the event loop; the rehash is saved
+    with ``asave`` so its query runs where Django manages the connection.
+    """
+    if raw_password is None or not user.has_usable_password():
+        return False
+    if not await get_hasher_pool().arun(check_password, raw_password, user.password):
+        return False
+    if _needs_rehash(user.password):
+        user.password = await ahash_password(raw_password)
+        user._password = raw_password
+        await user.asave(update_fields=['password'])
+    return True
+
+
+async def ahash_password(raw_password):
+    return await get_hasher_pool().arun(make_password, raw_password)
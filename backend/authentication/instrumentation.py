@@ -0,0 +1,299 @@
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from rest_framework.fields import empty
+
+from .metrics import observe_request
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+# Histogram bucket upper bounds
+DURATION_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+
+class QueryBudgetExceeded(Exception):
+    """
+    Raised in strict mode when a view issues more queries than its budget,
+    or repeats the same statement often enough to look like an N+1 pattern
+    """
+
+
+class RequestMetrics:
+    """
+    Counters collected while a single request is handled
+
+    Instances are installed as a database execute wrapper, so every query
+    on every connection is counted and timed.
+    """
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.hash_time = 0.0
+        self.hash_queue_time = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+            self.statements[sql] += 1
+
+    def repeated_statements(self, threshold):
+        """
+        Statements executed at least ``threshold`` times in this request
+        """
+        return [(sql, count) for sql, count in self.statements.items() if count >= threshold]
+
+
+def get_request_metrics():
+    """
+    Return the metrics of the request being handled, or None
+    """
+    return _current.get()
+
+
+def record_cache_lookup(hit):
+    """
+    Count a cache hit or miss against the current request
+    """
+    metrics = _current.get()
+    if metrics is not None:
+        if hit:
+            metrics.cache_hits += 1
+        else:
+            metrics.cache_misses += 1
+
+
+@contextmanager
+def timed_serialization():
+    """
+    Add the time spent in the block to the current request's serializer time
+
+    Nested serializers are only counted once, by the outermost one.
+    """
+    metrics = _current.get()
+    if metrics is None or metrics.serializer_depth:
+        yield
+        return
+    metrics.serializer_depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer_time += time.perf_counter() - start
+        metrics.serializer_depth -= 1
+
+
+class TimedSerializerMixin:
+    """
+    Serializer mixin that reports validation and representation time to
+    RequestMetricsMiddleware
+    """
+    def run_validation(self, data=empty):
+        with timed_serialization():
+            return super().run_validation(data)
+
+    def to_representation(self, instance):
+        with timed_serialization():
+            return super().to_representation(instance)
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram
+    """
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        """
+        Cumulative counts per upper bound, Prometheus style
+        """
+        cumulative = []
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            cumulative.append((bound, total))
+        return {'buckets': cumulative, 'sum': self.sum, 'count': self.count}
+
+
+class ViewStats:
+    """
+    Per-view histograms of request duration, query count and DB time,
+    aggregated in this process
+    """
+    def __init__(self):
+        self._views = {}
+        self._lock = threading.Lock()
+
+    def observe(self, view, duration_ms, metrics):
+        with self._lock:
+            histograms = self._views.get(view)
+            if histograms is None:
+                histograms = self._views[view] = {
+                    'duration_ms': Histogram(DURATION_BUCKETS_MS),
+                    'db_ms': Histogram(DURATION_BUCKETS_MS),
+                    'queries': Histogram(QUERY_BUCKETS),
+                }
+            histograms['duration_ms'].observe(duration_ms)
+            histograms['db_ms'].observe(metrics.db_time * 1000)
+            histograms['queries'].observe(metrics.queries)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                view: {name: histogram.snapshot() for name, histogram in histograms.items()}
+                for view, histograms in self._views.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+view_stats = ViewStats()
+
+
+def get_query_budget(request):
+    """
+    Return the query budget declared by the view handling a request
+
+    Views declare ``query_budget`` as an int, or, on viewsets, as a dict
+    keyed by action name. Returns None when there is no budget.
+    """
+    match = getattr(request, 'resolver_match', None)
+    view_class = getattr(match.func, 'cls', None) if match else None
+    budget = getattr(view_class, 'query_budget', None)
+    if isinstance(budget, dict):
+        actions = getattr(match.func, 'actions', None) or {}
+        budget = budget.get(actions.get(request.method.lower()))
+    return budget
+
+
+def format_server_timing(metrics, duration_ms):
+    """
+    Render request metrics as a Server-Timing header value
+    """
+    return ', '.join([
+        f'db;dur={metrics.db_time * 1000:.2f};desc="{metrics.queries} queries"',
+        f'cache;desc="{metrics.cache_hits} hits, {metrics.cache_misses} misses"',
+        f'serializer;dur={metrics.serializer_time * 1000:.2f}',
+        f'hash;dur={metrics.hash_time * 1000:.2f}',
+        f'hash-queue;dur={metrics.hash_queue_time * 1000:.2f}',
+        f'total;dur={duration_ms:.2f}',
+    ])
+
+
+class RequestMetricsMiddleware:
+    """
+    Record query count, DB time, cache hits and misses and serializer time
+    for each request
+
+    The numbers feed per-view histograms and, with SERVER_TIMING_HEADER,
+    a Server-Timing response header. Requests over their view's query
+    budget, or repeating one statement QUERY_REPEAT_THRESHOLD times, are
+    logged, or raise QueryBudgetExceeded with QUERY_BUDGET_STRICT.
+
+    Under ASGI the query wrappers are installed from the request's sync
+    thread, which is where the ORM runs queries for async views too.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.REQUEST_METRICS_ENABLED:
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            with self.wrap_connections(metrics):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, start)
+
+    async def __acall__(self, request):
+        if not settings.REQUEST_METRICS_ENABLED:
+            return await self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            stack = await sync_to_async(self.wrap_connections)(metrics)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close)()
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, start)
+
+    def wrap_connections(self, metrics):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(metrics))
+        return stack
+
+    def finish(self, request, response, metrics, start):
+        duration_ms = (time.perf_counter() - start) * 1000
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        view_stats.observe(view, duration_ms, metrics)
+        observe_request(view, duration_ms / 1000, metrics.queries)
+        self.check_queries(request, view, metrics)
+
+        if settings.SERVER_TIMING_HEADER:
+            response['Server-Timing'] = format_server_timing(metrics, duration_ms)
+        return response
+
+    def check_queries(self, request, view, metrics):
+        problems = []
+        budget = get_query_budget(request)
+        if budget is not None and metrics.queries > budget:
+            problems.append(f'{request.method} {view} issued {metrics.queries} queries, budget is {budget}')
+        for sql, count in metrics.repeated_statements(settings.QUERY_REPEAT_THRESHOLD):
+            problems.append(f'{request.method} {view} ran the same statement {count} times: {sql}')
+
+        if not problems:
+            return
+        if settings.QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded('\n'.join(problems))
+        for problem in problems:
+            logger.warning(problem)
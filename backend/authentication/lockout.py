@@ -0,0 +1,225 @@
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.throttling import BaseThrottle
+
+from .metrics import LOGIN_ATTEMPTS
+
+
+class AccountLocked(exceptions.Throttled):
+    default_detail = _('Too many failed login attempts.')
+    default_code = 'account_locked'
+
+
+class RedisLockoutBackend:
+    """
+    Failure counters and locks held in Redis, shared by every worker
+
+    A counter expires once no failure was recorded for the attempt window
+    (plus the lock it caused), and a lock is a key that expires when the
+    lock ends, so no cleanup is needed.
+    """
+    # KEYS: counter keys, then the matching lock keys
+    # ARGV[1]: window (ms); ARGV[2]: base lock (ms); ARGV[3]: max lock (ms);
+    # ARGV[3 + i]: threshold for KEYS[i]
+    FAIL_SCRIPT = """
+    local n = #KEYS / 2
+    local longest = 0
+    for i = 1, n do
+        local count = redis.call('INCR', KEYS[i])
+        local threshold = tonumber(ARGV[3 + i])
+        local ttl = tonumber(ARGV[1])
+        if count >= threshold then
+            local lock = math.floor(math.min(tonumber(ARGV[2]) * 2 ^ (count - threshold), tonumber(ARGV[3])))
+            redis.call('SET', KEYS[n + i], 1, 'PX', lock)
+            ttl = ttl + lock
+            longest = math.max(longest, lock)
+        end
+        redis.call('PEXPIRE', KEYS[i], ttl)
+    end
+    return longest
+    """
+
+    # KEYS: lock keys
+    CHECK_SCRIPT = """
+    local longest = 0
+    for i = 1, #KEYS do
+        longest = math.max(longest, redis.call('PTTL', KEYS[i]))
+    end
+    return longest
+    """
+
+    def __init__(self):
+        self._client = None
+
+    def get_client(self):
+        if self._client is None:
+            from django_redis import get_redis_connection
+            self._client = get_redis_connection('default')
+            self._fail = self._client.register_script(self.FAIL_SCRIPT)
+            self._check = self._client.register_script(self.CHECK_SCRIPT)
+        return self._client
+
+    def locked_for(self, keys):
+        """
+        Return the seconds until none of the keys is locked, or 0
+        """
+        self.get_client()
+        return self._check(keys=[f'lockout:lock:{key}' for key in keys]) / 1000
+
+    def fail(self, thresholds, window, base, maximum):
+        """
+        Count a failure against each key and lock those over their threshold
+
+        Args:
+            thresholds: A dict of key to the failures allowed before locking
+            window: Seconds after which failures are forgotten
+            base: Length in seconds of the first lock, doubling per failure
+            maximum: Longest lock in seconds
+
+        Returns:
+            The length in seconds of the longest lock set, or 0
+        """
+        self.get_client()
+        keys = list(thresholds)
+        locked_ms = self._fail(
+            keys=[f'lockout:fail:{key}' for key in keys] + [f'lockout:lock:{key}' for key in keys],
+            args=[int(window * 1000), int(base * 1000), int(maximum * 1000)]
+                 + [thresholds[key] for key in keys],
+        )
+        return locked_ms / 1000
+
+    def clear(self, keys):
+        self.get_client().delete(*(f'lockout:{kind}:{key}' for key in keys for kind in ('fail', 'lock')))
+
+
+class LocalLockoutBackend:
+    """
+    In-process failure counters with the same semantics as the Redis backend
+
+    Counters are per process, so this is only suitable for tests and single
+    process development servers.
+    """
+    def __init__(self, timer=time.monotonic):
+        self.timer = timer
+        self._failures = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def locked_for(self, keys):
+        now = self.timer()
+        with self._lock:
+            return max([0.0] + [self._locks.get(key, now) - now for key in keys])
+
+    def fail(self, thresholds, window, base, maximum):
+        longest = 0.0
+        with self._lock:
+            now = self.timer()
+            for key, threshold in thresholds.items():
+                count, expires = self._failures.get(key, (0, now))
+                count = count + 1 if expires > now else 1
+                ttl = window
+                if count >= threshold:
+                    lock = min(base * 2 ** (count - threshold), maximum)
+                    self._locks[key] = now + lock
+                    ttl += lock
+                    longest = max(longest, lock)
+                self._failures[key] = (count, now + ttl)
+            if len(self._failures) > 10000:
+                # Drop counters and locks that have run out
+                self._failures = {k: v for k, v in self._failures.items() if v[1] > now}
+                self._locks = {k: v for k, v in self._locks.items() if v > now}
+        return longest
+
+    def clear(self, keys):
+        with self._lock:
+            for key in keys:
+                self._failures.pop(key, None)
+                self._locks.pop(key, None)
+
+    def reset(self):
+        with self._lock:
+            self._failures.clear()
+            self._locks.clear()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_lockout_backend():
+    """
+    Return the process-wide lockout backend configured by LOCKOUT_BACKEND
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = import_string(settings.LOCKOUT_BACKEND)()
+    return _backend
+
+
+def _account_key(credentials, user=None):
+    # Username and email logins of one account share its counter
+    if user is not None:
+        return f'account:{user.pk}'
+    field, value = next(iter(credentials.items()))
+    return f'account:{field}:{str(value).strip().lower()}'
+
+
+def _thresholds(credentials, request, user=None):
+    thresholds = {_account_key(credentials, user): settings.LOCKOUT_ACCOUNT_THRESHOLD}
+    # The address the throttles use, which only trusts NUM_PROXIES
+    # X-Forwarded-For entries
+    ip = BaseThrottle().get_ident(request) if request is not None else None
+    if ip:
+        thresholds[f'ip:{ip}'] = settings.LOCKOUT_IP_THRESHOLD
+    return thresholds
+
+
+def check_lockout(credentials, request, user=None):
+    """
+    Refuse a login for a locked account or address before any password
+    is checked
+
+    Existing accounts are keyed on their id, and unknown identifiers on
+    the identifier as given, so a lock does not reveal which accounts
+    exist.
+
+    Raises:
+        AccountLocked: with the seconds until the lock ends
+    """
+    wait = get_lockout_backend().locked_for(list(_thresholds(credentials, request, user)))
+    if wait > 0:
+        LOGIN_ATTEMPTS.labels(outcome='locked').inc()
+        raise AccountLocked(wait)
+
+
+def register_failure(credentials, request, user=None):
+    """
+    Count a failed login against the account and the client address
+
+    Once either has failed its threshold number of times within
+    LOGIN_ATTEMPT_WINDOW_MINUTES it is locked for LOCKOUT_BASE_SECONDS,
+    doubling with every further failure up to LOCKOUT_MAX_SECONDS.
+    """
+    return get_lockout_backend().fail(
+        _thresholds(credentials, request, user),
+        window=settings.LOGIN_ATTEMPT_WINDOW_MINUTES * 60,
+        base=settings.LOCKOUT_BASE_SECONDS,
+        maximum=settings.LOCKOUT_MAX_SECONDS,
+    )
+
+
+def clear_failures(credentials, user=None):
+    """
+    Forget an account's failures after a successful login
+
+    Address counters are left alone, so one known password does not reset
+    a credential stuffing run from the same address.
+    """
+    get_lockout_backend().clear([_account_key(credentials, user)])
@@ -0,0 +1,244 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .crypto import decrypt_text, encrypt_text
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_email(user, purpose, subject, body, to_email=None):
+    """
+    Queue an email for out-of-band delivery
+
+    A user has at most one pending message per purpose; queueing another one
+    replaces its content, so a resent link supersedes the previous one.
+    The body carries a raw token, so it is stored encrypted.
+
+    Args:
+        user: The recipient user
+        purpose: One of OutboundEmail.PURPOSES
+        subject: The subject line
+        body: The plain-text body
+        to_email: Recipient address, defaults to the user's email
+    """
+    fields = {
+        'to_email': to_email or user.email,
+        'subject': subject,
+        'body': encrypt_text(body),
+        'attempts': 0,
+        'next_attempt_at': timezone.now(),
+        'last_error': '',
+    }
+    pending = OutboundEmail.objects.filter(user=user, purpose=purpose, status='pending')
+    # Usually there is nothing to replace, so try the single update first
+    # instead of update_or_create's locking read
+    if not pending.update(**fields):
+        try:
+            with transaction.atomic():
+                return OutboundEmail.objects.create(user=user, purpose=purpose, **fields)
+        except IntegrityError:
+            # Another request queued the same message first; overwrite it
+            pending.update(**fields)
+    return pending.get()
+
+
+def build_verification_email(token):
+    """
+    Subject and body of the email verification message
+    """
+    verification_link = f"{settings.FRONTEND_URL}/verify-email?token={token}"
+    return 'Verify Your Email', f'Click the link to verify your email: {verification_link}'
+
+
+def queue_verification_email(user, token):
+    """
+    Queue the email verification link for a user
+    """
+    subject, body = build_verification_email(token)
+    return enqueue_email(user, 'email_verification', subject, body)
+
+
+def queue_verification_emails(users, tokens):
+    """
+    Queue verification links for many new users in one insert
+
+    The users must not have a pending verification email already.
+
+    Args:
+        users: The recipient users
+        tokens: A dict of user primary key to raw token
+    """
+    messages = []
+    for user in users:
+        subject, body = build_verification_email(tokens[user.pk])
+        messages.append(OutboundEmail(
+            user=user,
+            purpose='email_verification',
+            to_email=user.email,
+            subject=subject,
+            body=encrypt_text(body),
+        ))
+    return OutboundEmail.objects.bulk_create(messages)
+
+
+def queue_password_reset_email(user, token):
+    """
+    Queue the password reset link for a user
+    """
+    reset_url = f"{settings.FRONTEND_URL}/reset-password/?token={token}"
+    return enqueue_email(
+        user,
+        'password_reset',
+        'Password Reset Request',
+        f'Click the link to reset your password: {reset_url}',
+    )
+
+
+def read_body(message):
+    """
+    Plain-text body of a pending message
+    """
+    return decrypt_text(message.body)
+
+
+def get_retry_delay(attempts):
+    """
+    Exponential backoff delay after the given number of failed attempts
+    """
+    delay = settings.MAIL_QUEUE_RETRY_BACKOFF_SECONDS * (2 ** (attempts - 1))
+    return timedelta(seconds=min(delay, settings.MAIL_QUEUE_MAX_RETRY_DELAY_SECONDS))
+
+
+def send_queued_emails(connection=None, batch_size=None):
+    """
+    Deliver one batch of due emails over a single mail connection
+
+    Rows are claimed with ``SELECT ... FOR UPDATE SKIP LOCKED`` so several
+    workers can drain the queue concurrently. The claim only moves their
+    next attempt MAIL_QUEUE_CLAIM_SECONDS ahead and commits, so no row lock
+    is held while SMTP is slow; a worker that dies mid-batch leaves its
+    messages due again once the claim runs out. Outcomes are written in a
+    second short transaction, skipping messages that enqueue_email
+    replaced in the meantime, which stay pending with their new content.
+    Failed messages are retried with exponential backoff until
+    MAIL_QUEUE_MAX_ATTEMPTS is reached.
+
+    Args:
+        connection: An email backend instance to reuse, opened if needed
+        batch_size: Maximum number of messages to send
+
+    Returns:
+        The number of messages processed
+    """
+    batch_size = batch_size or settings.MAIL_QUEUE_BATCH_SIZE
+    owns_connection = connection is None
+    connection = connection or get_connection()
+
+    now = timezone.now()
+    claimed_until = now + timedelta(seconds=settings.MAIL_QUEUE_CLAIM_SECONDS)
+    with transaction.atomic():
+        batch = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        if not batch:
+            return 0
+        OutboundEmail.objects.filter(pk__in=[message.pk for message in batch]).update(
+            next_attempt_at=claimed_until
+        )
+    for message in batch:
+        message.next_attempt_at = claimed_until
+
+    try:
+        connection.open()
+    except Exception as e:
+        # The connection itself failed; retry the whole batch later
+        logger.warning('Mail connection failed: %s', e)
+        for message in batch:
+            mark_failed(message, e)
+    else:
+        for message in batch:
+            deliver(connection, message)
+    finally:
+        if owns_connection:
+            connection.close()
+
+    with transaction.atomic():
+        # Rows still carrying this claim; a re-queued message was reset
+        unchanged = set(
+            OutboundEmail.objects.select_for_update()
+            .filter(pk__in=[message.pk for message in batch], status='pending', next_attempt_at=claimed_until)
+            .values_list('pk', flat=True)
+        )
+        OutboundEmail.objects.bulk_update(
+            [message for message in batch if message.pk in unchanged],
+            ['body', 'status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at'],
+        )
+
+    return len(batch)
+
+
+def deliver(connection, message):
+    """
+    Send a single queued message and record the outcome on the instance
+
+    The body holds a live token link, so it is cleared once it is sent.
+    """
+    email = EmailMessage(
+        message.subject,
+        read_body(message),
+        settings.DEFAULT_FROM_EMAIL,
+        [message.to_email],
+        connection=connection,
+    )
+    try:
+        email.send(fail_silently=False)
+    except Exception as e:
+        logger.warning('Failed to send %s email to %s: %s', message.purpose, message.to_email, e)
+        mark_failed(message, e)
+        return
+
+    message.status = 'sent'
+    message.sent_at = timezone.now()
+    message.last_error = ''
+    message.body = ''
+
+
+def mark_failed(message, error):
+    """
+    Schedule a retry for a message, or give up after too many attempts
+    """
+    message.attempts += 1
+    message.last_error = str(error)
+    if message.attempts >= settings.MAIL_QUEUE_MAX_ATTEMPTS:
+        message.status = 'failed'
+        message.body = ''
+    else:
+        message.next_attempt_at = timezone.now() + get_retry_delay(message.attempts)
+
+
+def purge_finished_emails(batch_size=1000):
+    """
+    Delete sent and failed messages older than MAIL_RETENTION_DAYS in batches
+
+    Returns:
+        The number of messages deleted
+    """
+    deleted = 0
+    cutoff = timezone.now() - timedelta(days=settings.MAIL_RETENTION_DAYS)
+    while True:
+        ids = list(
+            OutboundEmail.objects.exclude(status='pending').filter(created_at__lte=cutoff)
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+        count, _ = OutboundEmail.objects.filter(id__in=ids).delete()
+        deleted += count
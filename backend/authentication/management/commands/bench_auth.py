@@ -0,0 +1,71 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from authentication.benchmark import SCENARIOS, compare_results, run_benchmarks
+
+
+class Command(BaseCommand):
+    """
+    Benchmark the auth endpoints in-process against a throwaway test database
+
+    Results can be saved as a JSON baseline and later runs compared with it,
+    failing when an endpoint issues more queries or its p95 latency grows
+    beyond the allowed ratio.
+    """
+    help = 'Benchmark the auth API and compare against a baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=100)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument(
+            '--scenario', action='append', dest='scenarios',
+            choices=[scenario.name for scenario in SCENARIOS],
+            help='Only run this scenario (repeatable)',
+        )
+        parser.add_argument('--save', help='Write the results to this JSON file')
+        parser.add_argument('--compare', help='Fail if the results regress against this JSON baseline')
+        parser.add_argument(
+            '--max-latency-ratio', type=float, default=1.5,
+            help='Allowed p95 growth over the baseline',
+        )
+        parser.add_argument('--keepdb', action='store_true', help='Reuse the test database')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            results = run_benchmarks(
+                iterations=options['iterations'],
+                names=options['scenarios'],
+                warmup=options['warmup'],
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<24} {result['throughput']:>8.1f} req/s  "
+                f"p50 {result['p50_ms']:>7.2f} ms  p95 {result['p95_ms']:>7.2f} ms  "
+                f"p99 {result['p99_ms']:>7.2f} ms  {result['queries_per_request']:>5.1f} queries  "
+                f"{result['errors']} errors"
+            )
+
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+            self.stdout.write(f"Saved results to {options['save']}")
+
+        if baseline is not None:
+            regressions = compare_results(baseline, results, options['max_latency_ratio'])
+            if regressions:
+                raise CommandError('Performance regressions:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
@@ -0,0 +1,61 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+class Command(BaseCommand):
+    """
+    Compare the cost of a query on a fresh connection with one on a reused
+    connection
+
+    The fresh case is what every request paid with CONN_MAX_AGE=0; the
+    reused case is what persistent connections cost after the first request
+    a worker serves.
+    """
+    help = 'Benchmark database connection setup against connection reuse'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        iterations = options['iterations']
+
+        def query():
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+
+        fresh = []
+        for _ in range(iterations):
+            connection.close()
+            start = time.perf_counter()
+            query()
+            fresh.append(time.perf_counter() - start)
+
+        reused = []
+        query()
+        for _ in range(iterations):
+            start = time.perf_counter()
+            query()
+            reused.append(time.perf_counter() - start)
+        connection.close()
+
+        self.report('New connection per request', fresh)
+        self.report('Persistent connection', reused)
+        saved = statistics.mean(fresh) - statistics.mean(reused)
+        self.stdout.write(self.style.SUCCESS(
+            f'Connection setup costs {saved * 1000:.2f} ms per request'
+        ))
+
+    def report(self, label, samples):
+        samples = sorted(samples)
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        self.stdout.write(
+            f'{label}: mean {statistics.mean(samples) * 1000:.2f} ms, '
+            f'p50 {statistics.median(samples) * 1000:.2f} ms, '
+            f'p95 {p95 * 1000:.2f} ms'
+        )
@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from authentication.hashers import PROFILES, calibrate
+
+
+class Command(BaseCommand):
+    """
+    Benchmark password hashing on this host and print settings that make
+    one hash take about the target time
+
+    Run it on each node type and put the printed variables in that node's
+    environment. Users are moved to the new parameters as they log in.
+    """
+    help = 'Pick password hasher parameters for a target latency per hash'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', choices=PROFILES, help='Defaults to PASSWORD_HASHER')
+        parser.add_argument('--target-ms', type=float, default=250, help='Time one hash should take')
+        parser.add_argument('--max-memory-mb', type=int, default=64, help='Memory per hash (scrypt, argon2)')
+        parser.add_argument('--samples', type=int, default=3)
+
+    def handle(self, *args, **options):
+        profile = options['profile'] or settings.PASSWORD_HASHER
+        try:
+            values, elapsed = calibrate(
+                profile,
+                options['target_ms'] / 1000,
+                max_memory=options['max_memory_mb'] * 1024 * 1024,
+                samples=options['samples'],
+            )
+        except ValueError as e:
+            # Raised by Django when argon2-cffi is missing
+            raise CommandError(str(e))
+
+        self.stdout.write(f'PASSWORD_HASHER={profile}')
+        for name, value in values.items():
+            self.stdout.write(f'{name}={value}')
+        if elapsed < options['target_ms'] / 1000 * 0.8:
+            self.stderr.write(self.style.WARNING(
+                f'Hashing takes only {elapsed * 1000:.0f}ms within the memory limit; '
+                f'raise --max-memory-mb to reach the target'
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f'{elapsed * 1000:.0f}ms per hash; one worker process handles about '
+            f'{1 / elapsed:.1f} logins per second'
+        ))
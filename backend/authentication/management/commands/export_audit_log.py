@@ -0,0 +1,54 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from authentication.exports import EXPORTS, iter_rows, render_lines, write_parquet
+
+
+class Command(BaseCommand):
+    """
+    Export an audit log as NDJSON, CSV or Parquet
+
+    Rows are streamed in keyset pages, so memory use is constant however
+    many rows match. Parquet output needs pyarrow and an --output file.
+    """
+    help = 'Export UserActivity or LoginAttempt rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS))
+        parser.add_argument('--format', choices=('ndjson', 'csv', 'parquet'), default='ndjson')
+        parser.add_argument('--output', help='File to write, defaults to stdout')
+        parser.add_argument('--user', help='Only rows for this user id')
+        parser.add_argument('--activity-type', help='Only activities of this type')
+        parser.add_argument('--since', help='Only rows at or after this ISO 8601 time')
+        parser.add_argument('--until', help='Only rows before this ISO 8601 time')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        filters = {'user': options['user'], 'activity_type': options['activity_type']}
+        for name in ('since', 'until'):
+            value = options[name]
+            filters[name] = parse_datetime(value) if value else None
+            if value and filters[name] is None:
+                raise CommandError(f'--{name} must be an ISO 8601 datetime')
+
+        _, fields = EXPORTS[options['kind']]
+        rows = iter_rows(options['kind'], batch_size=options['batch_size'], **filters)
+
+        if options['format'] == 'parquet':
+            if not options['output']:
+                raise CommandError('Parquet exports need --output')
+            try:
+                write_parquet(rows, fields, options['output'], batch_size=options['batch_size'])
+            except ImportError:
+                raise CommandError('Parquet exports need pyarrow: pip install pyarrow')
+            return
+
+        output = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+        try:
+            for line in render_lines(rows, fields, options['format']):
+                output.write(line)
+        finally:
+            if output is not sys.stdout:
+                output.close()
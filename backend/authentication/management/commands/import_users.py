@@ -0,0 +1,63 @@
+import json
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from authentication.provisioning import FORMATS, parse_rows, provision_users
+
+
+class Command(BaseCommand):
+    """
+    Create users from a CSV or NDJSON file
+
+    Accepts the same columns as the bulk import endpoint: username, email
+    and optionally password, first_name and last_name. Users without a
+    password get an unusable one and a verification email either way.
+    """
+    help = 'Bulk import users from CSV or NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, or - for stdin')
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, help='Rows per insert')
+        parser.add_argument('--processes', type=int, help='Password hashing processes')
+        parser.add_argument('--report', help='Write the per-row results to this NDJSON file')
+        parser.add_argument('--created-by', default='import_users')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        input_format = options['format'] or path.rsplit('.', 1)[-1].lower()
+        if input_format not in FORMATS:
+            raise CommandError('Pass --format csv or --format ndjson')
+
+        if path == '-':
+            data = sys.stdin.read()
+        else:
+            with open(path, encoding='utf-8-sig') as f:
+                data = f.read()
+        try:
+            rows = parse_rows(data, input_format)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        results = provision_users(
+            rows,
+            created_by=options['created_by'],
+            chunk_size=options['chunk_size'],
+            processes=options['processes'] or settings.BULK_IMPORT_PROCESSES,
+        )
+
+        if options['report']:
+            with open(options['report'], 'w') as f:
+                for result in results:
+                    f.write(json.dumps(result) + '\n')
+
+        failed = [result for result in results if result['status'] == 'failed']
+        for result in failed[:20]:
+            self.stderr.write(f"Row {result['row']} ({result['username']}): {json.dumps(result['errors'])}")
+        if len(failed) > 20:
+            self.stderr.write(f'... and {len(failed) - 20} more failures')
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(results) - len(failed)} users, {len(failed)} failed'
+        ))
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from authentication.partitions import create_partitions, expire_partitions
+
+
+class Command(BaseCommand):
+    """
+    Create upcoming monthly audit partitions and expire old ones
+
+    Intended to run daily, e.g. from cron. On databases without partitioned
+    audit tables only the retention policy applies, by deleting old rows.
+    """
+    help = 'Maintain the monthly partitions of the audit log tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months-ahead', type=int, default=settings.AUDIT_PARTITIONS_AHEAD,
+            help='Number of future monthly partitions to keep ready',
+        )
+        parser.add_argument(
+            '--retention-months', type=int, default=settings.AUDIT_LOG_RETENTION_MONTHS,
+            help='Months of audit data to keep; 0 keeps everything',
+        )
+        parser.add_argument(
+            '--archive', action='store_true',
+            help='Detach expired partitions and keep them as <partition>_archived instead of dropping them',
+        )
+
+    def handle(self, *args, **options):
+        for name in create_partitions(months_ahead=options['months_ahead']):
+            self.stdout.write(f'Created {name}')
+
+        if options['retention_months']:
+            results = expire_partitions(options['retention_months'], archive=options['archive'])
+            for name, result in results:
+                if isinstance(result, int):
+                    self.stdout.write(f'Deleted {result} expired rows from {name}')
+                else:
+                    self.stdout.write(f'{result.capitalize()} {name}')
+
+        self.stdout.write(self.style.SUCCESS('Audit partitions are up to date'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from authentication.mail import purge_finished_emails
+from authentication.one_time_tokens import purge_expired_tokens
+from authentication.revocation import purge_expired_revocations
+from authentication.sessions import purge_dead_sessions
+
+
+class Command(BaseCommand):
+    """
+    Delete expired email verification and password reset tokens,
+    revocations of JWTs that have expired, dead sessions, and sent or
+    failed emails past MAIL_RETENTION_DAYS
+
+    Intended to run periodically, e.g. hourly from cron.
+    """
+    help = 'Delete expired one-time tokens'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of rows deleted per statement',
+        )
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_tokens(batch_size=options['batch_size'])
+        revocations = purge_expired_revocations(batch_size=options['batch_size'])
+        sessions = purge_dead_sessions(batch_size=options['batch_size'])
+        emails = purge_finished_emails(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted} expired tokens, {revocations} expired revocations, '
+            f'{sessions} dead sessions and {emails} finished emails'
+        ))
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from authentication.signing import ALGORITHMS, rotate_signing_keys
+
+
+class Command(BaseCommand):
+    """
+    Rotate the JWT signing key once it is JWT_KEY_ROTATION_DAYS old and
+    delete keys no live token was signed with
+
+    Intended to run periodically, e.g. daily from cron. The new key is
+    published in the JWKS JWT_KEY_PUBLISH_AHEAD_SECONDS before it signs.
+    """
+    help = 'Rotate the JWT signing key when it is due'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Rotate even if the key is not due')
+        parser.add_argument('--algorithm', choices=ALGORITHMS, help='Defaults to JWT_SIGNING_ALGORITHM')
+
+    def handle(self, *args, **options):
+        algorithm = options['algorithm'] or settings.JWT_SIGNING_ALGORITHM
+        if algorithm not in ALGORITHMS:
+            raise CommandError(f'JWT_SIGNING_ALGORITHM is {algorithm}, which does not use a key ring')
+
+        new_key, deleted = rotate_signing_keys(algorithm, force=options['force'])
+        if new_key is not None:
+            self.stdout.write(f'Created {new_key.algorithm} key {new_key.kid}, signing from {new_key.activated_at:%Y-%m-%d %H:%M:%S %Z}')
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired keys'))
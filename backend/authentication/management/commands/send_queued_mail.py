@@ -0,0 +1,51 @@
+import time
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+
+from authentication.mail import send_queued_emails
+
+
+class Command(BaseCommand):
+    """
+    Deliver emails queued in OutboundEmail
+
+    Runs a single pass by default; with --loop it keeps one mail connection
+    open and polls for due messages until interrupted.
+    """
+    help = 'Deliver queued verification and password reset emails'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.MAIL_QUEUE_BATCH_SIZE,
+            help='Maximum number of messages sent per batch',
+        )
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Keep polling for queued messages instead of exiting',
+        )
+        parser.add_argument(
+            '--interval', type=float, default=settings.MAIL_QUEUE_POLL_INTERVAL,
+            help='Seconds to sleep when the queue is empty (with --loop)',
+        )
+
+    def handle(self, *args, **options):
+        connection = get_connection()
+        total = 0
+        try:
+            while True:
+                sent = send_queued_emails(connection=connection, batch_size=options['batch_size'])
+                total += sent
+                if sent < options['batch_size']:
+                    if not options['loop']:
+                        break
+                    # Drop the idle connection rather than let the server time it out
+                    connection.close()
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connection.close()
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {total} queued emails'))
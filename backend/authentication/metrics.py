@@ -0,0 +1,160 @@
+import hmac
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseNotFound
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+# With PROMETHEUS_MULTIPROC_DIR set, every gunicorn worker writes these to
+# its own memory-mapped file and a scrape of any worker sums all of them
+LOGIN_ATTEMPTS = Counter(
+    'auth_login_attempts_total', 'Login attempts by outcome', ['outcome'],
+)
+THROTTLE_REJECTIONS = Counter(
+    'auth_throttle_rejections_total', 'Requests rejected by a rate throttle', ['scope'],
+)
+TOTP_VERIFICATION_SECONDS = Histogram(
+    'auth_totp_verification_seconds', 'Time spent verifying a TOTP token for a device',
+    buckets=LATENCY_BUCKETS,
+)
+JWT_VALIDATION_SECONDS = Histogram(
+    'auth_jwt_validation_seconds', 'Time TwoFactorMiddleware spends validating a bearer token and loading its user',
+    buckets=LATENCY_BUCKETS,
+)
+PASSWORD_HASH_QUEUE_SECONDS = Histogram(
+    'auth_password_hash_queue_seconds', 'Time a password operation waited for a hashing process',
+    buckets=LATENCY_BUCKETS,
+)
+PASSWORD_HASH_SECONDS = Histogram(
+    'auth_password_hash_seconds', 'Time spent hashing or checking a password',
+    buckets=LATENCY_BUCKETS,
+)
+REVOCATION_FALSE_POSITIVE_RATE = Gauge(
+    'auth_revocation_bloom_false_positive_rate',
+    'Expected false positive rate of the revocation Bloom filter, highest across workers',
+    multiprocess_mode='max',
+)
+REQUEST_SECONDS = Histogram(
+    'auth_request_duration_seconds', 'Request duration by view', ['view'],
+    buckets=LATENCY_BUCKETS,
+)
+REQUEST_QUERIES = Histogram(
+    'auth_request_queries', 'Database queries per request by view', ['view'],
+    buckets=QUERY_BUCKETS,
+)
+
+
+class DatabaseStateCollector:
+    """
+    Gauges read from the database when the endpoint is scraped
+
+    These describe shared state rather than a single process, so they are
+    computed per scrape instead of being aggregated across workers. The
+    values are kept for METRICS_DB_STATE_TTL seconds, so frequent scrapes
+    do not query the database each time.
+    """
+    def __init__(self, timer=time.monotonic):
+        self.timer = timer
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self._state = None
+        self._read_at = None
+
+    def read_state(self):
+        from .models import OutboundEmail
+
+        state = {'mail_queue_depth': OutboundEmail.objects.filter(status='pending').count(), 'connections': None}
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT coalesce(state, 'unknown'), count(*) FROM pg_stat_activity "
+                    "WHERE datname = current_database() GROUP BY 1"
+                )
+                state['connections'] = cursor.fetchall()
+        return state
+
+    def get_state(self):
+        with self._lock:
+            if self._read_at is None or self.timer() - self._read_at >= settings.METRICS_DB_STATE_TTL:
+                self._state = self.read_state()
+                self._read_at = self.timer()
+            return self._state
+
+    def collect(self):
+        state = self.get_state()
+
+        depth = GaugeMetricFamily('auth_mail_queue_depth', 'Emails waiting to be sent')
+        depth.add_metric([], state['mail_queue_depth'])
+        yield depth
+
+        if state['connections'] is not None:
+            connections = GaugeMetricFamily(
+                'auth_db_connections', 'Connections to this database by state', labels=['state'],
+            )
+            for db_state, count in state['connections']:
+                connections.add_metric([db_state], count)
+            yield connections
+
+
+database_state_collector = DatabaseStateCollector()
+database_state_registry = CollectorRegistry()
+database_state_registry.register(database_state_collector)
+
+
+def observe_request(view, duration, queries):
+    """
+    Record a handled request, called by RequestMetricsMiddleware
+    """
+    REQUEST_SECONDS.labels(view=view).observe(duration)
+    REQUEST_QUERIES.labels(view=view).observe(queries)
+
+
+def render_metrics():
+    """
+    Render every metric in the Prometheus text format
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry) + generate_latest(database_state_registry)
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint
+
+    The scraper must send METRICS_TOKEN as a bearer token. Without a
+    token configured only staff users signed in to the admin may read it.
+    """
+    if not settings.METRICS_ENABLED:
+        return HttpResponseNotFound()
+
+    if settings.METRICS_TOKEN:
+        expected = f'Bearer {settings.METRICS_TOKEN}'
+        provided = request.META.get('HTTP_AUTHORIZATION', '')
+        if not hmac.compare_digest(provided.encode(), expected.encode()):
+            return HttpResponseForbidden()
+    elif not request.user.is_staff:
+        return HttpResponseForbidden()
+
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE_LATEST)
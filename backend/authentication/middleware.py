@@ -1,18 +1,26 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.conf import settings
-from django.utils.deprecation import MiddlewareMixin
-from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
-from django.urls import resolve
 
-from .models import TOTPDevice, CustomUser
+from .authentication import CachedJWTAuthentication
+from .metrics import JWT_VALIDATION_SECONDS
+from .totp import aget_two_factor_state, get_two_factor_state
 
-class TwoFactorMiddleware(MiddlewareMixin):
+class TwoFactorMiddleware:
     """
     Middleware to enforce 2FA verification for users with 2FA enabled
     
     This middleware checks if a user has 2FA enabled and ensures they've completed
-    the 2FA verification process before accessing protected endpoints
+    the 2FA verification process before accessing protected endpoints.
+    The validated token and user are attached to the request so that
+    CachedJWTAuthentication does not validate and load them a second time.
+    Under ASGI the user and 2FA state are loaded with the async ORM and
+    cache instead of blocking the event loop.
     """
+    sync_capable = True
+    async_capable = True
     
     # Paths that don't require 2FA verification
     EXEMPT_PATHS = [
@@ -23,41 +31,46 @@ class TwoFactorMiddleware(MiddlewareMixin):
         '/api/auth/reset-password-request/',
         '/api/auth/reset-password-confirm/',
         '/api/auth/verify-email/',
+        '/api/metrics/',
     ]
     
     def __init__(self, get_response):
         self.get_response = get_response
-        self.jwt_auth = JWTAuthentication()
-        
-    def __call__(self, request):
-        # Check if 2FA is enabled globally
+        self.jwt_auth = CachedJWTAuthentication()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def applies_to(self, request):
+        # Check if 2FA is enabled globally, and skip exempt paths
         if not settings.TWO_FACTOR_ENABLED:
-            return self.get_response(request)
-            
-        # Skip middleware for exempt paths
+            return False
         path = request.path
-        if any(path.startswith(exempt_path) for exempt_path in self.EXEMPT_PATHS):
+        return not any(path.startswith(exempt_path) for exempt_path in self.EXEMPT_PATHS)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.applies_to(request):
             return self.get_response(request)
             
         # Try to get the user from the JWT token
         try:
-            auth_header = request.headers.get('Authorization', '')
-            if not auth_header.startswith('Bearer '):
+            start = time.perf_counter()
+            result = self.jwt_auth.authenticate(request)
+            if result is None:
                 return self.get_response(request)
+            JWT_VALIDATION_SECONDS.observe(time.perf_counter() - start)
                 
-            token = auth_header.split(' ')[1]
-            validated_token = self.jwt_auth.get_validated_token(token)
-            user = self.jwt_auth.get_user(validated_token)
+            # Let DRF reuse the validated token and user for this request
+            request._cached_jwt_auth = result
+            user, validated_token = result
+            
+            # Served from a short-lived cache shared between workers
+            request.two_factor_state = get_two_factor_state(user)
             
             # If the user has 2FA enabled, check if they've completed verification
-            if user.two_factor_enabled:
-                # Check if user has a confirmed TOTP device
-                has_confirmed_device = TOTPDevice.objects.filter(
-                    user=user, 
-                    confirmed=True
-                ).exists()
-                
-                if not has_confirmed_device:
+            if request.two_factor_state['enabled']:
+                if not request.two_factor_state['has_confirmed_device']:
                     # User has 2FA enabled but hasn't completed verification
                     # You could handle this by returning a custom response or
                     # letting the request continue and handling it in the view
@@ -67,4 +80,21 @@ class TwoFactorMiddleware(MiddlewareMixin):
             # Token validation failed, let the regular authentication process handle it
             pass
             
-        return self.get_response(request)
\ No newline at end of file
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if not self.applies_to(request):
+            return await self.get_response(request)
+
+        try:
+            start = time.perf_counter()
+            result = await self.jwt_auth.aauthenticate(request)
+            if result is not None:
+                JWT_VALIDATION_SECONDS.observe(time.perf_counter() - start)
+                request._cached_jwt_auth = result
+                user, validated_token = result
+                request.two_factor_state = await aget_two_factor_state(user)
+        except (InvalidToken, AuthenticationFailed):
+            pass
+
+        return await self.get_response(request)
@@ -0,0 +1,74 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:38
+
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+
+def copy_user_tokens(apps, schema_editor):
+    """
+    Move outstanding tokens from the user table into the token store
+    """
+    CustomUser = apps.get_model('authentication', 'CustomUser')
+    OneTimeToken = apps.get_model('authentication', 'OneTimeToken')
+    now = timezone.now()
+    lifetimes = {
+        'email_verification_token': (
+            'email_verification', timedelta(hours=settings.EMAIL_VERIFICATION_TOKEN_LIFETIME_HOURS)
+        ),
+        'password_reset_token': (
+            'password_reset', timedelta(minutes=settings.PASSWORD_RESET_TOKEN_LIFETIME_MINUTES)
+        ),
+    }
+
+    for field, (purpose, lifetime) in lifetimes.items():
+        users = CustomUser.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+        tokens = (
+            OneTimeToken(
+                user_id=user_id,
+                purpose=purpose,
+                digest=hashlib.sha256(token.encode()).hexdigest(),
+                expires_at=now + lifetime,
+            )
+            for user_id, token in users.values_list('id', field).iterator()
+        )
+        OneTimeToken.objects.bulk_create(tokens, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0004_outbound_email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OneTimeToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('purpose', models.CharField(choices=[('email_verification', 'Email Verification'), ('password_reset', 'Password Reset')], max_length=32)),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('consumed_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'One-Time Token',
+                'verbose_name_plural': 'One-Time Tokens',
+            },
+        ),
+        migrations.RunPython(copy_user_tokens, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='customuser',
+            name='email_verification_token',
+        ),
+        migrations.RemoveField(
+            model_name='customuser',
+            name='password_reset_token',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0005_one_time_tokens'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='totpdevice',
+            name='last_verified_interval',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,122 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:56
+
+from datetime import datetime, timezone
+
+from django.db import migrations, models
+
+# Monthly partitions created past the current month; later ones are created
+# by the manage_audit_partitions command
+MONTHS_AHEAD = 3
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_table(schema_editor, model):
+    """
+    Rebuild a table as a partitioned table with the same columns and data
+
+    The primary key of a partitioned table must include the partition key,
+    so it becomes (id, timestamp); ids still come from a single sequence.
+    """
+    table = model._meta.db_table
+    legacy = f'{table}_legacy'
+    execute = schema_editor.execute
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'SELECT min("timestamp"), max("timestamp"), max("id") FROM "{table}"')
+        first, last, max_id = cursor.fetchone()
+    now = datetime.now(timezone.utc)
+    month = add_months(min(first or now, now), 0)
+    last = add_months(max(last or now, now), MONTHS_AHEAD)
+
+    execute(f'ALTER TABLE "{table}" RENAME TO "{legacy}"')
+    execute(
+        f'CREATE TABLE "{table}" (LIKE "{legacy}" INCLUDING DEFAULTS) '
+        f'PARTITION BY RANGE ("timestamp")'
+    )
+    while month <= last:
+        execute(
+            f'CREATE TABLE "{table}_p{month.year:04d}_{month.month:02d}" PARTITION OF "{table}" '
+            f'FOR VALUES FROM (%s) TO (%s)',
+            params=[month, add_months(month, 1)],
+        )
+        month = add_months(month, 1)
+    execute(f'CREATE TABLE "{table}_default" PARTITION OF "{table}" DEFAULT')
+
+    execute(f'INSERT INTO "{table}" SELECT * FROM "{legacy}"')
+    # Dropping the legacy table also drops its identity sequence, freeing
+    # the sequence and constraint names for the new table
+    execute(f'DROP TABLE "{legacy}"')
+
+    execute(f'CREATE SEQUENCE "{table}_id_seq" OWNED BY "{table}"."id"')
+    execute(f'ALTER TABLE "{table}" ALTER COLUMN "id" SET DEFAULT nextval(\'"{table}_id_seq"\')')
+    if max_id is not None:
+        execute(f'SELECT setval(\'"{table}_id_seq"\', %s)', params=[max_id])
+
+    execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_pkey" PRIMARY KEY ("id", "timestamp")')
+
+
+class PostgreSQLRunSQL(migrations.RunSQL):
+    """
+    RunSQL that only runs on PostgreSQL, where the tables are partitioned
+    """
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+# The user foreign keys and indexes of the rebuilt tables, under the names
+# Django gave them originally
+USER_CONSTRAINTS_SQL = [
+    'ALTER TABLE "authentication_loginattempt" ADD CONSTRAINT "authentication_login_user_id_253ccbc6_fk_authentic" '
+    'FOREIGN KEY ("user_id") REFERENCES "authentication_customuser" ("id") DEFERRABLE INITIALLY DEFERRED',
+    'CREATE INDEX "authentication_loginattempt_user_id_253ccbc6" ON "authentication_loginattempt" ("user_id")',
+    'ALTER TABLE "authentication_useractivity" ADD CONSTRAINT "authentication_usera_user_id_c4774348_fk_authentic" '
+    'FOREIGN KEY ("user_id") REFERENCES "authentication_customuser" ("id") DEFERRABLE INITIALLY DEFERRED',
+    'CREATE INDEX "authentication_useractivity_user_id_c4774348" ON "authentication_useractivity" ("user_id")',
+]
+
+
+def partition_audit_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in ('LoginAttempt', 'UserActivity'):
+        partition_table(schema_editor, apps.get_model('authentication', name))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0006_totp_last_verified_interval'),
+    ]
+
+    operations = [
+        # Only PostgreSQL gets partitioned tables; the indexes below are
+        # created on every backend, and on the partitioned parent cascade
+        # to each partition
+        migrations.RunPython(partition_audit_tables, migrations.RunPython.noop),
+        PostgreSQLRunSQL(USER_CONSTRAINTS_SQL, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='loginattempt',
+            index=models.Index(fields=['user', 'timestamp'], name='loginattempt_user_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loginattempt',
+            index=models.Index(fields=['ip_address', 'timestamp'], name='loginattempt_ip_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='useractivity',
+            index=models.Index(fields=['user', 'timestamp'], name='useractivity_user_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='useractivity',
+            index=models.Index(fields=['ip_address', 'timestamp'], name='useractivity_ip_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:28
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0010_user_sessions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SigningKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kid', models.CharField(max_length=64, unique=True)),
+                ('algorithm', models.CharField(max_length=10)),
+                ('private_key', models.TextField()),
+                ('public_jwk', models.JSONField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('activated_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Signing Key',
+                'verbose_name_plural': 'Signing Keys',
+                'ordering': ['activated_at'],
+            },
+        ),
+    ]
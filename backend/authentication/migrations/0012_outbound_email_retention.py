@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:50
+
+from django.db import migrations, models
+
+
+def clear_finished_bodies(apps, schema_editor):
+    """
+    Drop the token links of messages that were already sent or given up on
+    """
+    OutboundEmail = apps.get_model('authentication', 'OutboundEmail')
+    OutboundEmail.objects.exclude(status='pending').update(body='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0011_signing_keys'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='outboundemail',
+            index=models.Index(condition=models.Q(('status', 'pending'), _negated=True), fields=['created_at'], name='outbound_email_done_idx'),
+        ),
+        migrations.RunPython(clear_finished_bodies, migrations.RunPython.noop),
+    ]
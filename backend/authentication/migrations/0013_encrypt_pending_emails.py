@@ -0,0 +1,25 @@
+from django.db import migrations
+
+from authentication.crypto import encrypt_text
+
+
+def encrypt_pending_bodies(apps, schema_editor):
+    """
+    Encrypt the bodies of messages queued before bodies were encrypted
+    """
+    OutboundEmail = apps.get_model('authentication', 'OutboundEmail')
+    messages = list(OutboundEmail.objects.filter(status='pending'))
+    for message in messages:
+        message.body = encrypt_text(message.body)
+    OutboundEmail.objects.bulk_update(messages, ['body'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0012_outbound_email_retention'),
+    ]
+
+    operations = [
+        migrations.RunPython(encrypt_pending_bodies, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:59
+
+from django.db import migrations, models
+
+from authentication.signing import private_key_password
+
+
+def encrypt_private_keys(apps, schema_editor):
+    """
+    Encrypt the private keys stored before keys were encrypted
+    """
+    from cryptography.hazmat.primitives import serialization
+
+    SigningKey = apps.get_model('authentication', 'SigningKey')
+    for key in SigningKey.objects.all():
+        try:
+            private_key = serialization.load_pem_private_key(key.private_key.encode(), None)
+        except TypeError:
+            # Already encrypted
+            continue
+        key.private_key = private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.BestAvailableEncryption(private_key_password()),
+        ).decode()
+        key.save(update_fields=['private_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0013_encrypt_pending_emails'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='signingkey',
+            name='activated_at',
+            field=models.DateTimeField(unique=True),
+        ),
+        migrations.RunPython(encrypt_private_keys, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,11 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser, Group, Permission
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 import uuid
 
+from .user_cache import invalidate_cached_user
+
 class CustomUser(AbstractUser):
     """
     Custom User model extending Django's AbstractUser
@@ -20,10 +23,9 @@ class CustomUser(AbstractUser):
     
     # Two-factor authentication field
     two_factor_enabled = models.BooleanField(default=False)
-    
-    # Email verification and password reset tokens
-    email_verification_token = models.CharField(max_length=100, null=True, blank=True)
-    password_reset_token = models.CharField(max_length=100, null=True, blank=True)
+
+    # Embedded in issued JWTs; bumping it ends every session of the user
+    token_generation = models.PositiveIntegerField(default=0, editable=False)
     
     # Optional additional fields
     bio = models.TextField(max_length=500, blank=True)
@@ -61,7 +63,15 @@ class CustomUser(AbstractUser):
         # Convert email to lowercase to prevent duplicates
         self.email = self.email.lower()
         
-        return super().save(*args, **kwargs)
+        result = super().save(*args, **kwargs)
+        
+        # Drop the copy served to JWTAuthentication
+        invalidate_cached_user(self.pk)
+        return result
+
+    def delete(self, *args, **kwargs):
+        invalidate_cached_user(self.pk)
+        return super().delete(*args, **kwargs)
 
     def __str__(self):
         return self.username
@@ -69,6 +79,10 @@ class CustomUser(AbstractUser):
     class Meta:
         verbose_name = _('user')
         verbose_name_plural = _('users')
+        indexes = [
+            # Keyset pagination of the user list
+            models.Index(fields=['date_joined', 'id'], name='user_date_joined_id_idx'),
+        ]
 
 class LoginAttempt(models.Model):
     """
@@ -76,12 +90,19 @@ class LoginAttempt(models.Model):
     """
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, null=True)
     ip_address = models.GenericIPAddressField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the row is built rather than inserted, as inserts may be batched
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     successful = models.BooleanField(default=False)
 
     class Meta:
         verbose_name_plural = 'Login Attempts'
         ordering = ['-timestamp']
+        # On PostgreSQL the table is partitioned by month on timestamp,
+        # see authentication.partitions
+        indexes = [
+            models.Index(fields=['user', 'timestamp'], name='loginattempt_user_ts_idx'),
+            models.Index(fields=['ip_address', 'timestamp'], name='loginattempt_ip_ts_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user or 'Unknown'} - {'Success' if self.successful else 'Failed'}"
@@ -106,13 +127,20 @@ class UserActivity(models.Model):
 
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     activity_type = models.CharField(max_length=25, choices=ACTIVITY_TYPES)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the row is built rather than inserted, as inserts may be batched
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     ip_address = models.GenericIPAddressField()
     additional_info = models.JSONField(null=True, blank=True)
 
     class Meta:
         verbose_name_plural = 'User Activities'
         ordering = ['-timestamp']
+        # On PostgreSQL the table is partitioned by month on timestamp,
+        # see authentication.partitions
+        indexes = [
+            models.Index(fields=['user', 'timestamp'], name='useractivity_user_ts_idx'),
+            models.Index(fields=['ip_address', 'timestamp'], name='useractivity_ip_ts_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.get_activity_type_display()}"
@@ -128,10 +156,179 @@ class TOTPDevice(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     last_used = models.DateTimeField(null=True, blank=True)
     confirmed = models.BooleanField(default=False)
+    # Last accepted TOTP interval, so a token cannot be used twice
+    last_verified_interval = models.BigIntegerField(null=True, blank=True)
 
     class Meta:
         verbose_name = "TOTP Device"
         verbose_name_plural = "TOTP Devices"
 
     def __str__(self):
-        return f"{self.user.username}'s {self.name} device"
\ No newline at end of file
+        return f"{self.user.username}'s {self.name} device"
+
+class OutboundEmail(models.Model):
+    """
+    Model for emails queued by request handlers and delivered out of band
+    by the send_queued_mail management command
+    """
+    PURPOSES = (
+        ('email_verification', 'Email Verification'),
+        ('password_reset', 'Password Reset'),
+    )
+
+    STATUSES = (
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    )
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, null=True, blank=True)
+    purpose = models.CharField(max_length=32, choices=PURPOSES)
+    to_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    # Encrypted with authentication.crypto, cleared once the message is done
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUSES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Outbound Email'
+        verbose_name_plural = 'Outbound Emails'
+        constraints = [
+            # At most one undelivered message per user and purpose
+            models.UniqueConstraint(
+                fields=['user', 'purpose'],
+                condition=models.Q(status='pending'),
+                name='unique_pending_email_per_purpose',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['next_attempt_at'],
+                condition=models.Q(status='pending'),
+                name='outbound_email_due_idx',
+            ),
+            models.Index(
+                fields=['created_at'],
+                condition=~models.Q(status='pending'),
+                name='outbound_email_done_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.to_email} - {self.get_purpose_display()} ({self.status})"
+
+
+class OneTimeToken(models.Model):
+    """
+    Model for single-use email verification and password reset tokens
+
+    Only a SHA-256 digest of the token is stored; lookups go through the
+    unique index on that digest.
+    """
+    PURPOSES = (
+        ('email_verification', 'Email Verification'),
+        ('password_reset', 'Password Reset'),
+    )
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    purpose = models.CharField(max_length=32, choices=PURPOSES)
+    digest = models.CharField(max_length=64, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    consumed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'One-Time Token'
+        verbose_name_plural = 'One-Time Tokens'
+
+    def __str__(self):
+        return f"{self.user.username} - {self.get_purpose_display()}"
+
+    def consume(self):
+        """
+        Mark the token as used so it cannot be redeemed again
+        """
+        self.consumed_at = timezone.now()
+        self.save(update_fields=['consumed_at'])
+
+
+class RevokedToken(models.Model):
+    """
+    Revoked JWT id, used by DatabaseRevocationStore
+
+    Rows are only needed until the token would have expired anyway and are
+    removed by the purge_expired_tokens command.
+    """
+    jti = models.CharField(max_length=255, unique=True)
+    revoked_at = models.DateTimeField(default=timezone.now, db_index=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = 'Revoked Token'
+        verbose_name_plural = 'Revoked Tokens'
+
+    def __str__(self):
+        return self.jti
+
+
+class UserSession(models.Model):
+    """
+    One login and the chain of refresh tokens rotated from it
+
+    A session is live while it has not ended, has not expired and was
+    issued in the user's current token generation; ending all of a user's
+    sessions bumps ``CustomUser.token_generation`` instead of updating
+    these rows. Dead rows are removed by the purge_expired_tokens command.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='sessions')
+    generation = models.PositiveIntegerField()
+    # Current refresh token, revoked when the session is ended
+    refresh_jti = models.CharField(max_length=255)
+    ip_address = models.GenericIPAddressField(null=True, blank=True)
+    user_agent = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    last_seen_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
+    ended_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'User Session'
+        verbose_name_plural = 'User Sessions'
+        indexes = [
+            models.Index(fields=['user', 'expires_at'], name='usersession_user_exp_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.created_at:%Y-%m-%d %H:%M}"
+
+
+class SigningKey(models.Model):
+    """
+    Key pair of the JWT signing key ring, see authentication.signing
+
+    The newest key whose ``activated_at`` has passed signs new tokens.
+    Older keys only verify, until every token they signed has expired.
+    """
+    kid = models.CharField(max_length=64, unique=True)
+    algorithm = models.CharField(max_length=10)
+    # PKCS#8 PEM encrypted with authentication.crypto.derive_password; only
+    # the public half is ever served
+    private_key = models.TextField()
+    public_jwk = models.JSONField()
+    created_at = models.DateTimeField(default=timezone.now)
+    # Unique, so processes racing to create the first key create one
+    activated_at = models.DateTimeField(unique=True)
+
+    class Meta:
+        verbose_name = 'Signing Key'
+        verbose_name_plural = 'Signing Keys'
+        ordering = ['activated_at']
+
+    def __str__(self):
+        return f"{self.kid} ({self.algorithm})"
@@ -0,0 +1,146 @@
+import hashlib
+import secrets
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OneTimeToken
+
+
+def get_token_lifetime(purpose):
+    """
+    Return how long a token issued for the given purpose stays valid
+    """
+    if purpose == 'password_reset':
+        return timedelta(minutes=settings.PASSWORD_RESET_TOKEN_LIFETIME_MINUTES)
+    return timedelta(hours=settings.EMAIL_VERIFICATION_TOKEN_LIFETIME_HOURS)
+
+
+def hash_token(token):
+    """
+    Return the digest under which a raw token is stored
+    """
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def issue_token(user, purpose):
+    """
+    Issue a new single-use token, revoking any unused one for the same purpose
+
+    Args:
+        user: The user the token belongs to
+        purpose: One of OneTimeToken.PURPOSES
+
+    Returns:
+        The raw token to send to the user; it is not stored anywhere
+    """
+    token = secrets.token_urlsafe(32)
+    with transaction.atomic():
+        OneTimeToken.objects.filter(
+            user=user, purpose=purpose, consumed_at__isnull=True
+        ).delete()
+        OneTimeToken.objects.create(
+            user=user,
+            purpose=purpose,
+            digest=hash_token(token),
+            expires_at=timezone.now() + get_token_lifetime(purpose),
+        )
+    return token
+
+
+def issue_tokens(users, purpose):
+    """
+    Issue tokens for many users that have none outstanding, in one insert
+
+    Intended for newly created users; unlike issue_token, existing tokens
+    are not revoked.
+
+    Returns:
+        A dict of user primary key to raw token
+    """
+    expires_at = timezone.now() + get_token_lifetime(purpose)
+    tokens = {user.pk: secrets.token_urlsafe(32) for user in users}
+    OneTimeToken.objects.bulk_create([
+        OneTimeToken(
+            user_id=user_id,
+            purpose=purpose,
+            digest=hash_token(token),
+            expires_at=expires_at,
+        )
+        for user_id, token in tokens.items()
+    ])
+    return tokens
+
+
+def get_valid_token(token, purpose, for_update=False):
+    """
+    Look up an unexpired, unused token by its digest
+
+    Args:
+        token: The raw token supplied by the user
+        purpose: The purpose the token must have been issued for
+        for_update: Lock the row; must be called inside a transaction
+
+    Returns:
+        The OneTimeToken with its user loaded, or None
+    """
+    tokens = OneTimeToken.objects.select_related('user').filter(
+        digest=hash_token(token),
+        purpose=purpose,
+        consumed_at__isnull=True,
+        expires_at__gt=timezone.now(),
+    )
+    if for_update:
+        tokens = tokens.select_for_update(of=('self',))
+    return tokens.first()
+
+
+def consume_token(token, purpose):
+    """
+    Redeem a token in one step
+
+    Returns:
+        The token's user, or None if the token is invalid, expired or used
+    """
+    with transaction.atomic():
+        one_time_token = get_valid_token(token, purpose, for_update=True)
+        if one_time_token is None:
+            return None
+        one_time_token.consume()
+    return one_time_token.user
+
+
+async def aconsume_token(token, purpose):
+    """
+    Async variant of consume_token
+
+    The row lock needs a transaction, which the async ORM cannot hold, so
+    the redemption runs on the request's database thread.
+    """
+    return await sync_to_async(consume_token)(token, purpose)
+
+
+def purge_expired_tokens(batch_size=1000):
+    """
+    Delete expired tokens in batches
+
+    Consumed tokens are kept until they expire, which keeps this a range
+    scan on the ``expires_at`` index.
+
+    Returns:
+        The number of tokens deleted
+    """
+    deleted = 0
+    now = timezone.now()
+    while True:
+        ids = list(
+            OneTimeToken.objects.filter(expires_at__lte=now)
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+        count, _ = OneTimeToken.objects.filter(id__in=ids).delete()
+        deleted += count
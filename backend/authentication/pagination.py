@@ -0,0 +1,125 @@
+import base64
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on a (datetime, unique key) pair
+
+    Each page continues strictly after the last row of the previous one,
+    so the query is an index range scan whatever the page depth, rows that
+    share a timestamp are neither skipped nor repeated, and no COUNT(*) is
+    run. Both ordering fields must sort in the same direction; subclasses
+    set ``ordering``.
+    """
+    ordering = None
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        key_field, id_field = (field.lstrip('-') for field in self.ordering)
+        lookup = 'lt' if self.ordering[0].startswith('-') else 'gt'
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            key, pk = position
+            try:
+                pk = queryset.model._meta.get_field(id_field).to_python(pk)
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+            queryset = queryset.filter(
+                Q(**{f'{key_field}__{lookup}': key}) | Q(**{key_field: key, f'{id_field}__{lookup}': pk})
+            )
+
+        # One extra row tells whether there is a next page
+        page = list(queryset[:self.page_size + 1])
+        self.next_position = None
+        if len(page) > self.page_size:
+            page = page[:self.page_size]
+            last = page[-1]
+            self.next_position = (getattr(last, key_field), getattr(last, id_field))
+        return page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return settings.API_PAGE_SIZE
+        return max(1, min(size, self.max_page_size))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            key, pk = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            key = parse_datetime(key)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if key is None:
+            raise NotFound(self.invalid_cursor_message)
+        return key, pk
+
+    def encode_cursor(self, position):
+        key, pk = position
+        return base64.urlsafe_b64encode(json.dumps([key.isoformat(), str(pk)]).encode()).decode()
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+
+class UserPagination(KeysetPagination):
+    """
+    Users, newest first, on the (date_joined, id) index
+    """
+    ordering = ('-date_joined', '-id')
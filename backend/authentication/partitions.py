@@ -0,0 +1,190 @@
+import logging
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import LoginAttempt, UserActivity
+
+logger = logging.getLogger(__name__)
+
+# Audit models whose tables are range-partitioned by month on PostgreSQL
+PARTITIONED_MODELS = (LoginAttempt, UserActivity)
+
+_PARTITION_SUFFIX = re.compile(r'_p(\d{4})_(\d{2})$')
+
+
+def month_start(value):
+    """
+    First instant of the UTC month containing ``value``
+    """
+    value = value.astimezone(dt_timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(month, months):
+    """
+    Shift a month start by a number of months
+    """
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(table, month):
+    return f'{table}_p{month.year:04d}_{month.month:02d}'
+
+
+def is_partitioned(table):
+    """
+    Whether ``table`` is a partitioned table in this database
+    """
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)",
+            [table],
+        )
+        return cursor.fetchone() is not None
+
+
+def get_partitions(table):
+    """
+    Monthly partitions currently attached to ``table``
+
+    Returns:
+        A sorted list of (month start, partition name) tuples
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(%s)",
+            [table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = []
+    for name in names:
+        match = _PARTITION_SUFFIX.search(name)
+        if match:
+            month = datetime(int(match[1]), int(match[2]), 1, tzinfo=dt_timezone.utc)
+            partitions.append((month, name))
+    return sorted(partitions)
+
+
+def add_partition(table, name, month):
+    """
+    Create a monthly partition, moving the default partition's rows for
+    that month into it
+
+    PostgreSQL refuses to attach a range the default partition holds rows
+    for, so the partition is built as a plain table, filled from the
+    default partition, and attached in one transaction.
+    """
+    bounds = [month, add_months(month, 1)]
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE "{name}" (LIKE "{table}" INCLUDING DEFAULTS)')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM "{table}_default" '
+            f'WHERE "timestamp" >= %s AND "timestamp" < %s RETURNING *) '
+            f'INSERT INTO "{name}" SELECT * FROM moved',
+            bounds,
+        )
+        if cursor.rowcount:
+            logger.info('Moved %d rows from %s_default into %s', cursor.rowcount, table, name)
+        cursor.execute(
+            f'ALTER TABLE "{table}" ATTACH PARTITION "{name}" FOR VALUES FROM (%s) TO (%s)',
+            bounds,
+        )
+
+
+def create_partitions(months_ahead=3, now=None):
+    """
+    Create the partitions for the current month and ``months_ahead`` after it
+
+    Rows outside every monthly partition land in the default partition, so
+    this should run well before a month starts; rows that did land there
+    are moved into the partition created for their month.
+
+    Returns:
+        The names of the partitions created
+    """
+    start = month_start(now or timezone.now())
+    created = []
+    for model in PARTITIONED_MODELS:
+        table = model._meta.db_table
+        if not is_partitioned(table):
+            continue
+        existing = {name for _, name in get_partitions(table)}
+        for offset in range(months_ahead + 1):
+            month = add_months(start, offset)
+            name = partition_name(table, month)
+            if name in existing:
+                continue
+            add_partition(table, name, month)
+            created.append(name)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT EXISTS (SELECT 1 FROM "{table}_default")')
+            if cursor.fetchone()[0]:
+                logger.warning('%s_default holds rows outside the monthly partitions', table)
+    return created
+
+
+def expire_partitions(retention_months, archive=False, now=None, batch_size=10000):
+    """
+    Remove audit rows older than the retention period
+
+    On PostgreSQL whole monthly partitions are dropped, or with ``archive``
+    detached and renamed to ``<partition>_archived`` so they can be dumped
+    and dropped later, and expired rows in the default partition are
+    deleted in batches. Elsewhere expired rows are deleted in batches.
+
+    Returns:
+        A list of (table or partition name, rows or action) tuples
+    """
+    cutoff = add_months(month_start(now or timezone.now()), -retention_months)
+    results = []
+    for model in PARTITIONED_MODELS:
+        table = model._meta.db_table
+        if not is_partitioned(table):
+            deleted = 0
+            while True:
+                ids = list(
+                    model.objects.filter(timestamp__lt=cutoff)
+                    .order_by()
+                    .values_list('id', flat=True)[:batch_size]
+                )
+                if not ids:
+                    break
+                deleted += model.objects.filter(id__in=ids).delete()[0]
+            results.append((table, deleted))
+            continue
+
+        for month, name in get_partitions(table):
+            if add_months(month, 1) > cutoff:
+                continue
+            with transaction.atomic(), connection.cursor() as cursor:
+                if archive:
+                    cursor.execute(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"')
+                    cursor.execute(f'ALTER TABLE "{name}" RENAME TO "{name}_archived"')
+                    results.append((name, 'archived'))
+                else:
+                    cursor.execute(f'DROP TABLE "{name}"')
+                    results.append((name, 'dropped'))
+
+        deleted = 0
+        while True:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM "{table}_default" WHERE "id" IN ('
+                    f'SELECT "id" FROM "{table}_default" WHERE "timestamp" < %s LIMIT %s)',
+                    [cutoff, batch_size],
+                )
+                if not cursor.rowcount:
+                    break
+                deleted += cursor.rowcount
+        results.append((f'{table}_default', deleted))
+    return results
@@ -0,0 +1,89 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+
+from .instrumentation import record_cache_lookup
+
+# Bump when the shape of the cached profile changes so stale entries are ignored
+PROFILE_CACHE_VERSION = 1
+
+# Fields of the profile served by UserProfileSerializer
+PROFILE_FIELDS = ('id', 'username', 'email', 'first_name', 'last_name', 'bio', 'birth_date')
+
+
+def get_profile_cache_key(user_id):
+    """
+    Cache key for a user's serialized profile
+    """
+    return f"profile:v{PROFILE_CACHE_VERSION}:{user_id}"
+
+
+def serialize_profile(user):
+    """
+    Serialize a profile without going through DRF's field machinery
+
+    Produces the same output as UserProfileSerializer, whose fields are
+    fixed, for either a user instance or a dict of PROFILE_FIELDS values.
+    """
+    if not isinstance(user, dict):
+        user = {name: getattr(user, name) for name in PROFILE_FIELDS}
+    birth_date = user['birth_date']
+    return {
+        'id': str(user['id']),
+        'username': user['username'],
+        'email': user['email'],
+        'first_name': user['first_name'],
+        'last_name': user['last_name'],
+        'bio': user['bio'],
+        'birth_date': birth_date.isoformat() if birth_date is not None else None,
+    }
+
+
+def get_cached_profile(user_id):
+    """
+    Get a user's serialized profile from the shared cache, loading only the
+    profile columns on a miss
+
+    Returns:
+        The profile dict, or None if the user does not exist
+    """
+    key = get_profile_cache_key(user_id)
+    profile = cache.get(key)
+    record_cache_lookup(profile is not None)
+    if profile is None:
+        row = get_user_model().objects.filter(pk=user_id).values(*PROFILE_FIELDS).first()
+        if row is None:
+            return None
+        profile = serialize_profile(row)
+        cache.set(key, profile, settings.PROFILE_CACHE_TTL)
+    return profile
+
+
+def refresh_cached_profile(user, update_fields=None):
+    """
+    Store the profile of a user that was just saved
+
+    Saves that did not write any profile field leave the entry alone. An
+    instance with deferred profile fields, e.g. one built from token
+    claims, only drops the entry so it is not loaded field by field.
+
+    Inside a transaction the entry is written once it commits, so a
+    rollback does not leave uncommitted values in the cache.
+    """
+    if update_fields is not None and not set(update_fields) & set(PROFILE_FIELDS):
+        return
+    if set(PROFILE_FIELDS) & user.get_deferred_fields():
+        invalidate_cached_profile(user.pk)
+        return
+    key = get_profile_cache_key(user.pk)
+    profile = serialize_profile(user)
+    transaction.on_commit(lambda: cache.set(key, profile, settings.PROFILE_CACHE_TTL))
+
+
+def invalidate_cached_profile(user_id):
+    """
+    Drop a user's cached profile once the current transaction commits
+    """
+    key = get_profile_cache_key(user_id)
+    transaction.on_commit(lambda: cache.delete(key))
@@ -0,0 +1,223 @@
+import csv
+import io
+import json
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.password_validation import validate_password
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+
+from .hashing import PasswordHasherPool, get_hasher_pool
+from .mail import queue_verification_emails
+from .models import CustomUser, UserActivity
+from .one_time_tokens import issue_tokens
+
+# Columns read from each imported row; anything else is ignored
+IMPORT_FIELDS = ('username', 'email', 'password', 'first_name', 'last_name')
+
+FORMATS = ('csv', 'ndjson')
+
+
+def parse_rows(data, input_format):
+    """
+    Parse CSV (with a header line) or NDJSON text into a list of dicts
+    """
+    if input_format == 'csv':
+        return list(csv.DictReader(io.StringIO(data)))
+    rows = []
+    for number, line in enumerate(data.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            raise ValueError(f'Line {number} is not valid JSON')
+        if not isinstance(row, dict):
+            raise ValueError(f'Line {number} is not a JSON object')
+        rows.append(row)
+    return rows
+
+
+def clean_row(row):
+    """
+    Normalize and validate one imported row without touching the database
+
+    Returns:
+        A tuple of (cleaned data, errors dict)
+    """
+    data = {name: str(row.get(name) or '').strip() for name in IMPORT_FIELDS}
+    data['email'] = data['email'].lower()
+    errors = {}
+
+    for name in ('username', 'email'):
+        if not data[name]:
+            errors[name] = ['This field is required.']
+    if data['username'] and 'username' not in errors:
+        try:
+            UnicodeUsernameValidator()(data['username'])
+            if len(data['username']) > CustomUser._meta.get_field('username').max_length:
+                raise ValidationError('Ensure this field has at most 150 characters.')
+        except ValidationError as e:
+            errors['username'] = e.messages
+    if data['email'] and 'email' not in errors:
+        try:
+            validate_email(data['email'])
+        except ValidationError as e:
+            errors['email'] = e.messages
+    if data['password']:
+        try:
+            validate_password(data['password'], CustomUser(username=data['username'], email=data['email']))
+        except ValidationError as e:
+            errors['password'] = e.messages
+
+    return data, errors
+
+
+def hash_passwords(passwords, pool=None):
+    """
+    Hash passwords in a PasswordHasherPool, the web worker's by default
+
+    Empty passwords become unusable ones; those users set a password
+    through the reset flow.
+    """
+    passwords = [password or None for password in passwords]
+    return (pool or get_hasher_pool()).map(make_password, passwords)
+
+
+def _insert_users(users):
+    """
+    Insert users, falling back to one insert per user if the batch conflicts
+
+    Returns:
+        A tuple of (created users, {user: error message})
+    """
+    try:
+        with transaction.atomic():
+            return CustomUser.objects.bulk_create(users), {}
+    except IntegrityError:
+        pass
+
+    # A concurrent registration took a username or email from this chunk
+    created, failed = [], {}
+    for user in users:
+        try:
+            with transaction.atomic():
+                user.save(force_insert=True)
+            created.append(user)
+        except IntegrityError:
+            failed[user] = 'A user with this username or email already exists.'
+    return created, failed
+
+
+def _provision_chunk(rows, pool, created_by, ip_address):
+    results = {}
+    candidates = []
+    for number, row in rows:
+        data, errors = clean_row(row)
+        if errors:
+            results[number] = {'row': number, 'username': data['username'], 'status': 'failed', 'errors': errors}
+        else:
+            candidates.append((number, data))
+
+    # Uniqueness against the database, two queries per chunk
+    taken_usernames = set(CustomUser.objects.filter(
+        username__in=[data['username'] for _, data in candidates]
+    ).values_list('username', flat=True))
+    taken_emails = set(CustomUser.objects.filter(
+        email__in=[data['email'] for _, data in candidates]
+    ).values_list('email', flat=True))
+
+    accepted = []
+    for number, data in candidates:
+        errors = {}
+        if data['username'] in taken_usernames:
+            errors['username'] = ['A user with that username already exists.']
+        if data['email'] in taken_emails:
+            errors['email'] = ['A user with this email already exists.']
+        if errors:
+            results[number] = {'row': number, 'username': data['username'], 'status': 'failed', 'errors': errors}
+            continue
+        # Later rows in the same import cannot reuse these either
+        taken_usernames.add(data['username'])
+        taken_emails.add(data['email'])
+        accepted.append((number, data))
+
+    hashes = hash_passwords([data['password'] for _, data in accepted], pool)
+    users = {}
+    for (number, data), password in zip(accepted, hashes):
+        users[number] = CustomUser(
+            username=data['username'],
+            email=data['email'],
+            first_name=data['first_name'],
+            last_name=data['last_name'],
+            password=password,
+        )
+
+    created, failed = _insert_users(list(users.values()))
+    if created:
+        with transaction.atomic():
+            tokens = issue_tokens(created, 'email_verification')
+            queue_verification_emails(created, tokens)
+            UserActivity.objects.bulk_create([
+                UserActivity(
+                    user=user,
+                    activity_type='registration',
+                    ip_address=ip_address,
+                    additional_info={'created_by': created_by, 'bulk_import': True},
+                )
+                for user in created
+            ])
+
+    for number, user in users.items():
+        if user in failed:
+            results[number] = {
+                'row': number, 'username': user.username, 'status': 'failed',
+                'errors': {'non_field_errors': [failed[user]]},
+            }
+        else:
+            results[number] = {'row': number, 'username': user.username, 'status': 'created', 'id': str(user.pk)}
+    return [results[number] for number, _ in rows]
+
+
+def provision_users(rows, created_by=None, ip_address='127.0.0.1', chunk_size=None, processes=None):
+    """
+    Create users in bulk
+
+    Rows are validated, their passwords hashed in a process pool, and each
+    chunk is inserted with bulk_create together with its verification
+    tokens, queued verification emails and registration activity rows.
+
+    Args:
+        rows: An iterable of dicts with IMPORT_FIELDS keys
+        created_by: Username recorded in the registration activity
+        ip_address: Address recorded in the registration activity
+        chunk_size: Rows per insert, defaults to BULK_IMPORT_CHUNK_SIZE
+        processes: Run a dedicated hashing pool of this size; by default
+            the shared pool from get_hasher_pool() is used
+
+    Returns:
+        One result dict per row, in input order, with ``row`` (1-based),
+        ``username``, ``status`` ('created' or 'failed') and either ``id``
+        or ``errors``
+    """
+    chunk_size = chunk_size or settings.BULK_IMPORT_CHUNK_SIZE
+    pool = None
+    if processes is not None:
+        pool = PasswordHasherPool(processes=processes, timeout=settings.PASSWORD_HASHING_TIMEOUT)
+
+    report = []
+    try:
+        chunk = []
+        for number, row in enumerate(rows, 1):
+            chunk.append((number, row))
+            if len(chunk) >= chunk_size:
+                report.extend(_provision_chunk(chunk, pool, created_by, ip_address))
+                chunk = []
+        if chunk:
+            report.extend(_provision_chunk(chunk, pool, created_by, ip_address))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return report
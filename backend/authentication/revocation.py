@@ -0,0 +1,372 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils.module_loading import import_string
+from rest_framework_simplejwt.settings import api_settings
+
+from .metrics import REVOCATION_FALSE_POSITIVE_RATE
+from .models import RevokedToken
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings
+
+    Membership tests have no false negatives and a false positive rate of
+    about ``error_rate`` while fewer than ``capacity`` items are added.
+    """
+    def __init__(self, capacity=100000, error_rate=0.001):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        # Items that set at least one new bit, a close estimate of the
+        # number of distinct items added
+        self.count = 0
+
+    def _positions(self, item):
+        # Kirsch-Mitzenmacher: k positions from two halves of one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:], 'big') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        new = False
+        for position in self._positions(item):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                self.bits[position >> 3] |= mask
+                new = True
+        self.count += new
+
+    def false_positive_rate(self):
+        """
+        Expected false positive rate for the items added so far, which
+        exceeds ``error_rate`` once more than ``capacity`` were added
+        """
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationStore:
+    """
+    Set of revoked JWT ids with a local Bloom filter in front
+
+    A lookup for a jti the filter has never seen is answered in process
+    without touching the shared store; only filter hits (real revocations
+    and rare false positives) are confirmed against it. The filter is kept
+    in step with revocations made by other processes by pulling the ones
+    recorded since the last pull at most every ``sync_interval`` seconds,
+    which bounds how long another worker may still accept a revoked token.
+
+    Entries expire with the token they revoke. The filter cannot forget
+    single items, so it is split into two generations of ``window``
+    seconds (the longest token lifetime); the older one is dropped once
+    every token it describes has expired.
+
+    Each generation holds the revocations of one window, so ``capacity``
+    should be at least the peak revocation rate times the window. Past
+    that, filter hits and so store lookups grow quickly; the expected false
+    positive rate is exported after every sync.
+
+    Subclasses implement ``_add``, ``_exists`` and ``_fetch_since``.
+    """
+    # Pull a little further back than the last entry seen, in case clocks
+    # of the processes writing revocations disagree slightly
+    SYNC_OVERLAP = 5.0
+
+    def __init__(self, sync_interval=1.0, capacity=100000, error_rate=0.001, window=None,
+                 timer=time.time):
+        self.sync_interval = sync_interval
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.window = window or max(
+            api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME
+        ).total_seconds()
+        self.timer = timer
+        self._lock = threading.Lock()
+        self._current = BloomFilter(capacity, error_rate)
+        self._previous = BloomFilter(capacity, error_rate)
+        self._generation_started = timer()
+        self._synced_at = None
+        self._cursor = 0.0
+
+    @classmethod
+    def from_settings(cls):
+        window = max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME).total_seconds()
+        return cls(
+            sync_interval=settings.TOKEN_REVOCATION_SYNC_INTERVAL,
+            capacity=settings.TOKEN_REVOCATION_BLOOM_CAPACITY
+            or math.ceil(settings.TOKEN_REVOCATION_RATE * window),
+            window=window,
+        )
+
+    def revoke(self, jti, expires_at):
+        """
+        Revoke a token id until ``expires_at`` (a Unix timestamp)
+
+        Returns:
+            True if this call revoked it, False if it already was revoked.
+            Only one concurrent caller gets True, which makes this usable to
+            claim a refresh token for rotation.
+        """
+        now = self.timer()
+        revoked = self._add(jti, max(1, math.ceil(expires_at - now)), now)
+        with self._lock:
+            self._current.add(jti)
+        return revoked
+
+    def is_revoked(self, jti):
+        if self._is_stale():
+            self.sync()
+        if not self._might_contain(jti):
+            return False
+        return self._exists(jti)
+
+    def revoked_among(self, jtis):
+        """
+        Return the subset of ``jtis`` that is revoked, asking the shared
+        store once about all the filter hits
+        """
+        if self._is_stale():
+            self.sync()
+        candidates = [jti for jti in set(jtis) if self._might_contain(jti)]
+        return self._exists_many(candidates) if candidates else set()
+
+    async def ais_revoked(self, jti):
+        """
+        Async variant of ``is_revoked`` that only leaves the event loop when
+        the shared store has to be asked
+        """
+        if self._is_stale() or self._might_contain(jti):
+            return await sync_to_async(self.is_revoked)(jti)
+        return False
+
+    def sync(self):
+        """
+        Add revocations recorded by other processes to the local filter
+        """
+        now = self.timer()
+        entries = self._fetch_since(self._cursor - self.SYNC_OVERLAP)
+        with self._lock:
+            if now - self._generation_started >= self.window:
+                self._previous = self._current
+                self._current = BloomFilter(self.capacity, self.error_rate)
+                self._generation_started = now
+            for jti, revoked_at in entries:
+                self._current.add(jti)
+                self._cursor = max(self._cursor, revoked_at)
+            self._synced_at = now
+            REVOCATION_FALSE_POSITIVE_RATE.set(self.false_positive_rate())
+
+    def false_positive_rate(self):
+        """
+        Expected rate of filter hits for jtis that were never revoked
+        """
+        return 1 - (1 - self._current.false_positive_rate()) * (1 - self._previous.false_positive_rate())
+
+    def _is_stale(self):
+        return self._synced_at is None or self.timer() - self._synced_at >= self.sync_interval
+
+    def _might_contain(self, jti):
+        with self._lock:
+            return jti in self._current or jti in self._previous
+
+    def _add(self, jti, ttl, now):
+        raise NotImplementedError
+
+    def _exists(self, jti):
+        raise NotImplementedError
+
+    def _exists_many(self, jtis):
+        return {jti for jti in jtis if self._exists(jti)}
+
+    def _fetch_since(self, timestamp):
+        """
+        Return (jti, revoked at timestamp) pairs revoked after ``timestamp``
+        """
+        raise NotImplementedError
+
+
+class RedisRevocationStore(RevocationStore):
+    """
+    Revocations held in Redis
+
+    Each jti is a key that expires with its token, and a sorted set of
+    recent revocations lets every process catch up on the others. The set
+    is trimmed to the last ``window`` seconds on each write.
+    """
+    KEY_PREFIX = 'revoked_jti:'
+    LOG_KEY = 'revoked_jti_log'
+
+    # KEYS[1]: jti key; KEYS[2]: log; ARGV[1]: ttl (s); ARGV[2]: jti; ARGV[3]: window (s)
+    SCRIPT = """
+    if not redis.call('SET', KEYS[1], 1, 'NX', 'EX', ARGV[1]) then
+        return 0
+    end
+    local t = redis.call('TIME')
+    local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+    redis.call('ZADD', KEYS[2], now, ARGV[2])
+    redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now - tonumber(ARGV[3]))
+    return 1
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._client = None
+        self._script = None
+
+    def get_client(self):
+        if self._client is None:
+            from django_redis import get_redis_connection
+            self._client = get_redis_connection('default')
+            self._script = self._client.register_script(self.SCRIPT)
+        return self._client
+
+    def _add(self, jti, ttl, now):
+        self.get_client()
+        added = self._script(
+            keys=[self.KEY_PREFIX + jti, self.LOG_KEY],
+            args=[ttl, jti, int(self.window)],
+        )
+        return bool(added)
+
+    def _exists(self, jti):
+        return bool(self.get_client().exists(self.KEY_PREFIX + jti))
+
+    def _exists_many(self, jtis):
+        values = self.get_client().mget([self.KEY_PREFIX + jti for jti in jtis])
+        return {jti for jti, value in zip(jtis, values) if value is not None}
+
+    def _fetch_since(self, timestamp):
+        entries = self.get_client().zrangebyscore(self.LOG_KEY, f'({timestamp}', '+inf', withscores=True)
+        return [(jti.decode(), score) for jti, score in entries]
+
+
+class DatabaseRevocationStore(RevocationStore):
+    """
+    Revocations held in the RevokedToken table
+
+    A stand-in for deployments without Redis. Expired rows are removed by
+    the purge_expired_tokens command.
+    """
+    def _add(self, jti, ttl, now):
+        try:
+            with transaction.atomic():
+                RevokedToken.objects.create(
+                    jti=jti,
+                    revoked_at=datetime.fromtimestamp(now, dt_timezone.utc),
+                    expires_at=datetime.fromtimestamp(now + ttl, dt_timezone.utc),
+                )
+        except IntegrityError:
+            return False
+        return True
+
+    def _exists(self, jti):
+        return RevokedToken.objects.filter(
+            jti=jti, expires_at__gt=datetime.fromtimestamp(self.timer(), dt_timezone.utc)
+        ).exists()
+
+    def _exists_many(self, jtis):
+        return set(RevokedToken.objects.filter(
+            jti__in=jtis, expires_at__gt=datetime.fromtimestamp(self.timer(), dt_timezone.utc)
+        ).values_list('jti', flat=True))
+
+    def _fetch_since(self, timestamp):
+        since = datetime.fromtimestamp(max(timestamp, 0), dt_timezone.utc)
+        return [
+            (jti, revoked_at.timestamp())
+            for jti, revoked_at in RevokedToken.objects.filter(revoked_at__gt=since).values_list('jti', 'revoked_at')
+        ]
+
+
+class LocalRevocationStore(RevocationStore):
+    """
+    In-process revocations with the same semantics as the shared stores
+
+    Revocations are only seen by the process that made them, so this is
+    only suitable for tests and single process development servers.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._expiry = {}
+
+    def _add(self, jti, ttl, now):
+        with self._lock:
+            if self._expiry.get(jti, 0) > now:
+                return False
+            self._expiry[jti] = now + ttl
+            if len(self._expiry) > 10000:
+                # Drop entries whose tokens have expired
+                self._expiry = {k: v for k, v in self._expiry.items() if v > now}
+            return True
+
+    def _exists(self, jti):
+        return self._expiry.get(jti, 0) > self.timer()
+
+    def _fetch_since(self, timestamp):
+        return []
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_revocation_store():
+    """
+    Return the process-wide revocation store configured by TOKEN_REVOCATION_STORE
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = import_string(settings.TOKEN_REVOCATION_STORE).from_settings()
+    return _store
+
+
+def revoke_token(token):
+    """
+    Revoke a simplejwt token until it expires
+
+    Returns:
+        True if this call revoked it, False if it already was revoked
+    """
+    return get_revocation_store().revoke(token[api_settings.JTI_CLAIM], token['exp'])
+
+
+def is_token_revoked(token):
+    jti = token.get(api_settings.JTI_CLAIM)
+    return jti is not None and get_revocation_store().is_revoked(jti)
+
+
+async def ais_token_revoked(token):
+    jti = token.get(api_settings.JTI_CLAIM)
+    return jti is not None and await get_revocation_store().ais_revoked(jti)
+
+
+def purge_expired_revocations(batch_size=1000):
+    """
+    Delete RevokedToken rows whose tokens have expired, in batches
+
+    Returns:
+        The number of rows deleted
+    """
+    deleted = 0
+    now = datetime.now(dt_timezone.utc)
+    while True:
+        ids = list(
+            RevokedToken.objects.filter(expires_at__lte=now)
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+        count, _ = RevokedToken.objects.filter(id__in=ids).delete()
+        deleted += count
@@ -1,9 +1,12 @@
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
-from .models import CustomUser
+from .hashing import check_user_password, set_user_password
+from .instrumentation import TimedSerializerMixin
+from .models import CustomUser, UserSession
+from .profiles import PROFILE_FIELDS, serialize_profile
 
-class UserRegistrationSerializer(serializers.ModelSerializer):
+class UserRegistrationSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for user registration with password validation
     """
@@ -36,24 +39,41 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         """
         Create and return a new user instance
         """
-        # Remove password2 before creating user
-        validated_data.pop('password2')
-        
-        # Create user
-        user = CustomUser.objects.create_user(**validated_data)
+        # Hash in the pool rather than through create_user
+        user = CustomUser(
+            username=CustomUser.normalize_username(validated_data['username']),
+            email=CustomUser.objects.normalize_email(validated_data['email']),
+        )
+        set_user_password(user, validated_data['password'])
+        user.save()
         
         return user
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for viewing and updating user profile
+
+    Pass ``fields`` to only include a subset of the fields. The full
+    profile is rendered by serialize_profile, without building the fields.
     """
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.subset = fields is not None
+        if self.subset:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    def to_representation(self, instance):
+        if self.subset:
+            return super().to_representation(instance)
+        return serialize_profile(instance)
+
     class Meta:
         model = CustomUser
-        fields = ['id', 'username', 'email', 'first_name', 'last_name', 'bio', 'birth_date']
+        fields = list(PROFILE_FIELDS)
         read_only_fields = ['id', 'email']
 
-class PasswordChangeSerializer(serializers.Serializer):
+class PasswordChangeSerializer(TimedSerializerMixin, serializers.Serializer):
     """
     Serializer for password change endpoint
     """
@@ -70,7 +90,7 @@ class PasswordChangeSerializer(serializers.Serializer):
         Validate that the old password is correct
         """
         user = self.context['request'].user
-        if not user.check_password(value):
+        if not check_user_password(user, value):
             raise serializers.ValidationError("Old password is incorrect")
         return value
 
@@ -89,22 +109,35 @@ class PasswordChangeSerializer(serializers.Serializer):
         Update user's password
         """
         user = self.context['request'].user
-        user.set_password(self.validated_data['new_password'])
-        user.save()
+        set_user_password(user, self.validated_data['new_password'])
+        user.save(update_fields=['password'])
         return user
 
-class PasswordResetRequestSerializer(serializers.Serializer):
+class UserSessionSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    Serializer for listing a user's sessions
+    """
+    current = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UserSession
+        fields = ['id', 'ip_address', 'user_agent', 'created_at', 'last_seen_at', 'expires_at', 'current']
+
+    def get_current(self, session):
+        return session.id.hex == self.context.get('current_session_id')
+
+class PasswordResetRequestSerializer(TimedSerializerMixin, serializers.Serializer):
     """
     Serializer for password reset request
     """
     email = serializers.EmailField(required=True)
 
-    def validate_email(self, value):
+    def validate(self, attrs):
         """
-        Validate that the email exists in the system
+        Validate that the email exists in the system, keeping its user
         """
         try:
-            user = CustomUser.objects.get(email=value)
+            attrs['user'] = CustomUser.objects.get(email=attrs['email'])
         except CustomUser.DoesNotExist:
-            raise serializers.ValidationError("No user found with this email address")
-        return value
\ No newline at end of file
+            raise serializers.ValidationError({'email': "No user found with this email address"})
+        return attrs
\ No newline at end of file
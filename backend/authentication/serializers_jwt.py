@@ -1,29 +1,230 @@
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model, user_login_failed
+from rest_framework import exceptions, serializers
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import (
+    TokenObtainPairSerializer,
+    TokenRefreshSerializer,
+    TokenVerifySerializer,
+)
+from rest_framework_simplejwt.settings import api_settings
+
+from .hashing import acheck_user_password, ahash_password, check_user_password, hash_password
+from .instrumentation import TimedSerializerMixin
+from .lockout import check_lockout, clear_failures, register_failure
+from .metrics import LOGIN_ATTEMPTS
+from .revocation import is_token_revoked, revoke_token
+from .sessions import GENERATION_CLAIM, add_session_claim, is_current_generation, rotate_session
+from .signing import RefreshToken, UntypedToken
+from .user_cache import get_cached_user
+
+User = get_user_model()
+
+class CustomTokenObtainPairSerializer(TimedSerializerMixin, TokenObtainPairSerializer):
+    """
+    Token serializer that resolves the user once and reuses that instance
+    for authentication, token minting and the response payload
+
+    Accepts either a username or an email address. Unlike the stock
+    serializer it does not go through ``authenticate()`` (which would load
+    the user a second time) and it does not update ``last_login`` itself;
+    the login view folds that into its post-login bookkeeping. Locked out
+    accounts and addresses are refused before the user is loaded or any
+    password is hashed.
+
+    ``avalidate`` is the async equivalent of ``validate`` for the ASGI
+    login view. Each login starts a new session; its refresh token is left
+    on ``self.refresh`` for the view to register.
+    """
+    token_class = RefreshToken
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # Either the username or the email may be supplied
+        self.fields[self.username_field] = serializers.CharField(
+            write_only=True, required=False, allow_blank=True
+        )
+        self.fields['email'] = serializers.EmailField(
+            write_only=True, required=False, allow_blank=True
+        )
 
-class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     @classmethod
     def get_token(cls, user):
         token = super().get_token(user)
-        
+
         # Add custom claims
         token['username'] = user.username
         token['email'] = user.email
         token['is_staff'] = user.is_staff
         token['is_verified'] = user.is_verified
-        
+        token[GENERATION_CLAIM] = user.token_generation
+
         return token
-        
+
+    def get_credentials(self, attrs):
+        """
+        Return the lookup used to resolve the user, preferring the username
+        """
+        username = attrs.get(self.username_field)
+        if username:
+            return {self.username_field: username}
+        # Emails are stored lowercased, so an exact match can use the unique index
+        return {'email': attrs['email'].lower()}
+
+    def resolve_user(self, credentials):
+        """
+        Load the user matching the credentials with a single query
+        """
+        try:
+            return User.objects.get(**credentials)
+        except User.DoesNotExist:
+            return None
+
+    async def aresolve_user(self, credentials):
+        try:
+            return await User.objects.aget(**credentials)
+        except User.DoesNotExist:
+            return None
+
+    def check_identifier(self, attrs):
+        if not attrs.get(self.username_field) and not attrs.get('email'):
+            raise serializers.ValidationError({
+                self.username_field: 'Either username or email is required.'
+            })
+
     def validate(self, attrs):
-        data = super().validate(attrs)
-        
+        self.check_identifier(attrs)
+        credentials = self.get_credentials(attrs)
+        user = self.resolve_user(credentials)
+        check_lockout(credentials, self.context.get('request'), user)
+        password = attrs['password']
+        self.user = None
+
+        if user is None:
+            # Run the default password hasher once to reduce the timing
+            # difference between existing and nonexistent users (#20760)
+            hash_password(password)
+        elif check_user_password(user, password) and api_settings.USER_AUTHENTICATION_RULE(user):
+            self.user = user
+
+        if self.user is None:
+            self.login_failed(credentials, user)
+        clear_failures(credentials, user)
+        return self.get_payload(self.user)
+
+    async def avalidate(self, attrs):
+        self.check_identifier(attrs)
+        credentials = self.get_credentials(attrs)
+        user = await self.aresolve_user(credentials)
+        # Lockout backends talk to Redis synchronously, like the throttles
+        await sync_to_async(check_lockout)(credentials, self.context.get('request'), user)
+        password = attrs['password']
+        self.user = None
+
+        if user is None:
+            await ahash_password(password)
+        elif await acheck_user_password(user, password) and api_settings.USER_AUTHENTICATION_RULE(user):
+            self.user = user
+
+        if self.user is None:
+            # The failure receivers write to the database
+            await sync_to_async(self.login_failed)(credentials, user)
+        await sync_to_async(clear_failures)(credentials, user)
+        return self.get_payload(self.user)
+
+    def login_failed(self, credentials, user=None):
+        LOGIN_ATTEMPTS.labels(outcome='failure').inc()
+        request = self.context.get('request')
+        register_failure(credentials, request, user)
+        # ``user`` is the account whose password was wrong, if it exists
+        user_login_failed.send(
+            sender=__name__,
+            credentials=credentials,
+            request=request,
+            user=user,
+        )
+        raise exceptions.AuthenticationFailed(
+            self.error_messages['no_active_account'],
+            'no_active_account',
+        )
+
+    def get_payload(self, user):
+        refresh = self.get_token(user)
+        add_session_claim(refresh)
+        self.refresh = refresh
+
         # Add user info to response
-        user = self.user
-        data['user'] = {
-            'id': str(user.id),
-            'username': user.username,
-            'email': user.email,
-            'is_staff': user.is_staff,
-            'is_verified': user.is_verified
+        return {
+            'refresh': str(refresh),
+            'access': str(refresh.access_token),
+            'user': {
+                'id': str(user.id),
+                'username': user.username,
+                'email': user.email,
+                'is_staff': user.is_staff,
+                'is_verified': user.is_verified
+            },
         }
-        
-        return data
\ No newline at end of file
+
+
+class RevocableTokenRefreshSerializer(TimedSerializerMixin, TokenRefreshSerializer):
+    """
+    Refresh serializer that honours the token revocation store
+
+    With rotation the old refresh token is revoked before the new pair is
+    issued. Revoking is an atomic claim, so a refresh token can only be
+    exchanged once even when two requests race with it. Tokens from an
+    older token generation of the user, or whose session was ended, are
+    refused.
+    """
+    token_class = RefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+
+        user = get_cached_user(refresh[api_settings.USER_ID_CLAIM])
+        if user is None or not user.is_active or not is_current_generation(refresh, user):
+            raise TokenError('Token is invalid or expired')
+
+        if api_settings.ROTATE_REFRESH_TOKENS and api_settings.BLACKLIST_AFTER_ROTATION:
+            if not revoke_token(refresh):
+                raise TokenError('Token is blacklisted')
+        elif is_token_revoked(refresh):
+            raise TokenError('Token is blacklisted')
+
+        data = {'access': str(refresh.access_token)}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            if not rotate_session(refresh):
+                raise TokenError('Token is blacklisted')
+            data['refresh'] = str(refresh)
+        return data
+
+
+class RevocableTokenVerifySerializer(TimedSerializerMixin, TokenVerifySerializer):
+    """
+    Verify serializer that also rejects revoked tokens
+    """
+    def validate(self, attrs):
+        token = UntypedToken(attrs['token'])
+        if is_token_revoked(token):
+            raise TokenError('Token is blacklisted')
+        return {}
+
+
+class TokenIntrospectionSerializer(TimedSerializerMixin, serializers.Serializer):
+    """
+    Serializer for a batch of tokens to introspect
+    """
+    tokens = serializers.ListField(child=serializers.CharField(), allow_empty=False)
+
+    def validate_tokens(self, value):
+        if len(value) > settings.TOKEN_INTROSPECTION_MAX_TOKENS:
+            raise serializers.ValidationError(
+                f'At most {settings.TOKEN_INTROSPECTION_MAX_TOKENS} tokens per request'
+            )
+        return value
@@ -0,0 +1,139 @@
+import uuid
+from datetime import datetime, timezone as dt_timezone
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import UserSession
+from .revocation import get_revocation_store
+from .user_cache import invalidate_cached_user
+
+# Claims added to the tokens minted by CustomTokenObtainPairSerializer
+GENERATION_CLAIM = 'gen'
+SESSION_CLAIM = 'sid'
+
+
+def _expiry(token):
+    return datetime.fromtimestamp(token['exp'], dt_timezone.utc)
+
+
+def add_session_claim(token):
+    """
+    Give a refresh token a new session id, inherited by its access tokens
+    and by the refresh tokens rotated from it
+    """
+    token[SESSION_CLAIM] = uuid.uuid4().hex
+
+
+def is_current_generation(token, user):
+    """
+    Whether a token was issued since the user's sessions were last ended
+
+    Tokens minted without the claim count as generation 0.
+    """
+    return token.get(GENERATION_CLAIM, 0) == user.token_generation
+
+
+def open_session(user, refresh, ip_address=None, user_agent=''):
+    """
+    Register the session of a refresh token issued at login
+    """
+    return UserSession.objects.create(
+        id=refresh[SESSION_CLAIM],
+        user=user,
+        generation=refresh.get(GENERATION_CLAIM, 0),
+        refresh_jti=refresh[api_settings.JTI_CLAIM],
+        ip_address=ip_address,
+        user_agent=user_agent[:255],
+        expires_at=_expiry(refresh),
+    )
+
+
+def rotate_session(refresh):
+    """
+    Point a session at the refresh token rotated into it
+
+    Returns:
+        False if the session has been ended, in which case the token must
+        not be handed out. Tokens without a session id are always accepted.
+    """
+    session_id = refresh.get(SESSION_CLAIM)
+    if session_id is None:
+        return True
+    # The row lock taken here orders this against end_session
+    updated = UserSession.objects.filter(pk=session_id, ended_at__isnull=True).update(
+        refresh_jti=refresh[api_settings.JTI_CLAIM],
+        expires_at=_expiry(refresh),
+        last_seen_at=timezone.now(),
+    )
+    return updated == 1
+
+
+def end_session(user, session_id):
+    """
+    End one of a user's sessions and revoke its current refresh token
+
+    Returns:
+        True if the session was live
+    """
+    with transaction.atomic():
+        session = (
+            UserSession.objects.select_for_update()
+            .filter(pk=session_id, user=user, ended_at__isnull=True)
+            .first()
+        )
+        if session is None:
+            return False
+        session.ended_at = timezone.now()
+        session.save(update_fields=['ended_at'])
+    get_revocation_store().revoke(session.refresh_jti, session.expires_at.timestamp())
+    return True
+
+
+def end_all_sessions(user):
+    """
+    End every session of a user with a single counter update
+
+    Tokens carrying an older generation are refused from then on: refresh
+    tokens by the refresh endpoint, access tokens by CachedJWTAuthentication
+    as soon as the user is reloaded, which dropping the cached copy forces.
+    The copy is dropped once the increment commits, so a request served in
+    between cannot cache the old generation again.
+    """
+    get_user_model().objects.filter(pk=user.pk).update(token_generation=F('token_generation') + 1)
+    user.token_generation += 1
+    invalidate_cached_user(user.pk)
+
+
+def live_sessions(user):
+    return UserSession.objects.filter(
+        user=user,
+        generation=user.token_generation,
+        ended_at__isnull=True,
+        expires_at__gt=timezone.now(),
+    ).order_by('-last_seen_at')
+
+
+def purge_dead_sessions(batch_size=1000):
+    """
+    Delete sessions that have ended, expired or been superseded by a newer
+    token generation, in batches
+
+    Returns:
+        The number of rows deleted
+    """
+    deleted = 0
+    dead = (
+        Q(expires_at__lte=timezone.now())
+        | Q(ended_at__isnull=False)
+        | Q(generation__lt=F('user__token_generation'))
+    )
+    while True:
+        ids = list(UserSession.objects.filter(dead).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        count, _ = UserSession.objects.filter(id__in=ids).delete()
+        deleted += count
@@ -1,58 +1,7 @@
-from django.db.models.signals import post_save, pre_save
-from django.dispatch import receiver
-from django.contrib.auth import get_user_model
-from django.utils.crypto import get_random_string
-
+from .audit import log_login_attempt
 from .models import LoginAttempt, UserActivity
-
-User = get_user_model()
-
-@receiver(post_save, sender=User)
-def create_user_profile(sender, instance, created, **kwargs):
-    """
-    Create additional user-related records on user creation
-    """
-    if created:
-        # Generate email verification token
-        instance.email_verification_token = get_random_string(length=32)
-        instance.save()
-
-        # Optional: Send verification email
-        try:
-            from django.core.mail import send_mail
-            from django.conf import settings
-
-            verification_link = f"{settings.FRONTEND_URL}/verify-email?token={instance.email_verification_token}"
-            send_mail(
-                'Verify Your Email',
-                f'Click the link to verify your email: {verification_link}',
-                settings.DEFAULT_FROM_EMAIL,
-                [instance.email],
-                fail_silently=False,
-            )
-        except Exception as e:
-            # Log email sending failure
-            print(f"Failed to send verification email: {e}")
-
-@receiver(pre_save, sender=User)
-def track_username_change(sender, instance, **kwargs):
-    """
-    Track username changes
-    """
-    try:
-        old_instance = User.objects.get(pk=instance.pk)
-        if old_instance.username != instance.username:
-            UserActivity.objects.create(
-                user=instance,
-                activity_type='profile_update',
-                additional_info={
-                    'old_username': old_instance.username,
-                    'new_username': instance.username
-                }
-            )
-    except User.DoesNotExist:
-        # This is a new user, no previous username to compare
-        pass
+from .profiles import invalidate_cached_profile, refresh_cached_profile
+from .utils import get_client_ip
 
 def log_successful_login(sender, user, request, **kwargs):
     """
@@ -79,14 +28,30 @@ def log_successful_login(sender, user, request, **kwargs):
         ip_address=ip
     )
 
-def log_failed_login(sender, credentials, **kwargs):
+def log_failed_login(sender, credentials, request=None, user=None, **kwargs):
     """
     Log failed login attempt
+
+    Connected to ``user_login_failed`` in AuthenticationConfig.ready. The
+    row goes through the audit log writer, which batches inserts when
+    AUDIT_LOG_ASYNC is enabled. CustomTokenObtainPairSerializer passes the
+    account whose password was wrong as ``user``.
     """
-    # This method would typically be connected to a signal from the authentication backend
-    # For demonstration, you'd need to implement this in your custom authentication backend
-    LoginAttempt.objects.create(
-        user=None,  # No user for failed login
-        ip_address=None,  # You'd need to track this from the request
-        successful=False
-    )
\ No newline at end of file
+    if request is None:
+        # Nothing to attribute the attempt to, e.g. authenticate() in a shell
+        return
+    log_login_attempt(user=user, ip_address=get_client_ip(request), successful=False)
+
+def update_cached_profile(sender, instance, update_fields=None, **kwargs):
+    """
+    Keep the cached profile read model in step with saved users
+
+    Connected to ``post_save`` of the user model in AuthenticationConfig.ready.
+    """
+    refresh_cached_profile(instance, update_fields)
+
+def drop_cached_profile(sender, instance, **kwargs):
+    """
+    Drop the cached profile of a deleted user
+    """
+    invalidate_cached_profile(instance.pk)
@@ -0,0 +1,398 @@
+import base64
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import jwt
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.translation import gettext_lazy as _
+from django.views.decorators.http import condition, require_GET
+from jwt import InvalidTokenError
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.backends import TokenBackend
+from rest_framework_simplejwt.exceptions import TokenBackendError
+from rest_framework_simplejwt.settings import api_settings
+
+from .crypto import derive_password
+from .models import SigningKey
+
+# Algorithms a key ring key can be generated for
+ALGORITHMS = ('RS256', 'EdDSA')
+
+# Activation time of the first key of an empty ring. Every process that
+# finds the ring empty creates its key with this activation time, so the
+# unique constraint lets only one of them succeed.
+FIRST_KEY_ACTIVATED_AT = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def private_key_password():
+    return derive_password('authentication.signing')
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def generate_signing_key(algorithm, activated_at=None):
+    """
+    Create a key pair for the key ring
+
+    The key id is the RFC 7638 thumbprint of the public key, and the
+    private key is stored encrypted with private_key_password().
+
+    Args:
+        algorithm: One of ALGORITHMS
+        activated_at: When the key starts signing, defaults to now
+    """
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+
+    if algorithm == 'RS256':
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=settings.JWT_RSA_KEY_SIZE)
+        numbers = private_key.public_key().public_numbers()
+        jwk = {
+            'kty': 'RSA',
+            'n': _b64(numbers.n.to_bytes((numbers.n.bit_length() + 7) // 8, 'big')),
+            'e': _b64(numbers.e.to_bytes((numbers.e.bit_length() + 7) // 8, 'big')),
+        }
+    elif algorithm == 'EdDSA':
+        private_key = ed25519.Ed25519PrivateKey.generate()
+        raw = private_key.public_key().public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+        jwk = {'kty': 'OKP', 'crv': 'Ed25519', 'x': _b64(raw)}
+    else:
+        raise ValueError(f'Unsupported algorithm {algorithm!r}, use one of: {", ".join(ALGORITHMS)}')
+
+    # The thumbprint covers the required members in lexicographic order
+    kid = _b64(hashlib.sha256(json.dumps(jwk, sort_keys=True, separators=(',', ':')).encode()).digest())
+    jwk.update(kid=kid, alg=algorithm, use='sig')
+    pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.BestAvailableEncryption(private_key_password()),
+    )
+    return SigningKey.objects.create(
+        kid=kid,
+        algorithm=algorithm,
+        private_key=pem.decode(),
+        public_jwk=jwk,
+        activated_at=activated_at or timezone.now(),
+    )
+
+
+def create_first_key(algorithm=None):
+    """
+    Create the key of an empty ring, unless another process just did
+
+    Returns:
+        The new key, or None if another process created it first
+    """
+    try:
+        with transaction.atomic():
+            return generate_signing_key(algorithm or settings.JWT_SIGNING_ALGORITHM, FIRST_KEY_ACTIVATED_AT)
+    except IntegrityError:
+        return None
+
+
+def verification_period():
+    """
+    How long a superseded key must keep verifying the tokens it signed
+    """
+    lifetime = max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME)
+    return lifetime + get_token_backend().get_leeway()
+
+
+def rotate_signing_keys(algorithm=None, force=False, now=None):
+    """
+    Schedule a new signing key once the current one is due for rotation,
+    and delete keys that can no longer verify any live token
+
+    The new key is published in the JWKS for JWT_KEY_PUBLISH_AHEAD_SECONDS
+    before it starts signing, so services caching the key set know it
+    before they see a token signed with it.
+
+    Returns:
+        A tuple of (the new key or None, number of keys deleted)
+    """
+    now = now or timezone.now()
+    keys = list(SigningKey.objects.all())
+    active = [key for key in keys if key.activated_at <= now]
+    pending = [key for key in keys if key.activated_at > now]
+    current = max(active, key=lambda key: key.activated_at, default=None)
+
+    new_key = None
+    due = current is None or now - current.activated_at >= timedelta(days=settings.JWT_KEY_ROTATION_DAYS)
+    if (force or due) and not pending:
+        if current is None:
+            new_key = create_first_key(algorithm)
+        else:
+            activated_at = now + timedelta(seconds=settings.JWT_KEY_PUBLISH_AHEAD_SECONDS)
+            new_key = generate_signing_key(algorithm or settings.JWT_SIGNING_ALGORITHM, activated_at)
+
+    # A key is superseded when the next one starts signing
+    expired = []
+    for key, successor in zip(active, active[1:]):
+        if successor.activated_at + verification_period() <= now:
+            expired.append(key.pk)
+    deleted, _ = SigningKey.objects.filter(pk__in=expired).delete()
+    return new_key, deleted
+
+
+class KeyRing:
+    """
+    In-process copy of the SigningKey table
+
+    Keys are reloaded every ``refresh_interval`` seconds, and early when a
+    token names an unknown key id, so keys rotated by another process are
+    picked up. New keys are published well ahead of signing, so the early
+    reload is only needed when the very first key is created.
+    """
+    # Minimum seconds between reloads triggered by unknown key ids
+    MISS_RELOAD_INTERVAL = 1.0
+
+    def __init__(self, refresh_interval=60.0, timer=time.monotonic):
+        self.refresh_interval = refresh_interval
+        self.timer = timer
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self._keys = {}
+        self._private_keys = {}
+        self._public_keys = {}
+        self._loaded_at = None
+        self.jwks = b'{"keys": []}'
+        self.jwks_etag = None
+
+    def load(self):
+        keys = list(SigningKey.objects.order_by('activated_at'))
+        jwks = json.dumps({'keys': [key.public_jwk for key in keys]}).encode()
+        with self._lock:
+            self._keys = {key.kid: key for key in keys}
+            self._private_keys = {kid: pk for kid, pk in self._private_keys.items() if kid in self._keys}
+            self._public_keys = {kid: pk for kid, pk in self._public_keys.items() if kid in self._keys}
+            self.jwks = jwks
+            self.jwks_etag = '"%s"' % hashlib.sha256(jwks).hexdigest()[:32]
+            self._loaded_at = self.timer()
+
+    def needs_load(self, kid=None):
+        if self._loaded_at is None or self.timer() - self._loaded_at >= self.refresh_interval:
+            return True
+        return (
+            kid is not None and kid not in self._keys
+            and self.timer() - self._loaded_at >= self.MISS_RELOAD_INTERVAL
+        )
+
+    def current_key(self):
+        now = timezone.now()
+        active = [key for key in self._keys.values() if key.activated_at <= now]
+        return max(active, key=lambda key: key.activated_at, default=None)
+
+    def signing_key(self):
+        """
+        Return the key that signs new tokens, creating the first one if the
+        ring is empty
+        """
+        if self.needs_load():
+            self.load()
+        key = self.current_key()
+        if key is None:
+            create_first_key()
+            self.load()
+            key = self.current_key()
+        return key
+
+    def verifying_key(self, kid):
+        if self.needs_load(kid):
+            self.load()
+        return self._keys.get(kid)
+
+    def get_private_key(self, key):
+        if key.kid not in self._private_keys:
+            from cryptography.hazmat.primitives import serialization
+            self._private_keys[key.kid] = serialization.load_pem_private_key(
+                key.private_key.encode(), private_key_password(),
+            )
+        return self._private_keys[key.kid]
+
+    def get_public_key(self, key):
+        if key.kid not in self._public_keys:
+            self._public_keys[key.kid] = jwt.PyJWK(key.public_jwk).key
+        return self._public_keys[key.kid]
+
+    async def aprepare(self, kid=None, signing=False):
+        """
+        Do any reload (and first key creation) a token operation will need
+        on a worker thread, so it does not query the database from the
+        event loop
+        """
+        if self.needs_load(kid) or (signing and self.current_key() is None):
+            await sync_to_async(self.signing_key if signing else self.load)()
+
+
+class KeyRingTokenBackend(TokenBackend):
+    """
+    Token backend that signs with the current key ring key and puts its id
+    in the ``kid`` header
+
+    Tokens are verified with the public key they name. Tokens without a
+    ``kid`` are checked as HS256 tokens signed with SIGNING_KEY while
+    JWT_ACCEPT_LEGACY_HS256 is set, so tokens issued before the switch keep
+    working until they expire.
+    """
+    def __init__(self, ring):
+        super().__init__(
+            'HS256',
+            api_settings.SIGNING_KEY,
+            audience=api_settings.AUDIENCE,
+            issuer=api_settings.ISSUER,
+            leeway=api_settings.LEEWAY,
+            json_encoder=api_settings.JSON_ENCODER,
+        )
+        self.ring = ring
+
+    def encode(self, payload):
+        key = self.ring.signing_key()
+        jwt_payload = payload.copy()
+        if self.audience is not None:
+            jwt_payload['aud'] = self.audience
+        if self.issuer is not None:
+            jwt_payload['iss'] = self.issuer
+        return jwt.encode(
+            jwt_payload,
+            self.ring.get_private_key(key),
+            algorithm=key.algorithm,
+            headers={'kid': key.kid},
+            json_encoder=self.json_encoder,
+        )
+
+    def decode(self, token, verify=True):
+        try:
+            kid = jwt.get_unverified_header(token).get('kid')
+        except InvalidTokenError as ex:
+            raise TokenBackendError(_('Token is invalid or expired')) from ex
+
+        if kid is None:
+            if settings.JWT_ACCEPT_LEGACY_HS256:
+                return super().decode(token, verify=verify)
+            raise TokenBackendError(_('Token is invalid or expired'))
+
+        key = self.ring.verifying_key(kid)
+        if key is None:
+            raise TokenBackendError(_('Token is invalid or expired'))
+        try:
+            return jwt.decode(
+                token,
+                self.ring.get_public_key(key),
+                algorithms=[key.algorithm],
+                audience=self.audience,
+                issuer=self.issuer,
+                leeway=self.get_leeway(),
+                options={
+                    'verify_aud': self.audience is not None,
+                    'verify_signature': verify,
+                },
+            )
+        except InvalidTokenError as ex:
+            raise TokenBackendError(_('Token is invalid or expired')) from ex
+
+
+_ring = None
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_key_ring():
+    """
+    Return the process-wide key ring
+    """
+    global _ring
+    if _ring is None:
+        with _backend_lock:
+            if _ring is None:
+                _ring = KeyRing(refresh_interval=settings.JWT_KEY_RING_REFRESH_SECONDS)
+    return _ring
+
+
+def get_token_backend():
+    """
+    Return the token backend for JWT_SIGNING_ALGORITHM
+
+    With HS256 this is simplejwt's own backend, configured by SIMPLE_JWT.
+    """
+    global _backend
+    if _backend is None:
+        if settings.JWT_SIGNING_ALGORITHM == 'HS256':
+            from rest_framework_simplejwt.state import token_backend
+            backend = token_backend
+        else:
+            backend = KeyRingTokenBackend(get_key_ring())
+        with _backend_lock:
+            if _backend is None:
+                _backend = backend
+    return _backend
+
+
+async def aprepare_token_backend(raw_token=None, signing=False):
+    """
+    Let async code sign or verify a token without blocking on the database
+    """
+    backend = get_token_backend()
+    if not isinstance(backend, KeyRingTokenBackend):
+        return
+    kid = None
+    if raw_token is not None:
+        try:
+            kid = jwt.get_unverified_header(raw_token).get('kid')
+        except InvalidTokenError:
+            pass
+    await backend.ring.aprepare(kid, signing=signing)
+
+
+class KeyRingTokenMixin:
+    """
+    Sign and verify through get_token_backend instead of simplejwt's
+    module level backend
+    """
+    @property
+    def token_backend(self):
+        return get_token_backend()
+
+
+class AccessToken(KeyRingTokenMixin, tokens.AccessToken):
+    pass
+
+
+class RefreshToken(KeyRingTokenMixin, tokens.RefreshToken):
+    access_token_class = AccessToken
+
+
+class UntypedToken(KeyRingTokenMixin, tokens.UntypedToken):
+    pass
+
+
+def _jwks_etag(request):
+    ring = get_key_ring()
+    if ring.needs_load():
+        ring.load()
+    return ring.jwks_etag
+
+
+@require_GET
+@condition(etag_func=_jwks_etag)
+def jwks_view(request):
+    """
+    Public keys of the key ring as a JSON Web Key Set
+
+    The body only changes on rotation, so clients may cache it for
+    JWKS_MAX_AGE seconds and revalidate it with If-None-Match.
+    """
+    response = HttpResponse(get_key_ring().jwks, content_type='application/json')
+    patch_cache_control(response, public=True, max_age=settings.JWKS_MAX_AGE)
+    return response
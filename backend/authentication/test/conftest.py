@@ -1,6 +1,64 @@
+import time
+
 import pytest
 from rest_framework.test import APIClient
-from authentication.models import CustomUser
+from authentication.models import CustomUser, SigningKey
+from authentication.lockout import LocalLockoutBackend, get_lockout_backend
+from authentication.signing import get_key_ring
+from authentication.throttles import LocalThrottleBackend, get_throttle_backend
+
+class FakeTimer:
+    """Manually advanced clock, starting at the current time"""
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def fake_timer():
+    """Clock for backends that take a ``timer``, advanced by setting ``now``"""
+    return FakeTimer()
+
+@pytest.fixture(autouse=True)
+def reset_throttles():
+    """Start every test with empty rate limit counters"""
+    backend = get_throttle_backend()
+    if isinstance(backend, LocalThrottleBackend):
+        backend.reset()
+
+@pytest.fixture(autouse=True)
+def reset_lockouts():
+    """Start every test without failed login counters"""
+    backend = get_lockout_backend()
+    if isinstance(backend, LocalLockoutBackend):
+        backend.reset()
+
+# Columns of the first generated signing key, reused by later tests
+_signing_key_fields = {}
+
+@pytest.fixture(autouse=True)
+def signing_key(request):
+    """Give database tests a loaded signing key, so loading the key ring
+    does not count against the first request's query budget; one RSA key
+    is generated per session and copied into each test's database"""
+    ring = get_key_ring()
+    ring.reset()
+    marker = request.node.get_closest_marker('django_db')
+    if marker is not None:
+        request.getfixturevalue('transactional_db' if marker.kwargs.get('transaction') else 'db')
+        if _signing_key_fields:
+            SigningKey.objects.create(**_signing_key_fields)
+        key = ring.signing_key()
+        if not _signing_key_fields:
+            _signing_key_fields.update(
+                (name, getattr(key, name)) for name in ('kid', 'algorithm', 'private_key', 'public_jwk', 'activated_at')
+            )
+
+@pytest.fixture(autouse=True)
+def strict_query_budgets(settings):
+    """Fail any request that exceeds its view's query budget"""
+    settings.QUERY_BUDGET_STRICT = True
 
 @pytest.fixture
 def api_client():
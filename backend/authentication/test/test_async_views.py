@@ -0,0 +1,97 @@
+import pytest
+from asgiref.sync import async_to_sync
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.urls import reverse
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from authentication.middleware import TwoFactorMiddleware
+from authentication.models import CustomUser, UserActivity
+from authentication.one_time_tokens import issue_token
+
+
+@pytest.mark.django_db
+@pytest.mark.urls('authentication.async_urls')
+class TestAsyncViews:
+    def test_login(self, api_client, regular_user):
+        """Test that the async login view returns tokens and records the login"""
+        response = api_client.post(reverse('token_obtain_pair'), {
+            'username': 'testuser',
+            'password': 'Test@123'
+        }, format='json')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert 'access' in response.json()
+        assert response.json()['user']['username'] == 'testuser'
+        regular_user.refresh_from_db()
+        assert regular_user.last_login is not None
+
+    def test_login_failure(self, api_client, regular_user):
+        """Test that wrong credentials get the same 401 as the sync view"""
+        response = api_client.post(reverse('token_obtain_pair'), {
+            'username': 'testuser',
+            'password': 'WrongPassword'
+        }, format='json')
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+        assert response['WWW-Authenticate'] == 'Bearer realm="api"'
+
+    def test_login_requires_identifier(self, api_client):
+        """Test that a login without username or email is rejected"""
+        response = api_client.post(reverse('token_obtain_pair'), {'password': 'x'}, format='json')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'username' in response.json()
+
+    def test_refresh(self, api_client, regular_user):
+        """Test that the async refresh view issues an access token"""
+        refresh = RefreshToken.for_user(regular_user)
+        response = api_client.post(reverse('token_refresh'), {'refresh': str(refresh)}, format='json')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert 'access' in response.json()
+
+    def test_verify_email(self, api_client, regular_user):
+        """Test that the async view redeems a verification token"""
+        regular_user.is_verified = False
+        regular_user.save()
+        token = issue_token(regular_user, 'email_verification')
+
+        response = api_client.post(reverse('verify-email'), {'token': token}, format='json')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert CustomUser.objects.get(pk=regular_user.pk).is_verified
+        assert UserActivity.objects.filter(user=regular_user, activity_type='email_verification').exists()
+
+    def test_verify_2fa_requires_authentication(self, api_client):
+        """Test that the async 2FA view rejects anonymous requests"""
+        response = api_client.post(reverse('verify-2fa'), {'token': '123456'}, format='json')
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_get_not_allowed(self, api_client):
+        """Test that the async views only accept POST"""
+        response = api_client.get(reverse('token_refresh'))
+
+        assert response.status_code == status.HTTP_405_METHOD_NOT_ALLOWED
+
+
+@pytest.mark.django_db(transaction=True)
+class TestAsyncTwoFactorMiddleware:
+    def test_attaches_state(self, settings, regular_user):
+        """Test that the async middleware path validates the token and loads the 2FA state"""
+        settings.TWO_FACTOR_ENABLED = True
+
+        async def get_response(request):
+            return HttpResponse()
+
+        middleware = TwoFactorMiddleware(get_response)
+        token = RefreshToken.for_user(regular_user).access_token
+        request = RequestFactory().get('/api/auth/users/', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+        async_to_sync(middleware)(request)
+
+        user, _ = request._cached_jwt_auth
+        assert user.pk == regular_user.pk
+        assert request.two_factor_state == {'enabled': False, 'has_confirmed_device': False}
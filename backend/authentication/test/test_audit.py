@@ -0,0 +1,88 @@
+import pytest
+from datetime import datetime, timezone
+from authentication.audit import AuditLogWriter
+from authentication.partitions import add_months, expire_partitions, month_start
+from authentication.models import CustomUser, LoginAttempt, UserActivity
+
+@pytest.fixture
+def user():
+    return CustomUser.objects.create_user(
+        username='audituser',
+        email='audit@example.com',
+        password='Audit@123'
+    )
+
+@pytest.fixture
+def buffered_writer(monkeypatch):
+    """A buffered writer whose queue is only drained by explicit flushes"""
+    writer = AuditLogWriter(enabled=True, batch_size=10, max_queue_size=2, enqueue_timeout=0)
+    monkeypatch.setattr(writer, '_ensure_worker', lambda: None)
+    return writer
+
+@pytest.mark.django_db
+class TestAuditLogWriter:
+    """Test the buffered audit log writer"""
+
+    def test_disabled_writer_writes_inline(self, user):
+        """Test that rows are written immediately when buffering is off"""
+        writer = AuditLogWriter(enabled=False)
+        writer.write(UserActivity(user=user, activity_type='login', ip_address='127.0.0.1'))
+
+        assert UserActivity.objects.filter(user=user, activity_type='login').exists()
+
+    def test_rows_are_buffered_until_flush(self, user, buffered_writer):
+        """Test that buffered rows are bulk inserted on flush"""
+        buffered_writer.write(UserActivity(user=user, activity_type='login', ip_address='127.0.0.1'))
+        buffered_writer.write(LoginAttempt(user=user, ip_address='127.0.0.1', successful=True))
+
+        assert not UserActivity.objects.filter(user=user).exists()
+        assert not LoginAttempt.objects.filter(user=user).exists()
+
+        buffered_writer.flush()
+
+        assert UserActivity.objects.filter(user=user, activity_type='login').exists()
+        assert LoginAttempt.objects.filter(user=user, successful=True).exists()
+
+    def test_sensitive_rows_bypass_buffer(self, user, buffered_writer):
+        """Test that sensitive rows are written before returning"""
+        buffered_writer.write(
+            UserActivity(user=user, activity_type='password_change', ip_address='127.0.0.1'),
+            sensitive=True
+        )
+
+        assert UserActivity.objects.filter(user=user, activity_type='password_change').exists()
+        assert buffered_writer.queue.empty()
+
+    def test_full_queue_writes_inline(self, user, buffered_writer):
+        """Test that backpressure falls back to an inline write"""
+        for _ in range(3):
+            buffered_writer.write(LoginAttempt(user=user, ip_address='127.0.0.1', successful=False))
+
+        # Two rows fit in the queue, the third is written immediately
+        assert LoginAttempt.objects.filter(user=user).count() == 1
+
+        buffered_writer.flush()
+        assert LoginAttempt.objects.filter(user=user).count() == 3
+
+@pytest.mark.django_db
+class TestAuditRetention:
+    """Test the audit log retention policy"""
+
+    def test_expire_deletes_old_rows(self, user):
+        """Test rows older than the retention period are removed"""
+        now = datetime(2026, 10, 17, tzinfo=timezone.utc)
+        UserActivity.objects.create(user=user, activity_type='login', ip_address='127.0.0.1',
+                                    timestamp=datetime(2025, 9, 30, tzinfo=timezone.utc))
+        UserActivity.objects.create(user=user, activity_type='login', ip_address='127.0.0.1',
+                                    timestamp=datetime(2025, 10, 1, tzinfo=timezone.utc))
+
+        results = dict(expire_partitions(12, now=now))
+
+        assert results['authentication_useractivity'] == 1
+        assert UserActivity.objects.get().timestamp.month == 10
+
+    def test_add_months(self):
+        """Test month arithmetic across year boundaries"""
+        month = month_start(datetime(2026, 11, 17, 8, tzinfo=timezone.utc))
+        assert add_months(month, 2) == datetime(2027, 1, 1, tzinfo=timezone.utc)
+        assert add_months(month, -11) == datetime(2025, 12, 1, tzinfo=timezone.utc)
@@ -1,11 +1,21 @@
+import base64
+import json
+
 import pytest
+from django.core.cache import cache
 from django.urls import reverse
-from rest_framework.test import APIClient
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
 from rest_framework import status
 import uuid
-from django.utils.crypto import get_random_string
-from authentication.models import CustomUser, LoginAttempt, UserActivity, TOTPDevice
-from authentication.totp import get_totp_token, create_totp_device
+from django.utils import timezone
+from authentication import hashing
+from authentication.authentication import CachedJWTAuthentication
+from authentication.mail import read_body
+from authentication.user_cache import get_cached_user, get_user_cache_key
+from authentication.models import CustomUser, LoginAttempt, UserActivity, TOTPDevice, OneTimeToken, OutboundEmail
+from authentication.one_time_tokens import issue_token, purge_expired_tokens
+from authentication.totp import get_totp_token, create_totp_device, get_two_factor_state
 
 @pytest.fixture
 def api_client():
@@ -75,7 +85,36 @@ class TestAuthentication:
         
         # Check if login attempt was logged
         assert LoginAttempt.objects.filter(user=regular_user, successful=True).exists()
-        
+
+    def test_login_with_email(self, api_client, regular_user):
+        """Test login with an email address instead of a username"""
+        url = reverse('token_obtain_pair')
+        response = api_client.post(url, {
+            'email': 'TEST@example.com',
+            'password': 'Test@123'
+        }, format='json')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['user']['username'] == 'testuser'
+
+        # Check that the login fields were updated
+        regular_user.refresh_from_db()
+        assert regular_user.last_login is not None
+        assert regular_user.last_login_ip == '127.0.0.1'
+
+    def test_login_query_count(self, api_client, regular_user, django_assert_max_num_queries):
+        """Test that a login resolves the user once and batches its writes"""
+        url = reverse('token_obtain_pair')
+        # One user lookup plus the bookkeeping transaction, which also
+        # registers the session
+        with django_assert_max_num_queries(7):
+            response = api_client.post(url, {
+                'username': 'testuser',
+                'password': 'Test@123'
+            }, format='json')
+
+        assert response.status_code == status.HTTP_200_OK
+
     def test_login_failure(self, api_client, regular_user):
         """Test failed login"""
         url = reverse('token_obtain_pair')
@@ -148,7 +187,8 @@ class TestUserRegistration:
         # Check that the user is not verified yet
         new_user = CustomUser.objects.get(username='newuser')
         assert not new_user.is_verified
-        assert new_user.email_verification_token is not None
+        assert OneTimeToken.objects.filter(user=new_user, purpose='email_verification').exists()
+        assert OutboundEmail.objects.filter(user=new_user, purpose='email_verification').exists()
     
     def test_regular_user_cannot_register(self, user_authenticated_client):
         """Test that a regular user cannot register new users"""
@@ -204,9 +244,10 @@ class TestEmailVerification:
             'password2': 'Verify@123'
         }, format='json')
         
-        # Get the verification token
+        # Get the verification token from the queued email
         user = CustomUser.objects.get(username='verifyuser')
-        token = user.email_verification_token
+        email = OutboundEmail.objects.get(user=user, purpose='email_verification')
+        token = read_body(email).split('token=')[1]
         
         # Verify the email
         verify_url = reverse('verify-email')
@@ -219,7 +260,12 @@ class TestEmailVerification:
         # Check that the user is now verified
         user.refresh_from_db()
         assert user.is_verified
-        assert user.email_verification_token is None
+        
+        # Check that the token cannot be used again
+        verify_response = api_client.post(verify_url, {
+            'token': token
+        }, format='json')
+        assert verify_response.status_code == status.HTTP_400_BAD_REQUEST
         
         # Check that verification was logged
         assert UserActivity.objects.filter(
@@ -250,8 +296,7 @@ class TestPasswordReset:
         assert response.status_code == status.HTTP_200_OK
         
         # Check that a token was generated
-        regular_user.refresh_from_db()
-        assert regular_user.password_reset_token is not None
+        assert OneTimeToken.objects.filter(user=regular_user, purpose='password_reset').exists()
         
         # Check that the request was logged
         assert UserActivity.objects.filter(
@@ -261,10 +306,8 @@ class TestPasswordReset:
     
     def test_password_reset_confirm(self, api_client, regular_user):
         """Test password reset confirmation process"""
-        # First, set a reset token
-        token = get_random_string(32)
-        regular_user.password_reset_token = token
-        regular_user.save()
+        # First, issue a reset token
+        token = issue_token(regular_user, 'password_reset')
         
         # Now use the token to reset the password
         url = reverse('reset-password-confirm')
@@ -275,9 +318,12 @@ class TestPasswordReset:
         
         assert response.status_code == status.HTTP_200_OK
         
-        # Check that the token was cleared
-        regular_user.refresh_from_db()
-        assert regular_user.password_reset_token is None
+        # Check that the token cannot be used again
+        response = api_client.post(url, {
+            'token': token,
+            'new_password': 'OtherPassword@123'
+        }, format='json')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
         
         # Check that the password was changed (by trying to login)
         login_url = reverse('token_obtain_pair')
@@ -294,6 +340,21 @@ class TestPasswordReset:
             activity_type='password_reset'
         ).exists()
     
+    def test_expired_reset_token(self, api_client, regular_user):
+        """Test that expired reset tokens are rejected and purged"""
+        token = issue_token(regular_user, 'password_reset')
+        OneTimeToken.objects.filter(user=regular_user).update(expires_at=timezone.now())
+        
+        url = reverse('reset-password-confirm')
+        response = api_client.post(url, {
+            'token': token,
+            'new_password': 'NewPassword@123'
+        }, format='json')
+        
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert purge_expired_tokens() == 1
+        assert not OneTimeToken.objects.filter(user=regular_user).exists()
+    
     def test_invalid_reset_token(self, api_client):
         """Test that invalid reset tokens are rejected"""
         url = reverse('reset-password-confirm')
@@ -354,7 +415,7 @@ class TestTwoFactorAuthentication:
             activity_type='2fa_enabled'
         ).exists()
     
-    def test_disable_2fa(self, user_authenticated_client, regular_user):
+    def test_disable_2fa(self, user_authenticated_client, regular_user, monkeypatch):
         """Test disabling 2FA"""
         # First, create and confirm a device
         device = create_totp_device(regular_user, "Test Device")
@@ -368,7 +429,10 @@ class TestTwoFactorAuthentication:
         # Generate a valid token
         token = get_totp_token(device.key)
         
-        # Disable 2FA
+        # Disable 2FA, checking the password once
+        checks = []
+        verify_password = hashing.verify_password
+        monkeypatch.setattr(hashing, 'verify_password', lambda *args: checks.append(args) or verify_password(*args))
         url = reverse('disable-2fa')
         response = user_authenticated_client.post(url, {
             'token': str(token),
@@ -376,6 +440,7 @@ class TestTwoFactorAuthentication:
         }, format='json')
         
         assert response.status_code == status.HTTP_200_OK
+        assert len(checks) == 1
         
         # Check that 2FA is now disabled
         regular_user.refresh_from_db()
@@ -390,6 +455,129 @@ class TestTwoFactorAuthentication:
             activity_type='2fa_disabled'
         ).exists()
 
+@pytest.mark.django_db
+class TestTwoFactorMiddleware:
+    """Test the 2FA middleware and its state cache"""
+    
+    def test_token_validated_once_per_request(self, settings, user_authenticated_client, regular_user,
+                                              django_assert_num_queries):
+        """Test that DRF reuses the user loaded by the middleware"""
+        settings.TWO_FACTOR_ENABLED = True
+        device = create_totp_device(regular_user, "Test Device")
+        device.confirmed = True
+        device.save()
+        regular_user.two_factor_enabled = True
+        regular_user.save()
+        
+        url = reverse('check-2fa-status')
+        # User lookup plus the device check on a cold cache
+        with django_assert_num_queries(2):
+            response = user_authenticated_client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['enabled']
+        
+        # The user and the device state are now served from the cache
+        with django_assert_num_queries(0):
+            response = user_authenticated_client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+    
+    def test_state_invalidated_when_2fa_disabled(self, user_authenticated_client, regular_user):
+        """Test that disabling 2FA drops the cached device state"""
+        device = create_totp_device(regular_user, "Test Device")
+        device.confirmed = True
+        device.save()
+        regular_user.two_factor_enabled = True
+        regular_user.save()
+        assert get_two_factor_state(regular_user)['has_confirmed_device']
+        
+        url = reverse('disable-2fa')
+        response = user_authenticated_client.post(url, {
+            'token': str(get_totp_token(device.key)),
+            'password': 'Test@123'
+        }, format='json')
+        
+        assert response.status_code == status.HTTP_200_OK
+        regular_user.refresh_from_db()
+        assert not get_two_factor_state(regular_user)['has_confirmed_device']
+
+@pytest.mark.django_db
+class TestCachedUserLoader:
+    """Test the cached user loader used by JWT authentication"""
+    
+    def test_user_served_from_cache(self, user_authenticated_client, django_assert_num_queries):
+        """Test that only the first authenticated request loads the user"""
+        url = reverse('check-2fa-status')
+        with django_assert_num_queries(1):
+            user_authenticated_client.get(url)
+        with django_assert_num_queries(0):
+            response = user_authenticated_client.get(url)
+        
+        assert response.status_code == status.HTTP_200_OK
+    
+    def test_cache_invalidated_on_save(self, user_authenticated_client, regular_user,
+                                       django_capture_on_commit_callbacks):
+        """Test that saving a user refreshes the cached copy once the save commits"""
+        url = reverse('check-2fa-status')
+        assert not user_authenticated_client.get(url).data['enabled']
+        
+        with django_capture_on_commit_callbacks() as callbacks:
+            regular_user.two_factor_enabled = True
+            regular_user.save()
+            assert not user_authenticated_client.get(url).data['enabled']
+        for callback in callbacks:
+            callback()
+        
+        assert user_authenticated_client.get(url).data['enabled']
+    
+    def test_password_not_cached(self, regular_user):
+        """Test that the cached user leaves out the password hash and never writes it back"""
+        get_cached_user(regular_user.pk)
+        assert 'password' not in cache.get(get_user_cache_key(regular_user.pk))
+
+        user = get_cached_user(regular_user.pk)
+        CustomUser.objects.filter(pk=regular_user.pk).update(password='changed')
+        user.first_name = 'Cached'
+        user.save()
+        assert CustomUser.objects.get(pk=regular_user.pk).password == 'changed'
+
+    def test_deactivated_user_rejected(self, api_client, admin_authenticated_client, regular_user,
+                                       django_capture_on_commit_callbacks):
+        """Test that deactivation takes effect despite the cache"""
+        login_response = api_client.post(reverse('token_obtain_pair'), {
+            'username': 'testuser',
+            'password': 'Test@123'
+        }, format='json')
+        user_client = APIClient()
+        user_client.credentials(HTTP_AUTHORIZATION=f"Bearer {login_response.data['access']}")
+        url = reverse('check-2fa-status')
+        assert user_client.get(url).status_code == status.HTTP_200_OK
+        
+        with django_capture_on_commit_callbacks(execute=True):
+            admin_authenticated_client.delete(reverse('deactivate-account', kwargs={'pk': regular_user.id}))
+        
+        assert user_client.get(url).status_code == status.HTTP_401_UNAUTHORIZED
+    
+    def test_user_from_claims(self, settings, api_client, regular_user, django_assert_num_queries):
+        """Test that claims mode authenticates without touching the users table"""
+        settings.JWT_USER_FROM_CLAIMS = True
+        login_response = api_client.post(reverse('token_obtain_pair'), {
+            'username': 'testuser',
+            'password': 'Test@123'
+        }, format='json')
+        request = APIRequestFactory().get(
+            '/', HTTP_AUTHORIZATION=f"Bearer {login_response.data['access']}"
+        )
+        
+        with django_assert_num_queries(0):
+            user, _ = CachedJWTAuthentication().authenticate(Request(request))
+            assert user.pk == regular_user.pk
+            assert user.username == 'testuser'
+            assert user.is_verified
+        
+        # Fields outside the token are loaded on first access
+        with django_assert_num_queries(1):
+            assert not user.two_factor_enabled
+
 @pytest.mark.django_db
 class TestAccountDeactivation:
     """Test account deactivation functionality"""
@@ -420,4 +608,45 @@ class TestAccountDeactivation:
         
         # Check that the admin is still active
         admin_user.refresh_from_db()
-        assert admin_user.is_active
\ No newline at end of file
+        assert admin_user.is_active
+
+
+@pytest.mark.django_db
+class TestUserList:
+    """Test the paginated user list"""
+    url = '/api/auth/users/'
+
+    def test_keyset_pages(self, admin_authenticated_client, admin_user):
+        """Test following next links visits every user once, newest first"""
+        for i in range(4):
+            CustomUser.objects.create_user(username=f'listed{i}', email=f'listed{i}@example.com', password='Listed@123')
+
+        usernames = []
+        url = self.url + '?page_size=2'
+        while url:
+            response = admin_authenticated_client.get(url)
+            assert response.status_code == 200
+            usernames += [user['username'] for user in response.data['results']]
+            url = response.data['next']
+
+        assert usernames == ['listed3', 'listed2', 'listed1', 'listed0', 'admin']
+
+    def test_filters_and_sparse_fields(self, admin_authenticated_client, regular_user):
+        """Test boolean filters and the fields parameter"""
+        CustomUser.objects.create_user(username='unverified', email='unverified@example.com', password='Listed@123')
+
+        response = admin_authenticated_client.get(self.url, {'is_verified': 'false', 'fields': 'id,username'})
+
+        assert response.status_code == 200
+        assert response.data['results'] == [{'id': response.data['results'][0]['id'], 'username': 'unverified'}]
+
+    def test_invalid_cursor_pk(self, admin_authenticated_client):
+        """Test that a cursor with a malformed key is rejected instead of failing"""
+        cursor = base64.urlsafe_b64encode(json.dumps(['2024-01-01T00:00:00+00:00', 'notauuid']).encode()).decode()
+        response = admin_authenticated_client.get(self.url, {'cursor': cursor})
+        assert response.status_code == 404
+
+    def test_unknown_field_rejected(self, admin_authenticated_client):
+        """Test requesting a field the serializer does not expose fails"""
+        response = admin_authenticated_client.get(self.url, {'fields': 'password'})
+        assert response.status_code == 400
@@ -0,0 +1,19 @@
+import pytest
+from authentication.benchmark import compare_results, run_benchmarks
+
+@pytest.mark.django_db
+class TestBenchmark:
+    def test_scenarios_run_without_errors(self):
+        """Test every benchmark scenario gets its expected status"""
+        results = run_benchmarks(iterations=2, warmup=1)
+        assert set(results) == {'token', 'token_refresh', 'verify_2fa', 'reset_password_request', 'users_list'}
+        for result in results.values():
+            assert result['errors'] == 0
+
+    def test_compare_results(self):
+        """Test extra queries and slower p95 latency are reported as regressions"""
+        baseline = {'token': {'max_queries': 6, 'p95_ms': 100.0, 'errors': 0}}
+        assert compare_results(baseline, {'token': {'max_queries': 6, 'p95_ms': 140.0, 'errors': 0}}) == []
+
+        regressions = compare_results(baseline, {'token': {'max_queries': 7, 'p95_ms': 200.0, 'errors': 0}})
+        assert len(regressions) == 2
@@ -0,0 +1,46 @@
+import json
+import pytest
+from datetime import datetime, timedelta, timezone
+from authentication.exports import iter_rows
+from authentication.models import UserActivity
+
+@pytest.fixture
+def activities(regular_user):
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    UserActivity.objects.bulk_create([
+        UserActivity(user=regular_user, activity_type='login', ip_address='127.0.0.1',
+                     timestamp=start + timedelta(minutes=i // 2))
+        for i in range(7)
+    ])
+    return UserActivity.objects.order_by('timestamp', 'id')
+
+@pytest.mark.django_db
+class TestAuditExport:
+    url = '/api/auth/audit/activity/export/'
+
+    def test_keyset_pages_cover_every_row(self, activities):
+        """Test rows sharing a timestamp are neither skipped nor repeated across pages"""
+        rows = list(iter_rows('activity', batch_size=2))
+        assert [row[0] for row in rows] == [a.id for a in activities]
+
+    def test_ndjson_export(self, admin_authenticated_client, activities):
+        """Test staff can stream activities as NDJSON filtered by time"""
+        response = admin_authenticated_client.get(self.url, {'until': '2026-01-01T00:02:00+00:00'})
+        assert response.status_code == 200
+        assert response['Content-Type'] == 'application/x-ndjson'
+
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        assert len(lines) == 4
+        assert json.loads(lines[0])['activity_type'] == 'login'
+
+    def test_csv_export(self, admin_authenticated_client, regular_user, activities):
+        """Test the CSV export has a header and one line per row"""
+        response = admin_authenticated_client.get(self.url, {'output': 'csv', 'user': str(regular_user.id)})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        assert lines[0].startswith('id,user_id,activity_type')
+        assert len(lines) == 8
+
+    def test_staff_only(self, user_authenticated_client):
+        """Test regular users cannot export audit logs"""
+        response = user_authenticated_client.get(self.url)
+        assert response.status_code == 403
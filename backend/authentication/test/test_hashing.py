@@ -0,0 +1,104 @@
+import threading
+import time
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, make_password
+
+from authentication.hashers import TunedScryptPasswordHasher, calibrate
+from authentication.hashing import (
+    PasswordHasherPool,
+    PasswordHashingBusy,
+    acheck_user_password,
+    check_user_password,
+)
+from authentication.models import CustomUser
+
+
+class TestPasswordHasherPool:
+    def test_inline_pool_hashes(self):
+        """Test that a pool without processes hashes on the calling thread"""
+        pool = PasswordHasherPool(processes=0)
+        encoded = pool.run(make_password, 'Secret@123')
+        assert encoded.startswith('scrypt$')
+
+    def test_process_pool_hashes(self):
+        """Test that hashing runs in a pool process"""
+        pool = PasswordHasherPool(processes=1)
+        try:
+            assert pool.map(make_password, ['a', None])[0].startswith('scrypt$')
+        finally:
+            pool.shutdown()
+
+    def test_stuck_operation_times_out(self):
+        """Test that a caller stops waiting for an operation that does not finish"""
+        pool = PasswordHasherPool(processes=1, timeout=0.5)
+        try:
+            with pytest.raises(PasswordHashingBusy):
+                pool.run(time.sleep, 2)
+        finally:
+            pool.shutdown()
+
+    def test_saturated_pool_rejects(self):
+        """Test that callers get a 503 once every slot stays taken"""
+        pool = PasswordHasherPool(processes=0, max_pending=1, timeout=0.05)
+        started, release = threading.Event(), threading.Event()
+
+        def hold():
+            started.set()
+            release.wait(5)
+
+        thread = threading.Thread(target=pool.run, args=(hold,))
+        thread.start()
+        started.wait(5)
+        try:
+            with pytest.raises(PasswordHashingBusy):
+                pool.run(make_password, 'Secret@123')
+        finally:
+            release.set()
+            thread.join()
+
+
+@pytest.mark.django_db
+class TestCheckUserPassword:
+    def test_rehashes_outdated_hash(self, regular_user):
+        """Test that a correct password stored with an old hasher is upgraded"""
+        hasher = PBKDF2PasswordHasher()
+        regular_user.password = hasher.encode('Test@123', hasher.salt(), iterations=1000)
+        regular_user.save(update_fields=['password'])
+
+        assert check_user_password(regular_user, 'Test@123')
+        assert CustomUser.objects.get(pk=regular_user.pk).password.startswith('scrypt$')
+
+    def test_async_rehash(self, regular_user):
+        """Test that the async check upgrades an old hash too"""
+        hasher = PBKDF2PasswordHasher()
+        regular_user.password = hasher.encode('Test@123', hasher.salt(), iterations=1000)
+        regular_user.save(update_fields=['password'])
+
+        assert async_to_sync(acheck_user_password)(regular_user, 'Test@123')
+        assert CustomUser.objects.get(pk=regular_user.pk).password.startswith('scrypt$')
+
+    def test_wrong_password(self, regular_user):
+        """Test that a wrong password is rejected"""
+        assert not check_user_password(regular_user, 'wrong')
+
+
+class TestTunedHashers:
+    def test_scrypt_parameters_follow_settings(self, settings):
+        """Test that hashes made with other scrypt parameters need an update"""
+        hasher = TunedScryptPasswordHasher()
+        settings.PASSWORD_SCRYPT_WORK_FACTOR = 2 ** 10
+        encoded = hasher.encode('Secret@123', hasher.salt())
+        assert encoded.split('$')[1] == '1024'
+        assert not hasher.must_update(encoded)
+
+        settings.PASSWORD_SCRYPT_WORK_FACTOR = 2 ** 11
+        assert hasher.must_update(encoded)
+        assert hasher.verify('Secret@123', encoded)
+
+    def test_calibrate_pbkdf2(self):
+        """Test that calibration returns settings for the profile"""
+        values, elapsed = calibrate('pbkdf2', 0.01, samples=1)
+        assert values['PASSWORD_PBKDF2_ITERATIONS'] >= 100000
+        assert elapsed > 0
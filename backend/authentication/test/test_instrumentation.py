@@ -0,0 +1,47 @@
+import pytest
+from authentication.instrumentation import Histogram, QueryBudgetExceeded, view_stats
+from authentication.views import UserViewSet
+
+@pytest.mark.django_db
+class TestRequestMetrics:
+    def test_server_timing_header(self, settings, admin_authenticated_client):
+        """Test query count, cache and serializer timings are exposed"""
+        settings.SERVER_TIMING_HEADER = True
+        response = admin_authenticated_client.get('/api/auth/users/')
+
+        header = response['Server-Timing']
+        assert 'db;dur=' in header
+        assert 'cache;desc=' in header
+        assert 'serializer;dur=' in header
+
+    def test_view_histograms(self, admin_authenticated_client):
+        """Test each request is recorded against its view"""
+        view_stats.reset()
+        admin_authenticated_client.get('/api/auth/users/')
+        admin_authenticated_client.get('/api/auth/users/')
+
+        stats = view_stats.snapshot()['user-list']
+        assert stats['duration_ms']['count'] == 2
+        assert stats['queries']['sum'] > 0
+
+    def test_query_budget_strict(self, monkeypatch, admin_authenticated_client):
+        """Test strict mode fails a view that exceeds its query budget"""
+        monkeypatch.setattr(UserViewSet, 'query_budget', {'list': 0})
+        with pytest.raises(QueryBudgetExceeded):
+            admin_authenticated_client.get('/api/auth/users/')
+
+    def test_query_budget_logged(self, settings, monkeypatch, caplog, admin_authenticated_client):
+        """Test outside strict mode an exceeded budget is only logged"""
+        settings.QUERY_BUDGET_STRICT = False
+        monkeypatch.setattr(UserViewSet, 'query_budget', {'list': 0})
+        response = admin_authenticated_client.get('/api/auth/users/')
+
+        assert response.status_code == 200
+        assert 'budget is 0' in caplog.text
+
+def test_histogram_buckets():
+    """Test histogram snapshots are cumulative"""
+    histogram = Histogram((1, 5))
+    for value in (0, 3, 4, 10):
+        histogram.observe(value)
+    assert histogram.snapshot()['buckets'] == [(1, 1), (5, 3), ('+Inf', 4)]
@@ -0,0 +1,61 @@
+import pytest
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from authentication.models import CustomUser
+from authentication.revocation import revoke_token
+from authentication.sessions import end_all_sessions
+from authentication.signing import RefreshToken
+
+
+def access_token(user):
+    return RefreshToken.for_user(user).access_token
+
+
+@pytest.mark.django_db
+class TestTokenIntrospection:
+    def test_batch_results(self, settings, regular_user, django_assert_max_num_queries):
+        """Test that each token gets its own result with one user query for the batch"""
+        settings.TOKEN_INTROSPECTION_SECRET = 's3cret'
+        client = APIClient(HTTP_AUTHORIZATION='Bearer s3cret')
+        other = CustomUser.objects.create_user(username='other', email='other@example.com', password='Other@123')
+        revoked = access_token(regular_user)
+        revoke_token(revoked)
+        superseded = access_token(other)
+        end_all_sessions(other)
+        refresh = RefreshToken.for_user(regular_user)
+        tokens = [str(access_token(regular_user)), 'garbage', str(revoked), str(superseded), str(refresh)]
+
+        with django_assert_max_num_queries(1):
+            response = client.post(reverse('token_introspect'), {'tokens': tokens}, format='json')
+
+        assert response.status_code == status.HTTP_200_OK
+        results = response.data['results']
+        assert [result['active'] for result in results] == [True, False, False, False, False]
+        assert results[0]['claims']['user_id'] == str(regular_user.id)
+        assert results[0]['user_active'] and not results[0]['revoked']
+        assert 'error' in results[1] and 'claims' not in results[1]
+        assert results[2]['revoked']
+        assert results[3]['error'] == 'Session has ended'
+        assert results[4] == {'active': False, 'error': 'Token has wrong type'}
+
+    def test_batch_size_limited(self, settings, admin_authenticated_client):
+        """Test that oversized batches are rejected"""
+        settings.TOKEN_INTROSPECTION_MAX_TOKENS = 2
+        response = admin_authenticated_client.post(reverse('token_introspect'), {'tokens': ['a', 'b', 'c']}, format='json')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_access(self, settings, user_authenticated_client, regular_user):
+        """Test that callers need staff rights or the introspection secret"""
+        body = {'tokens': [str(access_token(regular_user))]}
+        url = reverse('token_introspect')
+        assert user_authenticated_client.post(url, body, format='json').status_code == status.HTTP_403_FORBIDDEN
+
+        settings.TOKEN_INTROSPECTION_SECRET = 's3cret'
+        client = APIClient()
+        assert client.post(url, body, format='json').status_code == status.HTTP_403_FORBIDDEN
+        client.credentials(HTTP_AUTHORIZATION='Bearer s3cret')
+        response = client.post(url, body, format='json')
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['results'][0]['active']
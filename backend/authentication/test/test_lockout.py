@@ -0,0 +1,94 @@
+import pytest
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from authentication.lockout import LocalLockoutBackend
+from authentication.models import LoginAttempt
+
+
+class TestLocalLockoutBackend:
+    """Test the progressive lockout of the local backend"""
+
+    def test_lock_doubles_per_failure(self, fake_timer):
+        """Test that failures past the threshold lock for exponentially longer"""
+        backend = LocalLockoutBackend(timer=fake_timer)
+        locks = [backend.fail({'key': 3}, window=900, base=30, maximum=100) for _ in range(6)]
+
+        assert locks == [0, 0, 30, 60, 100, 100]
+        assert backend.locked_for(['other', 'key']) == 100
+        fake_timer.now += 100
+        assert backend.locked_for(['key']) == 0
+
+    def test_failures_forgotten_after_window(self, fake_timer):
+        """Test that counters start over once the window has passed"""
+        backend = LocalLockoutBackend(timer=fake_timer)
+        backend.fail({'key': 2}, window=900, base=30, maximum=100)
+        fake_timer.now += 900
+        assert backend.fail({'key': 2}, window=900, base=30, maximum=100) == 0
+
+
+@pytest.mark.django_db
+class TestLoginLockout:
+    """Test the lockout against the login endpoint"""
+
+    @pytest.fixture(autouse=True)
+    def lockout_settings(self, settings):
+        settings.LOCKOUT_ACCOUNT_THRESHOLD = 2
+        # Below the login rate throttle's 5 attempts
+        settings.LOCKOUT_IP_THRESHOLD = 3
+
+    def post(self, client, username, password):
+        return client.post(reverse('token_obtain_pair'), {
+            'username': username,
+            'password': password
+        }, format='json')
+
+    def test_locked_account_skips_password_check(self, monkeypatch, regular_user):
+        """Test that a locked account is refused without hashing, even with the right password"""
+        client = APIClient()
+        assert self.post(client, 'testuser', 'wrong').status_code == status.HTTP_401_UNAUTHORIZED
+        assert self.post(client, 'testuser', 'wrong').status_code == status.HTTP_401_UNAUTHORIZED
+        assert LoginAttempt.objects.filter(user=regular_user, successful=False).count() == 2
+
+        def fail(*args, **kwargs):
+            raise AssertionError('password checked while locked')
+        monkeypatch.setattr('authentication.serializers_jwt.check_user_password', fail)
+
+        response = self.post(client, 'testuser', 'Test@123')
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert int(response['Retry-After']) > 0
+
+    def test_address_locked_across_accounts(self):
+        """Test that one address cannot spray guesses over many accounts"""
+        client = APIClient(REMOTE_ADDR='10.0.0.1')
+        codes = [self.post(client, f'user{i}', 'guess').status_code for i in range(4)]
+
+        assert codes == [status.HTTP_401_UNAUTHORIZED] * 3 + [status.HTTP_429_TOO_MANY_REQUESTS]
+        assert self.post(APIClient(REMOTE_ADDR='10.0.0.2'), 'user9', 'guess').status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_forwarded_for_not_trusted(self):
+        """Test that rotating X-Forwarded-For does not reset the address counter"""
+        codes = [
+            self.post(APIClient(REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR=f'192.0.2.{i}'), f'user{i}', 'guess').status_code
+            for i in range(4)
+        ]
+        assert codes[-1] == status.HTTP_429_TOO_MANY_REQUESTS
+
+    def test_username_and_email_share_counter(self, regular_user):
+        """Test that alternating username and email logins count against one account"""
+        client = APIClient()
+        self.post(client, 'testuser', 'wrong')
+        response = client.post(reverse('token_obtain_pair'), {
+            'email': 'TEST@example.com',
+            'password': 'wrong'
+        }, format='json')
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+        assert self.post(client, 'testuser', 'Test@123').status_code == status.HTTP_429_TOO_MANY_REQUESTS
+
+    def test_success_clears_account_failures(self, regular_user):
+        """Test that a successful login resets the account's counter"""
+        client = APIClient()
+        self.post(client, 'testuser', 'wrong')
+        assert self.post(client, 'testuser', 'Test@123').status_code == status.HTTP_200_OK
+        assert self.post(client, 'testuser', 'wrong').status_code == status.HTTP_401_UNAUTHORIZED
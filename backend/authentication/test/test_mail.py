@@ -0,0 +1,109 @@
+import pytest
+from datetime import timedelta
+from django.core import mail
+from django.utils import timezone
+from authentication.mail import enqueue_email, purge_finished_emails, read_body, queue_verification_email, send_queued_emails
+from authentication.models import CustomUser, OutboundEmail
+
+@pytest.fixture
+def user():
+    return CustomUser.objects.create_user(
+        username='mailuser',
+        email='mail@example.com',
+        password='Mail@1234'
+    )
+
+class FailingBackend:
+    """Email backend whose connection cannot be opened"""
+    def open(self):
+        raise ConnectionError('relay unavailable')
+
+    def close(self):
+        pass
+
+@pytest.mark.django_db
+class TestMailQueue:
+    """Test the outbound mail queue"""
+
+    def test_enqueue_deduplicates_per_purpose(self, user):
+        """Test that a user has one pending message per purpose"""
+        queue_verification_email(user, 'first-token')
+        queue_verification_email(user, 'second-token')
+        enqueue_email(user, 'password_reset', 'Reset', 'body')
+
+        pending = OutboundEmail.objects.filter(user=user, status='pending')
+        assert pending.count() == 2
+        verification = pending.get(purpose='email_verification')
+        assert 'second-token' in read_body(verification)
+        assert 'second-token' not in verification.body
+
+    def test_send_queued_emails(self, user):
+        """Test that due messages are delivered and marked as sent"""
+        queue_verification_email(user, 'token')
+
+        assert send_queued_emails() == 1
+        assert len(mail.outbox) == 1
+        assert mail.outbox[0].to == ['mail@example.com']
+
+        message = OutboundEmail.objects.get(user=user)
+        assert message.status == 'sent'
+        assert message.sent_at is not None
+        assert message.body == ''
+
+        # Nothing left to send
+        assert send_queued_emails() == 0
+
+    def test_requeued_during_send_stays_pending(self, user):
+        """Test that a message replaced while its batch is sending is not marked sent"""
+        queue_verification_email(user, 'first-token')
+
+        class RequeueingBackend:
+            def open(self):
+                queue_verification_email(user, 'second-token')
+
+            def send_messages(self, messages):
+                return len(messages)
+
+            def close(self):
+                pass
+
+        assert send_queued_emails(connection=RequeueingBackend()) == 1
+        message = OutboundEmail.objects.get(user=user)
+        assert message.status == 'pending'
+        assert 'second-token' in read_body(message)
+        assert message.next_attempt_at <= timezone.now()
+
+    def test_failed_delivery_is_retried_with_backoff(self, user, settings):
+        """Test that connection failures schedule a retry and eventually give up"""
+        settings.MAIL_QUEUE_MAX_ATTEMPTS = 2
+        queue_verification_email(user, 'token')
+
+        assert send_queued_emails(connection=FailingBackend()) == 1
+        message = OutboundEmail.objects.get(user=user)
+        assert message.status == 'pending'
+        assert message.attempts == 1
+        assert message.next_attempt_at > timezone.now()
+        assert 'relay unavailable' in message.last_error
+
+        # Not due yet
+        assert send_queued_emails(connection=FailingBackend()) == 0
+
+        OutboundEmail.objects.filter(pk=message.pk).update(
+            next_attempt_at=timezone.now() - timedelta(seconds=1)
+        )
+        send_queued_emails(connection=FailingBackend())
+        message.refresh_from_db()
+        assert message.status == 'failed'
+        assert message.attempts == 2
+        assert message.body == ''
+
+    def test_purge_finished_emails(self, user, settings):
+        """Test that only sent and failed messages past the retention period are deleted"""
+        settings.MAIL_RETENTION_DAYS = 7
+        queue_verification_email(user, 'token')
+        send_queued_emails()
+        enqueue_email(user, 'password_reset', 'Reset', 'body')
+        OutboundEmail.objects.update(created_at=timezone.now() - timedelta(days=8))
+
+        assert purge_finished_emails(batch_size=1) == 1
+        assert list(OutboundEmail.objects.values_list('status', flat=True)) == ['pending']
@@ -0,0 +1,49 @@
+import pytest
+from authentication.metrics import database_state_collector
+from authentication.models import OutboundEmail
+
+@pytest.mark.django_db
+class TestMetricsEndpoint:
+    url = '/api/metrics/'
+
+    @pytest.fixture(autouse=True)
+    def metrics_token(self, settings):
+        settings.METRICS_TOKEN = 'scrape-secret'
+        database_state_collector.reset()
+
+    def test_login_and_mail_queue_metrics(self, api_client, regular_user):
+        """Test login outcomes and the mail queue depth are exported"""
+        api_client.post('/api/auth/token/', {'username': 'testuser', 'password': 'wrong'}, format='json')
+        OutboundEmail.objects.create(user=regular_user, purpose='email_verification', to_email=regular_user.email,
+                                     subject='Verify', body='Verify')
+
+        api_client.credentials(HTTP_AUTHORIZATION='Bearer scrape-secret')
+        response = api_client.get(self.url)
+        assert response.status_code == 200
+        body = response.content.decode()
+        assert 'auth_login_attempts_total{outcome="failure"}' in body
+        assert 'auth_mail_queue_depth 1.0' in body
+        assert 'auth_request_duration_seconds_bucket' in body
+
+    def test_database_state_reused(self, api_client, django_assert_num_queries):
+        """Test that scrapes within METRICS_DB_STATE_TTL do not query the database"""
+        api_client.credentials(HTTP_AUTHORIZATION='Bearer scrape-secret')
+        api_client.get(self.url)
+        with django_assert_num_queries(0):
+            assert api_client.get(self.url).status_code == 200
+
+    def test_token_required(self, settings, api_client):
+        """Test the endpoint requires the configured bearer token"""
+        assert api_client.get(self.url).status_code == 403
+
+        api_client.credentials(HTTP_AUTHORIZATION='Bearer scrape-secret')
+        assert api_client.get(self.url).status_code == 200
+
+    def test_staff_only_without_token(self, settings, client, regular_user, admin_user):
+        """Test that without a token only staff sessions can scrape"""
+        settings.METRICS_TOKEN = ''
+        assert client.get(self.url).status_code == 403
+        client.force_login(regular_user)
+        assert client.get(self.url).status_code == 403
+        client.force_login(admin_user)
+        assert client.get(self.url).status_code == 200
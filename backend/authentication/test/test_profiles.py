@@ -0,0 +1,80 @@
+import uuid
+from datetime import date
+
+import pytest
+from django.core.cache import cache
+from django.db import transaction
+from django.urls import reverse
+from rest_framework import status
+
+from authentication.models import CustomUser
+from authentication.profiles import PROFILE_FIELDS, get_profile_cache_key, serialize_profile
+from authentication.serializers import UserProfileSerializer
+
+
+@pytest.mark.django_db
+class TestProfileReadModel:
+    def test_matches_model_serializer(self, regular_user):
+        """Test that the fast path renders what the DRF fields would"""
+        regular_user.birth_date = date(1990, 5, 17)
+        regular_user.bio = 'Hello'
+        regular_user.save()
+
+        assert serialize_profile(regular_user) == UserProfileSerializer(regular_user, fields=PROFILE_FIELDS).data
+
+    def test_profile_served_from_cache(self, user_authenticated_client, django_assert_num_queries):
+        """Test that repeated profile reads do not query the database"""
+        url = reverse('profile')
+        user_authenticated_client.get(url)
+
+        with django_assert_num_queries(0):
+            response = user_authenticated_client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['username'] == 'testuser'
+
+    def test_update_refreshes_cache(self, user_authenticated_client, regular_user, django_capture_on_commit_callbacks):
+        """Test that saving a profile replaces the cached copy"""
+        url = reverse('profile')
+        user_authenticated_client.get(url)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            response = user_authenticated_client.patch(
+                url, {'bio': 'Updated', 'email': 'new@example.com'}, format='json'
+            )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['email'] == 'test@example.com'
+        assert cache.get(get_profile_cache_key(regular_user.pk))['bio'] == 'Updated'
+        assert user_authenticated_client.get(url).data['bio'] == 'Updated'
+
+    def test_rolled_back_save_not_cached(self, regular_user, django_capture_on_commit_callbacks):
+        """Test that a save that is rolled back leaves the cached profile alone"""
+        key = get_profile_cache_key(regular_user.pk)
+        cache.set(key, serialize_profile(regular_user))
+        with django_capture_on_commit_callbacks(execute=True):
+            with pytest.raises(ValueError):
+                with transaction.atomic():
+                    regular_user.bio = 'Uncommitted'
+                    regular_user.save()
+                    raise ValueError
+        assert cache.get(key)['bio'] == ''
+
+    def test_update_keeps_other_columns(self, user_authenticated_client, regular_user):
+        """Test that a profile update does not write back the cached user's other columns"""
+        url = reverse('profile')
+        user_authenticated_client.get(url)
+        CustomUser.objects.filter(pk=regular_user.pk).update(is_staff=True, token_generation=5)
+
+        user_authenticated_client.patch(url, {'first_name': 'Test'}, format='json')
+        regular_user.refresh_from_db()
+        assert regular_user.first_name == 'Test'
+        assert regular_user.is_staff and regular_user.token_generation == 5
+
+    def test_retrieve(self, user_authenticated_client, admin_user):
+        """Test that other users' profiles are served and unknown ids are not found"""
+        response = user_authenticated_client.get(reverse('user-detail', args=[admin_user.pk]))
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == serialize_profile(admin_user)
+
+        for pk in (uuid.uuid4(), 'not-a-uuid'):
+            response = user_authenticated_client.get(reverse('user-detail', args=[pk]))
+            assert response.status_code == status.HTTP_404_NOT_FOUND
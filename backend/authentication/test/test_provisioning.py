@@ -0,0 +1,52 @@
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from authentication.models import CustomUser, OneTimeToken, OutboundEmail, UserActivity
+from authentication.provisioning import provision_users
+
+@pytest.mark.django_db
+class TestBulkImport:
+    url = '/api/auth/users/bulk-import/'
+
+    def test_provision_users_report(self, regular_user):
+        """Test valid rows are created and invalid or duplicate rows are reported"""
+        rows = [
+            {'username': 'alice', 'email': 'Alice@Example.com', 'password': 'Alice@12345'},
+            {'username': 'bob', 'email': 'not-an-email'},
+            {'username': 'testuser', 'email': 'other@example.com'},
+            {'username': 'carol', 'email': 'alice@example.com'},
+            {'username': 'dave', 'email': 'dave@example.com'},
+        ]
+        results = provision_users(rows, processes=0, chunk_size=2)
+
+        assert [r['status'] for r in results] == ['created', 'failed', 'failed', 'failed', 'created']
+        assert 'email' in results[1]['errors']
+        assert 'username' in results[2]['errors']
+        assert 'email' in results[3]['errors']
+
+        alice = CustomUser.objects.get(username='alice')
+        assert alice.email == 'alice@example.com'
+        assert alice.check_password('Alice@12345')
+        assert not CustomUser.objects.get(username='dave').has_usable_password()
+
+        created = CustomUser.objects.filter(username__in=['alice', 'dave'])
+        assert OneTimeToken.objects.filter(user__in=created, purpose='email_verification').count() == 2
+        assert OutboundEmail.objects.filter(user__in=created, status='pending').count() == 2
+        assert UserActivity.objects.filter(user__in=created, activity_type='registration').count() == 2
+
+    def test_csv_upload(self, admin_authenticated_client):
+        """Test admins can import a CSV file through the API"""
+        upload = SimpleUploadedFile(
+            'users.csv',
+            b'username,email,first_name\nerin,erin@example.com,Erin\nfrank,frank@example.com,Frank\n',
+        )
+        response = admin_authenticated_client.post(self.url, {'file': upload}, format='multipart')
+
+        assert response.status_code == 200
+        assert response.data['created'] == 2
+        assert CustomUser.objects.get(username='erin').first_name == 'Erin'
+
+    def test_admin_only(self, user_authenticated_client):
+        """Test regular users cannot import users"""
+        upload = SimpleUploadedFile('users.ndjson', b'{"username": "x", "email": "x@example.com"}\n')
+        response = user_authenticated_client.post(self.url, {'file': upload}, format='multipart')
+        assert response.status_code == 403
@@ -0,0 +1,112 @@
+import pytest
+from django.urls import reverse
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from authentication.models import RevokedToken
+from authentication.revocation import (
+    BloomFilter,
+    DatabaseRevocationStore,
+    LocalRevocationStore,
+    purge_expired_revocations,
+    revoke_token,
+)
+
+
+class TestBloomFilter:
+    def test_no_false_negatives(self):
+        """Test that every added item is reported as present"""
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        items = [f'jti-{i}' for i in range(1000)]
+        for item in items:
+            bloom.add(item)
+        assert all(item in bloom for item in items)
+        assert sum(f'other-{i}' in bloom for i in range(1000)) < 50
+
+    def test_false_positive_rate(self):
+        """Test that the expected false positive rate passes error_rate once the filter is over capacity"""
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f'jti-{i}')
+            bloom.add(f'jti-{i}')
+        assert 0.005 < bloom.false_positive_rate() < 0.02
+        for i in range(1000, 3000):
+            bloom.add(f'jti-{i}')
+        assert bloom.false_positive_rate() > 0.1
+
+
+class TestLocalRevocationStore:
+    def test_capacity_from_rate(self, settings):
+        """Test that the filter is sized for the revocation rate over the window"""
+        settings.TOKEN_REVOCATION_RATE = 2
+        store = LocalRevocationStore.from_settings()
+        assert store.capacity == 2 * store.window
+
+        settings.TOKEN_REVOCATION_BLOOM_CAPACITY = 500
+        assert LocalRevocationStore.from_settings().capacity == 500
+
+    def test_revoke_once(self):
+        """Test that only the first revocation of a jti succeeds"""
+        store = LocalRevocationStore(window=3600)
+        assert not store.is_revoked('abc')
+        assert store.revoke('abc', store.timer() + 60)
+        assert not store.revoke('abc', store.timer() + 60)
+        assert store.is_revoked('abc')
+
+    def test_revocation_expires(self, fake_timer):
+        """Test that a revocation lapses with its token"""
+        store = LocalRevocationStore(window=3600, timer=fake_timer)
+        store.revoke('abc', fake_timer.now + 60)
+        fake_timer.now += 61
+        assert not store.is_revoked('abc')
+
+
+@pytest.mark.django_db
+class TestDatabaseRevocationStore:
+    def test_other_process_sees_revocation(self, fake_timer):
+        """Test that a revocation reaches another store after its next sync"""
+        writer = DatabaseRevocationStore(window=3600, timer=fake_timer)
+        reader = DatabaseRevocationStore(window=3600, timer=fake_timer)
+        assert not reader.is_revoked('abc')
+
+        assert writer.revoke('abc', fake_timer.now + 60)
+        assert not writer.revoke('abc', fake_timer.now + 60)
+        fake_timer.now += reader.sync_interval
+        assert reader.is_revoked('abc')
+
+    def test_purge(self, fake_timer):
+        """Test that expired revocations are deleted"""
+        store = DatabaseRevocationStore(window=3600, timer=fake_timer)
+        store.revoke('new', fake_timer.now + 3600)
+        fake_timer.now -= 7200
+        store.revoke('old', fake_timer.now + 60)
+
+        assert purge_expired_revocations() == 1
+        assert list(RevokedToken.objects.values_list('jti', flat=True)) == ['new']
+
+
+@pytest.mark.django_db
+class TestTokenRevocation:
+    def test_refresh_token_is_single_use(self, api_client, regular_user):
+        """Test that a rotated refresh token cannot be exchanged again"""
+        refresh = str(RefreshToken.for_user(regular_user))
+        url = reverse('token_refresh')
+
+        first = api_client.post(url, {'refresh': refresh}, format='json')
+        assert first.status_code == status.HTTP_200_OK
+        assert first.data['refresh'] != refresh
+
+        second = api_client.post(url, {'refresh': refresh}, format='json')
+        assert second.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_revoked_access_token_rejected(self, api_client, regular_user):
+        """Test that verification and authentication reject a revoked token"""
+        access = RefreshToken.for_user(regular_user).access_token
+        revoke_token(access)
+
+        response = api_client.post(reverse('token_verify'), {'token': str(access)}, format='json')
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+        api_client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        response = api_client.get(reverse('check-2fa-status'))
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
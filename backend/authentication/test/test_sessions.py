@@ -0,0 +1,131 @@
+from datetime import timedelta
+
+import pytest
+from django.core.cache import cache
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+
+from authentication.models import CustomUser, UserActivity, UserSession
+from authentication.sessions import end_all_sessions, purge_dead_sessions
+from authentication.user_cache import get_cached_user, get_user_cache_key
+
+
+def login(api_client, username='testuser', password='Test@123'):
+    response = api_client.post(reverse('token_obtain_pair'), {
+        'username': username,
+        'password': password
+    }, format='json')
+    assert response.status_code == status.HTTP_200_OK
+    return response.data
+
+
+@pytest.mark.django_db
+class TestSessions:
+    def test_login_registers_session(self, api_client, regular_user):
+        """Test that each login opens a session listed for the user"""
+        login(api_client)
+        tokens = login(api_client)
+
+        api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        response = api_client.get(reverse('sessions'))
+
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.data) == 2
+        assert sum(session['current'] for session in response.data) == 1
+
+    def test_logout_ends_current_session(self, api_client, regular_user):
+        """Test that logout revokes the session's access and refresh tokens"""
+        tokens = login(api_client)
+        api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+
+        response = api_client.post(reverse('logout'))
+        assert response.status_code == status.HTTP_200_OK
+        assert UserActivity.objects.filter(user=regular_user, activity_type='logout').exists()
+
+        assert api_client.get(reverse('check-2fa-status')).status_code == status.HTTP_401_UNAUTHORIZED
+        api_client.credentials()
+        response = api_client.post(reverse('token_refresh'), {'refresh': tokens['refresh']}, format='json')
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_logout_ends_rotated_session(self, api_client, regular_user):
+        """Test that ending a session revokes the refresh token rotated into it"""
+        other = login(api_client)
+        rotated = api_client.post(reverse('token_refresh'), {'refresh': other['refresh']}, format='json').data
+        session = UserSession.objects.get(user=regular_user)
+
+        tokens = login(api_client)
+        api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        response = api_client.post(reverse('logout'), {'session_id': str(session.id)}, format='json')
+        assert response.status_code == status.HTTP_200_OK
+
+        api_client.credentials()
+        response = api_client.post(reverse('token_refresh'), {'refresh': rotated['refresh']}, format='json')
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_logout_all(self, api_client, regular_user, django_capture_on_commit_callbacks):
+        """Test that logging out everywhere invalidates every token of the user"""
+        other = login(api_client)
+        tokens = login(api_client)
+        api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+
+        with django_capture_on_commit_callbacks(execute=True):
+            response = api_client.post(reverse('logout-all'))
+        assert response.status_code == status.HTTP_200_OK
+
+        api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {other['access']}")
+        assert api_client.get(reverse('check-2fa-status')).status_code == status.HTTP_401_UNAUTHORIZED
+        api_client.credentials()
+        response = api_client.post(reverse('token_refresh'), {'refresh': other['refresh']}, format='json')
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+        # New logins are not affected
+        tokens = login(api_client)
+        api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        assert api_client.get(reverse('check-2fa-status')).status_code == status.HTTP_200_OK
+
+    def test_password_change_ends_sessions(self, api_client, regular_user, django_capture_on_commit_callbacks):
+        """Test that changing the password ends the user's sessions"""
+        tokens = login(api_client)
+        api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+
+        with django_capture_on_commit_callbacks(execute=True):
+            response = api_client.post(reverse('change-password'), {
+                'old_password': 'Test@123',
+                'new_password': 'NewTest@456',
+                'confirm_new_password': 'NewTest@456'
+            }, format='json')
+        assert response.status_code == status.HTTP_200_OK
+
+        assert api_client.get(reverse('check-2fa-status')).status_code == status.HTTP_401_UNAUTHORIZED
+        assert CustomUser.objects.get(pk=regular_user.pk).token_generation == 1
+
+    def test_end_all_sessions_invalidates_after_commit(self, regular_user, django_capture_on_commit_callbacks):
+        """Test that the cached user is dropped only once the new generation commits"""
+        key = get_user_cache_key(regular_user.pk)
+        get_cached_user(regular_user.pk)
+        with django_capture_on_commit_callbacks() as callbacks:
+            with transaction.atomic():
+                end_all_sessions(regular_user)
+            assert cache.get(key) is not None
+
+        for callback in callbacks:
+            callback()
+        assert cache.get(key) is None
+        assert get_cached_user(regular_user.pk).token_generation == 1
+
+    def test_purge_dead_sessions(self, api_client, regular_user):
+        """Test that expired and superseded sessions are deleted"""
+        login(api_client)
+        expired = UserSession.objects.get()
+        expired.expires_at = timezone.now() - timedelta(seconds=1)
+        expired.save()
+        login(api_client)
+        assert purge_dead_sessions() == 1
+
+        end_all_sessions(regular_user)
+        login(api_client)
+        live = UserSession.objects.get(generation=1)
+        assert purge_dead_sessions(batch_size=1) == 1
+        assert list(UserSession.objects.all()) == [live]
@@ -0,0 +1,85 @@
+import json
+from datetime import timedelta
+
+import jwt
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.exceptions import TokenError
+
+from authentication.models import SigningKey
+from authentication.signing import (
+    RefreshToken,
+    UntypedToken,
+    generate_signing_key,
+    get_key_ring,
+    rotate_signing_keys,
+)
+
+
+@pytest.mark.django_db
+class TestKeyRing:
+    def test_token_verifiable_from_jwks(self, api_client, regular_user):
+        """Test that another service can verify a login token with the published keys"""
+        access = api_client.post(reverse('token_obtain_pair'), {
+            'username': 'testuser',
+            'password': 'Test@123'
+        }, format='json').data['access']
+        jwks = api_client.get(reverse('jwks')).json()
+
+        kid = jwt.get_unverified_header(access)['kid']
+        key = jwt.PyJWKSet.from_dict(jwks)[kid]
+        payload = jwt.decode(access, key.key, algorithms=['RS256'])
+        assert payload['user_id'] == str(regular_user.id)
+
+    def test_jwks_conditional_get(self, client):
+        """Test that the key set is cacheable and revalidated with its ETag"""
+        response = client.get(reverse('jwks'))
+        assert response.status_code == status.HTTP_200_OK
+        assert 'max-age=300' in response['Cache-Control']
+
+        response = client.get(reverse('jwks'), HTTP_IF_NONE_MATCH=response['ETag'])
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    def test_rotation_publishes_key_ahead(self, regular_user):
+        """Test that a rotated key is published before it starts signing"""
+        ring = get_key_ring()
+        old_kid = ring.signing_key().kid
+        new_key, _ = rotate_signing_keys(force=True)
+        ring.load()
+
+        assert new_key.activated_at > timezone.now()
+        assert {key['kid'] for key in json.loads(ring.jwks)['keys']} == {old_kid, new_key.kid}
+        token = RefreshToken.for_user(regular_user)
+        assert jwt.get_unverified_header(str(token))['kid'] == old_kid
+
+    def test_superseded_keys_deleted(self):
+        """Test that keys are deleted once every token they signed has expired"""
+        now = timezone.now()
+        SigningKey.objects.all().delete()
+        old = generate_signing_key('EdDSA', now - timedelta(days=10))
+        generate_signing_key('EdDSA', now - timedelta(days=5))
+
+        _, deleted = rotate_signing_keys(now=now)
+        assert deleted == 1
+        assert not SigningKey.objects.filter(pk=old.pk).exists()
+
+    def test_eddsa(self, regular_user):
+        """Test that EdDSA keys sign and verify tokens"""
+        generate_signing_key('EdDSA', timezone.now())
+        get_key_ring().load()
+
+        token = str(RefreshToken.for_user(regular_user))
+        assert jwt.get_unverified_header(token)['alg'] == 'EdDSA'
+        assert UntypedToken(token)['user_id'] == str(regular_user.id)
+
+    def test_legacy_hs256(self, settings, regular_user):
+        """Test that HS256 tokens are accepted only while legacy tokens are allowed"""
+        token = str(tokens.RefreshToken.for_user(regular_user))
+        assert UntypedToken(token)['user_id'] == str(regular_user.id)
+
+        settings.JWT_ACCEPT_LEGACY_HS256 = False
+        with pytest.raises(TokenError):
+            UntypedToken(token)
@@ -0,0 +1,55 @@
+import pytest
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from authentication.throttles import LocalThrottleBackend
+
+class TestLocalThrottleBackend:
+    """Test the GCRA semantics of the local throttle backend"""
+
+    def test_allows_burst_up_to_limit(self, fake_timer):
+        """Test that the full allowance is available at once"""
+        backend = LocalThrottleBackend(timer=fake_timer)
+        results = [backend.hit('key', 5, 3600)[0] for _ in range(6)]
+        assert results == [True] * 5 + [False]
+
+    def test_allowance_replenishes_over_time(self, fake_timer):
+        """Test that one request is regained per emission interval"""
+        backend = LocalThrottleBackend(timer=fake_timer)
+        for _ in range(5):
+            backend.hit('key', 5, 3600)
+
+        allowed, retry_after = backend.hit('key', 5, 3600)
+        assert not allowed
+        assert retry_after == pytest.approx(720)
+
+        fake_timer.now += 720
+        assert backend.hit('key', 5, 3600)[0]
+        assert not backend.hit('key', 5, 3600)[0]
+
+    def test_keys_are_independent(self, fake_timer):
+        """Test that each key has its own allowance"""
+        backend = LocalThrottleBackend(timer=fake_timer)
+        assert backend.hit('a', 1, 60)[0]
+        assert backend.hit('b', 1, 60)[0]
+        assert not backend.hit('a', 1, 60)[0]
+
+@pytest.mark.django_db
+class TestLoginRateThrottle:
+    """Test the login throttle against the login endpoint"""
+
+    def test_account_throttled_across_addresses(self):
+        """Test that one account cannot be attacked from many IPs"""
+        url = reverse('token_obtain_pair')
+        responses = [
+            APIClient(REMOTE_ADDR=f'10.0.0.{i}').post(url, {
+                'username': 'victim',
+                'password': 'guess'
+            }, format='json')
+            for i in range(6)
+        ]
+
+        codes = [response.status_code for response in responses]
+        assert codes[:5] == [status.HTTP_401_UNAUTHORIZED] * 5
+        assert codes[5] == status.HTTP_429_TOO_MANY_REQUESTS
+        assert int(responses[5]['Retry-After']) > 0
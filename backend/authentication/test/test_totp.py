@@ -0,0 +1,103 @@
+import pytest
+import time
+from django.core.cache import cache
+from authentication.models import CustomUser, TOTPDevice
+from authentication.totp import (
+    create_totp_device,
+    get_totp_device_cache_key,
+    get_user_totp_device,
+    get_hotp_token,
+    get_totp_token,
+    verify_device_token,
+    verify_device_tokens,
+    verify_totp_token,
+)
+
+# RFC 4226 appendix D test secret ("12345678901234567890" in base32)
+RFC_SECRET = 'GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ'
+
+@pytest.fixture
+def user():
+    return CustomUser.objects.create_user(
+        username='totpuser',
+        email='totp@example.com',
+        password='Totp@1234'
+    )
+
+class TestTOTPEngine:
+    """Test the TOTP token primitives"""
+
+    def test_hotp_matches_rfc_4226(self):
+        """Test HOTP values against the RFC 4226 test vectors"""
+        expected = [755224, 287082, 359152, 969429, 338314, 254676, 287922, 162583, 399871, 520489]
+        assert [get_hotp_token(RFC_SECRET, i) for i in range(10)] == expected
+
+    def test_verify_accepts_padded_and_unpadded_tokens(self):
+        """Test that tokens are accepted with or without leading zeros"""
+        token = get_totp_token(RFC_SECRET)
+        assert verify_totp_token(RFC_SECRET, str(token))
+        assert verify_totp_token(RFC_SECRET, '%06d' % token)
+
+    def test_verify_rejects_malformed_tokens(self):
+        """Test that malformed tokens are rejected without raising"""
+        assert not verify_totp_token(RFC_SECRET, 'abcdef')
+        assert not verify_totp_token(RFC_SECRET, '1234567')
+        assert not verify_totp_token(RFC_SECRET, '')
+
+@pytest.mark.django_db
+class TestDeviceVerification:
+    """Test device-level verification with replay protection"""
+
+    def test_token_cannot_be_replayed(self, user):
+        """Test that an accepted token is rejected the second time"""
+        device = create_totp_device(user, "Phone")
+        token = get_totp_token(device.key)
+
+        assert verify_device_token(device, token)
+        assert not verify_device_token(device, token)
+
+        # A stale copy of the device does not bypass the check
+        stale = TOTPDevice.objects.get(pk=device.pk)
+        stale.last_verified_interval = None
+        assert not verify_device_token(stale, token)
+
+    def test_batch_verification(self, user):
+        """Test verifying several devices in one call"""
+        other = CustomUser.objects.create_user(
+            username='other', email='other@example.com', password='Other@1234'
+        )
+        first = create_totp_device(user, "Phone")
+        second = create_totp_device(other, "Phone")
+
+        # A code that matches none of the accepted windows
+        current = int(time.time() / 30)
+        valid = {get_hotp_token(second.key, current + i) for i in (-1, 0, 1)}
+        wrong = next(code for code in range(1000000) if code not in valid)
+
+        results = verify_device_tokens([
+            (first, get_totp_token(first.key)),
+            (second, wrong),
+        ])
+
+        assert results == [True, False]
+        first.refresh_from_db()
+        assert first.last_verified_interval is not None
+        assert TOTPDevice.objects.get(pk=second.pk).last_verified_interval is None
+
+    def test_batch_rejects_token_recorded_concurrently(self, user):
+        """Test that a batch does not accept a token another request already used"""
+        device = create_totp_device(user, "Phone")
+        token = get_totp_token(device.key)
+        stale = TOTPDevice.objects.get(pk=device.pk)
+
+        assert verify_device_token(device, token)
+        assert verify_device_tokens([(stale, token)]) == [False]
+
+    def test_cached_device_secret_encrypted(self, user):
+        """Test that the device cache does not hold the shared secret in clear"""
+        device = create_totp_device(user, "Phone")
+        TOTPDevice.objects.filter(pk=device.pk).update(confirmed=True)
+        get_user_totp_device(user)
+
+        assert device.key not in str(cache.get(get_totp_device_cache_key(user.pk, True)))
+        assert get_user_totp_device(user).key == device.key
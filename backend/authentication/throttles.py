@@ -1,12 +1,122 @@
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
 from rest_framework.throttling import SimpleRateThrottle
 
-class LoginRateThrottle(SimpleRateThrottle):
+from .metrics import THROTTLE_REJECTIONS
+
+
+class RedisThrottleBackend:
     """
-    Throttle for login attempts based on IP address
-    Limits login attempts to the rate specified in settings (default: 5/hour)
+    GCRA rate limiter evaluated atomically in Redis
+
+    Each key holds a single "theoretical arrival time", so memory is O(1) per
+    key regardless of the request rate, and the limit is shared by every
+    worker that talks to the same Redis.
+    """
+    # KEYS[1]: throttle key; ARGV[1]: emission interval (ms); ARGV[2]: period (ms)
+    SCRIPT = """
+    local t = redis.call('TIME')
+    local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+    local interval = tonumber(ARGV[1])
+    local period = tonumber(ARGV[2])
+    local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+    if tat < now then
+        tat = now
+    end
+    local new_tat = tat + interval
+    local allow_at = new_tat - period
+    if now < allow_at then
+        return {0, allow_at - now}
+    end
+    redis.call('SET', KEYS[1], new_tat, 'PX', new_tat - now)
+    return {1, 0}
+    """
+
+    def __init__(self):
+        self._script = None
+
+    def get_script(self):
+        if self._script is None:
+            from django_redis import get_redis_connection
+            self._script = get_redis_connection('default').register_script(self.SCRIPT)
+        return self._script
+
+    def hit(self, key, limit, period):
+        """
+        Record a request against a key
+
+        Args:
+            key: The throttle key
+            limit: Number of requests allowed per period
+            period: The period in seconds
+
+        Returns:
+            A tuple of (allowed, seconds until the next request is allowed)
+        """
+        interval_ms = int(period * 1000 / limit)
+        allowed, retry_after_ms = self.get_script()(keys=[key], args=[interval_ms, int(period * 1000)])
+        return bool(allowed), retry_after_ms / 1000
+
+
+class LocalThrottleBackend:
+    """
+    In-process GCRA rate limiter with the same semantics as the Redis backend
+
+    Limits are per process, so this is only suitable for tests and single
+    process development servers.
+    """
+    def __init__(self, timer=time.monotonic):
+        self.timer = timer
+        self._tats = {}
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, period):
+        interval = period / limit
+        with self._lock:
+            now = self.timer()
+            tat = max(self._tats.get(key, now), now)
+            new_tat = tat + interval
+            allow_at = new_tat - period
+            if now < allow_at:
+                return False, allow_at - now
+            self._tats[key] = new_tat
+            if len(self._tats) > 10000:
+                # Drop keys that are back to a full allowance
+                self._tats = {k: v for k, v in self._tats.items() if v > now}
+            return True, 0.0
+
+    def reset(self):
+        with self._lock:
+            self._tats.clear()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_throttle_backend():
+    """
+    Return the process-wide throttle backend configured by THROTTLE_BACKEND
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = import_string(settings.THROTTLE_BACKEND)()
+    return _backend
+
+
+class GCRARateThrottle(SimpleRateThrottle):
+    """
+    Rate throttle backed by the GCRA throttle backend
+
+    Uses the rate configured for ``scope`` like SimpleRateThrottle, but a
+    request is checked against every key returned by ``get_cache_keys``
+    and is rejected as soon as one of them is over its limit.
     """
-    scope = 'login'
-    
     def get_cache_key(self, request, view):
         # Use the IP address as the cache key
         ident = self.get_ident(request)
@@ -15,32 +125,68 @@ class LoginRateThrottle(SimpleRateThrottle):
             'ident': ident
         }
 
-class PasswordResetRateThrottle(SimpleRateThrottle):
+    def get_cache_keys(self, request, view):
+        key = self.get_cache_key(request, view)
+        return [key] if key else []
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.retry_after = None
+        backend = get_throttle_backend()
+        for key in self.get_cache_keys(request, view):
+            allowed, retry_after = backend.hit(key, self.num_requests, self.duration)
+            if not allowed:
+                self.retry_after = retry_after
+                THROTTLE_REJECTIONS.labels(scope=self.scope).inc()
+                return False
+        return True
+
+    def wait(self):
+        return self.retry_after
+
+
+class AccountRateThrottleMixin:
+    """
+    Also throttle on the account named in the request body, so one account
+    cannot be targeted from many addresses
+    """
+    account_fields = ('username', 'email')
+
+    def get_cache_keys(self, request, view):
+        keys = super().get_cache_keys(request, view)
+        for field in self.account_fields:
+            value = request.data.get(field) if hasattr(request.data, 'get') else None
+            if value:
+                keys.append(self.cache_format % {
+                    'scope': f'{self.scope}_account',
+                    'ident': str(value).strip().lower(),
+                })
+                break
+        return keys
+
+
+class LoginRateThrottle(AccountRateThrottleMixin, GCRARateThrottle):
+    """
+    Throttle for login attempts based on IP address and account
+    Limits login attempts to the rate specified in settings (default: 5/hour)
+    """
+    scope = 'login'
+
+
+class PasswordResetRateThrottle(AccountRateThrottleMixin, GCRARateThrottle):
     """
-    Throttle for password reset requests based on IP address
+    Throttle for password reset requests based on IP address and account
     Limits password reset requests to the rate specified in settings (default: 3/hour)
     """
     scope = 'password_reset'
-    
-    def get_cache_key(self, request, view):
-        # Use the IP address as the cache key
-        ident = self.get_ident(request)
-        return self.cache_format % {
-            'scope': self.scope,
-            'ident': ident
-        }
+    account_fields = ('email',)
 
-class EmailVerificationRateThrottle(SimpleRateThrottle):
+
+class EmailVerificationRateThrottle(GCRARateThrottle):
     """
     Throttle for email verification attempts based on IP address
     Limits verification attempts to the rate specified in settings (default: 10/hour)
     """
     scope = 'email_verification'
-    
-    def get_cache_key(self, request, view):
-        # Use the IP address as the cache key
-        ident = self.get_ident(request)
-        return self.cache_format % {
-            'scope': self.scope,
-            'ident': ident
-        }
\ No newline at end of file
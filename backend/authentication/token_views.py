@@ -1,101 +1,119 @@
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from .throttles import LoginRateThrottle
-from .models import LoginAttempt, UserActivity
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import generics, status
+from rest_framework.response import Response
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView, TokenVerifyView
+
+from .throttles import LoginRateThrottle
+from .audit import log_activity, log_login_attempt
+from .introspection import HasIntrospectionAccess, introspect_tokens
+from .metrics import LOGIN_ATTEMPTS
+from .serializers_jwt import (
+    CustomTokenObtainPairSerializer,
+    RevocableTokenRefreshSerializer,
+    RevocableTokenVerifySerializer,
+    TokenIntrospectionSerializer,
+)
+from .sessions import open_session
+from .user_cache import invalidate_cached_user
+from .utils import get_client_ip
 
 User = get_user_model()
 
 class CustomTokenObtainPairView(TokenObtainPairView):
     """
     Custom token obtain view with rate limiting and login tracking
+
+    The serializer resolves the user once and hands the same instance back
+    here, so a successful login costs one user lookup plus a single
+    transaction for the post-login bookkeeping.
     """
+    serializer_class = CustomTokenObtainPairSerializer
     throttle_classes = [LoginRateThrottle]
-    
+    query_budget = 7
+
     def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+
         try:
-            # Add additional logging
-            print(f"Login attempt: {request.data}")
-            
-            # Extract credentials for tracking
-            username = request.data.get('username', '')
-            email = request.data.get('email', '')
-            
-            # If email is provided but username isn't, try to find the user by email
-            if email and not username:
-                try:
-                    user = User.objects.get(email=email)
-                    # Create a copy of the request data
-                    modified_data = request.data.copy()
-                    # Add the username to the request data
-                    modified_data['username'] = user.username
-                    request._full_data = modified_data
-                    print(f"Found user by email: {user.username}")
-                except User.DoesNotExist:
-                    print(f"No user found with email: {email}")
-            
-            # Get the IP address
-            x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-            if x_forwarded_for:
-                ip = x_forwarded_for.split(',')[0]
-            else:
-                ip = request.META.get('REMOTE_ADDR', '')
-                
-            # Try to get the response from the parent class
-            response = super().post(request, *args, **kwargs)
-            
-            # Log successful response
-            print(f"Login successful: {response.data}")
-            
-            # If we get a 200 response, the login was successful
-            if response.status_code == 200:
-                try:
-                    # Find the user that logged in - first try username, then email
-                    user = None
-                    if username:
-                        user = User.objects.get(username=username)
-                    elif email:
-                        user = User.objects.get(email=email)
-                    
-                    if user:
-                        # Update last login IP
-                        user.last_login_ip = ip
-                        user.save(update_fields=['last_login_ip'])
-                        
-                        # Log successful login
-                        LoginAttempt.objects.create(
-                            user=user,
-                            ip_address=ip,
-                            successful=True
-                        )
-                        
-                        # Log login activity
-                        UserActivity.objects.create(
-                            user=user,
-                            activity_type='login',
-                            ip_address=ip
-                        )
-                        
-                        # Add user info to response
-                        user_data = {
-                            'id': str(user.id),
-                            'username': user.username,
-                            'email': user.email,
-                            'is_staff': user.is_staff,
-                            'is_verified': user.is_verified
-                        }
-                        response.data['user'] = user_data
-                except User.DoesNotExist:
-                    pass  # Should not happen since login succeeded
-                    
-            return response
-        except Exception as e:
-            # Log any exceptions during login
-            print(f"Login error: {str(e)}")
-            raise
+            serializer.is_valid(raise_exception=True)
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
+
+        record_login(
+            serializer.user,
+            get_client_ip(request),
+            serializer.refresh,
+            request.META.get('HTTP_USER_AGENT', ''),
+        )
+
+        return Response(serializer.validated_data, status=status.HTTP_200_OK)
+
+
+def record_login(user, ip, refresh, user_agent=''):
+    """
+    Update the login fields, register the new session and write the audit
+    rows in one transaction
+    """
+    fields = {'last_login_ip': ip}
+    if api_settings.UPDATE_LAST_LOGIN:
+        fields['last_login'] = timezone.now()
+
+    with transaction.atomic():
+        # A queryset update skips the full-row save and its signals
+        User.objects.filter(pk=user.pk).update(**fields)
+        for name, value in fields.items():
+            setattr(user, name, value)
+        invalidate_cached_user(user.pk)
+        open_session(user, refresh, ip, user_agent)
+
+        # Audit rows go through the buffered writer when it is enabled
+        log_login_attempt(user=user, ip_address=ip, successful=True)
+        log_activity(user=user, activity_type='login', ip_address=ip)
+
+    LOGIN_ATTEMPTS.labels(outcome='success').inc()
 
 
 class CustomTokenRefreshView(TokenRefreshView):
     """
-    Custom token refresh view
+    Token refresh view that revokes rotated refresh tokens
     """
-    pass  # Add custom logic here if needed in the future
+    serializer_class = RevocableTokenRefreshSerializer
+
+
+class CustomTokenVerifyView(TokenVerifyView):
+    """
+    Token verify view that rejects revoked tokens
+    """
+    serializer_class = RevocableTokenVerifySerializer
+
+
+class TokenIntrospectionView(generics.GenericAPIView):
+    """
+    Check up to TOKEN_INTROSPECTION_MAX_TOKENS tokens in one request
+
+    Meant for gateways that would otherwise call the verify endpoint once
+    per token. Returns one result per token, in order, with its validity,
+    claims, revocation status and whether its user is active.
+    """
+    serializer_class = TokenIntrospectionSerializer
+    permission_classes = [HasIntrospectionAccess]
+    # Callers are trusted services verifying on behalf of many clients
+    throttle_classes = []
+    # One query for uncached users, one for revocations in the database store
+    query_budget = 2
+
+    def get_authenticators(self):
+        # The introspection secret is not a JWT
+        if settings.TOKEN_INTROSPECTION_SECRET:
+            return []
+        return super().get_authenticators()
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response({'results': introspect_tokens(serializer.validated_data['tokens'])})
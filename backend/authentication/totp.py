@@ -5,9 +5,21 @@ import time
 import hashlib
 import random
 import string
+from functools import lru_cache
+from django.conf import settings
+from cryptography.fernet import InvalidToken
+from django.core.cache import cache
+from django.db import router
+from django.db.models import Q
 from django.utils import timezone
+from .crypto import decrypt_text, encrypt_text
+from .instrumentation import record_cache_lookup
+from .metrics import TOTP_VERIFICATION_SECONDS
 from .models import TOTPDevice
 
+_INTERVAL = struct.Struct(">Q")
+_TRUNCATED = struct.Struct(">I")
+
 def generate_totp_secret():
     """
     Generate a random base32 encoded secret for TOTP
@@ -22,26 +34,31 @@ def generate_totp_uri(username, secret, issuer="YourApp"):
     """
     return f"otpauth://totp/{issuer}:{username}?secret={secret}&issuer={issuer}"
 
+@lru_cache(maxsize=4096)
+def get_hmac_prototype(secret):
+    """
+    Get a keyed HMAC-SHA1 object for a secret
+
+    The secret is base32-decoded and the HMAC key schedule computed once;
+    callers ``copy()`` the prototype for each message.
+    """
+    key = base64.b32decode(secret, True)
+    return hmac.new(key, digestmod=hashlib.sha1)
+
 def get_hotp_token(secret, intervals_no):
     """
     Generate an HOTP token
     """
-    # Convert the secret from base32 to bytes
-    key = base64.b32decode(secret, True)
-    
-    # Convert intervals_no to bytes
-    msg = struct.pack(">Q", intervals_no)
-    
-    # Generate HMAC-SHA1
-    h = hmac.new(key, msg, hashlib.sha1).digest()
-    
+    # Reuse the keyed HMAC instead of decoding the secret again
+    h = get_hmac_prototype(secret).copy()
+    h.update(_INTERVAL.pack(intervals_no))
+    digest = h.digest()
+
     # Generate a 4-byte string (Dynamic Truncation)
-    o = h[19] & 15
-    
+    o = digest[19] & 15
+
     # Generate HOTP value
-    h = (struct.unpack(">I", h[o:o+4])[0] & 0x7fffffff) % 1000000
-    
-    return h
+    return (_TRUNCATED.unpack_from(digest, o)[0] & 0x7fffffff) % 1000000
 
 def get_totp_token(secret, window=30):
     """
@@ -49,58 +66,205 @@ def get_totp_token(secret, window=30):
     """
     # Get the intervals number (number of intervals since Unix epoch)
     intervals_no = int(time.time() / window)
-    
+
     # Generate and return the token
     return get_hotp_token(secret, intervals_no)
 
-def verify_totp_token(secret, token, window=30, tolerance=1):
+def normalize_totp_token(token):
     """
-    Verify a TOTP token
-    
+    Return a token as a zero-padded 6-digit string, or None if malformed
+    """
+    token = str(token).strip()
+    if not token.isdigit() or len(token) > 6:
+        return None
+    return token.zfill(6)
+
+def match_totp_interval(secret, token, window=30, tolerance=1, after=None, now=None):
+    """
+    Find the interval a TOTP token was generated for
+
+    Every window in the tolerance range is checked and compared in constant
+    time, so the response time does not reveal which window matched.
+
     Args:
         secret: The shared secret
         token: The token to verify
         window: The time window in seconds (default 30)
         tolerance: The number of windows to check before and after the current one
+        after: Reject intervals up to and including this one (replay protection)
+        now: The current Unix time, defaults to time.time()
+
+    Returns:
+        The matching interval number, or None
     """
-    token = int(token)
-    
+    token = normalize_totp_token(token)
+    if token is None:
+        return None
+
     # Current interval number
-    intervals_no = int(time.time() / window)
-    
-    # Check tokens within the tolerance
+    intervals_no = int((time.time() if now is None else now) / window)
+
+    matched = None
     for i in range(-tolerance, tolerance + 1):
-        if get_hotp_token(secret, intervals_no + i) == token:
-            return True
-            
-    return False
+        candidate = intervals_no + i
+        expected = '%06d' % get_hotp_token(secret, candidate)
+        if hmac.compare_digest(expected, token) and matched is None:
+            matched = candidate
+
+    if matched is not None and after is not None and matched <= after:
+        return None
+    return matched
+
+def verify_totp_token(secret, token, window=30, tolerance=1):
+    """
+    Verify a TOTP token
+
+    Args:
+        secret: The shared secret
+        token: The token to verify
+        window: The time window in seconds (default 30)
+        tolerance: The number of windows to check before and after the current one
+    """
+    return match_totp_interval(secret, token, window, tolerance) is not None
+
+@TOTP_VERIFICATION_SECONDS.time()
+def verify_device_token(device, token):
+    """
+    Verify a TOTP token for a device and record it so it cannot be replayed
+
+    The accepted interval is stored with a conditional update, so two
+    requests racing with the same token cannot both succeed.
+
+    Args:
+        device: The TOTP device
+        token: The TOTP token
+    """
+    interval = match_totp_interval(device.key, token, after=device.last_verified_interval)
+    if interval is None:
+        return False
+
+    now = timezone.now()
+    updated = TOTPDevice.objects.filter(
+        Q(last_verified_interval__isnull=True) | Q(last_verified_interval__lt=interval),
+        pk=device.pk,
+    ).update(last_verified_interval=interval, last_used=now)
+    if not updated:
+        return False
+
+    device.last_verified_interval = interval
+    device.last_used = now
+    return True
+
+def verify_device_tokens(pairs):
+    """
+    Verify many (device, token) pairs in one call
+
+    All pairs are checked against the same clock reading. Each device's
+    accepted intervals are then recorded with one conditional update, as in
+    verify_device_token; if another request recorded one of them first,
+    every token of that device in the batch is rejected.
+
+    Args:
+        pairs: An iterable of (TOTPDevice, token) tuples
+
+    Returns:
+        A list of booleans in the same order as ``pairs``
+    """
+    now = time.time()
+    results = []
+    # Device pk to [first accepted interval, last accepted interval, pairs]
+    accepted = {}
+    for device, token in pairs:
+        after = device.last_verified_interval
+        if device.pk in accepted:
+            # The same device twice in one batch: the later token must be newer
+            after = max(after or 0, accepted[device.pk][1])
+        interval = match_totp_interval(device.key, token, after=after, now=now)
+        results.append(interval is not None)
+        if interval is not None:
+            entry = accepted.setdefault(device.pk, [interval, interval, []])
+            entry[1] = interval
+            entry[2].append((len(results) - 1, device))
+
+    used_at = timezone.now()
+    for pk, (first, last, matches) in accepted.items():
+        updated = TOTPDevice.objects.filter(
+            Q(last_verified_interval__isnull=True) | Q(last_verified_interval__lt=first),
+            pk=pk,
+        ).update(last_verified_interval=last, last_used=used_at)
+        for index, device in matches:
+            if updated:
+                device.last_verified_interval = last
+                device.last_used = used_at
+            else:
+                results[index] = False
+    return results
+
+def get_totp_device_cache_key(user_id, confirmed):
+    """
+    Cache key for a user's TOTP device
+    """
+    return f"totp_device:v2:{user_id}:{int(confirmed)}"
+
+def dump_cached_device(device):
+    """
+    Cache entry for a device, holding its shared secret encrypted
+    """
+    data = {field.attname: getattr(device, field.attname) for field in TOTPDevice._meta.concrete_fields}
+    data['key'] = encrypt_text(device.key)
+    return data
+
+def load_cached_device(data):
+    """
+    Rebuild a device from dump_cached_device output, or return None if the
+    secret cannot be decrypted with the current key
+    """
+    try:
+        secret = decrypt_text(data['key'])
+    except InvalidToken:
+        return None
+    names = [field.attname for field in TOTPDevice._meta.concrete_fields]
+    values = [secret if name == 'key' else data[name] for name in names]
+    return TOTPDevice.from_db(router.db_for_read(TOTPDevice), names, values)
 
 def get_user_totp_device(user, confirmed=True):
     """
     Get a user's TOTP device
-    
+
+    Devices are cached until the user's 2FA state is invalidated, with the
+    shared secret encrypted; replay protection does not depend on the cached
+    copy being current.
+
     Args:
         user: The user
         confirmed: Whether to only get confirmed devices
     """
-    devices = TOTPDevice.objects.filter(user=user)
-    
-    if confirmed:
-        devices = devices.filter(confirmed=True)
-        
-    return devices.first()
+    key = get_totp_device_cache_key(user.pk, confirmed)
+    data = cache.get(key)
+    device = load_cached_device(data) if data is not None else None
+    record_cache_lookup(device is not None)
+    if device is None:
+        devices = TOTPDevice.objects.filter(user=user)
+
+        if confirmed:
+            devices = devices.filter(confirmed=True)
+
+        device = devices.first()
+        if device is not None:
+            cache.set(key, dump_cached_device(device), settings.TWO_FACTOR_STATE_CACHE_TTL)
+    return device
 
 def create_totp_device(user, name="Default"):
     """
     Create a new TOTP device for a user
-    
+
     Args:
         user: The user
         name: The name of the device
     """
     # Generate a new secret
     secret = generate_totp_secret()
-    
+
     # Create and save the device
     device = TOTPDevice.objects.create(
         user=user,
@@ -108,20 +272,94 @@ def create_totp_device(user, name="Default"):
         key=secret,
         confirmed=False
     )
-    
+    invalidate_two_factor_state(user)
+
     return device
 
 def confirm_totp_device(device, token):
     """
     Confirm a TOTP device with a token
-    
+
     Args:
         device: The TOTP device
         token: The TOTP token
     """
-    if verify_totp_token(device.key, token):
+    if verify_device_token(device, token):
         device.confirmed = True
-        device.last_used = timezone.now()
-        device.save()
+        device.save(update_fields=['confirmed'])
+        invalidate_two_factor_state(device.user)
         return True
-    return False
\ No newline at end of file
+    return False
+
+def get_two_factor_state_key(user_id):
+    """
+    Cache key for a user's 2FA state
+    """
+    return f"two_factor_state:{user_id}"
+
+def get_two_factor_state(user):
+    """
+    Get a user's 2FA state from the shared cache, loading it on a miss
+
+    Args:
+        user: The user
+
+    Returns:
+        A dict with ``enabled`` and ``has_confirmed_device`` flags
+    """
+    key = get_two_factor_state_key(user.pk)
+    state = cache.get(key)
+    record_cache_lookup(state is not None)
+    if state is None:
+        enabled = user.two_factor_enabled
+        state = {
+            'enabled': enabled,
+            'has_confirmed_device': enabled and TOTPDevice.objects.filter(
+                user=user,
+                confirmed=True
+            ).exists(),
+        }
+        cache.set(key, state, settings.TWO_FACTOR_STATE_CACHE_TTL)
+    return state
+
+async def aget_two_factor_state(user):
+    """
+    Async variant of get_two_factor_state
+    """
+    key = get_two_factor_state_key(user.pk)
+    state = await cache.aget(key)
+    record_cache_lookup(state is not None)
+    if state is None:
+        enabled = user.two_factor_enabled
+        state = {
+            'enabled': enabled,
+            'has_confirmed_device': enabled and await TOTPDevice.objects.filter(
+                user=user,
+                confirmed=True
+            ).aexists(),
+        }
+        await cache.aset(key, state, settings.TWO_FACTOR_STATE_CACHE_TTL)
+    return state
+
+def invalidate_two_factor_state(user):
+    """
+    Drop a user's cached 2FA state and devices after they change
+
+    Args:
+        user: The user
+    """
+    cache.delete_many([
+        get_two_factor_state_key(user.pk),
+        get_totp_device_cache_key(user.pk, True),
+        get_totp_device_cache_key(user.pk, False),
+    ])
+
+async def ainvalidate_two_factor_state(user):
+    """
+    Async variant of invalidate_two_factor_state
+    """
+    await cache.adelete_many([
+        get_two_factor_state_key(user.pk),
+        get_totp_device_cache_key(user.pk, True),
+        get_totp_device_cache_key(user.pk, False),
+    ])
@@ -2,10 +2,12 @@ from rest_framework import serializers
 from django.conf import settings
 import pyotp
 from django.contrib.auth import get_user_model
+from .hashing import check_user_password
+from .instrumentation import TimedSerializerMixin
 
 User = get_user_model()
 
-class TOTPSetupSerializer(serializers.Serializer):
+class TOTPSetupSerializer(TimedSerializerMixin, serializers.Serializer):
     """
     Serializer for setting up TOTP-based 2FA
     """
@@ -28,32 +30,25 @@ class TOTPSetupSerializer(serializers.Serializer):
             'totp_uri': totp_uri
         }
 
-class TOTPVerifySerializer(serializers.Serializer):
+class TOTPVerifySerializer(TimedSerializerMixin, serializers.Serializer):
     """
     Serializer for verifying TOTP code and enabling 2FA
-    """
-    totp_code = serializers.CharField(required=True)
-    totp_secret = serializers.CharField(required=True)
     
-    def validate(self, attrs):
-        totp_code = attrs.get('totp_code')
-        totp_secret = attrs.get('totp_secret')
-        
-        # Verify the TOTP code
-        totp = pyotp.TOTP(totp_secret)
-        if not totp.verify(totp_code):
-            raise serializers.ValidationError("Invalid verification code")
-        
-        return attrs
+    The token is checked against the user's pending device by the view.
+    """
+    # Clients that send the code as a number drop its leading zeros
+    token = serializers.RegexField(r'^\d{1,6}$', required=True)
 
-class TOTPDisableSerializer(serializers.Serializer):
+class TOTPDisableSerializer(TimedSerializerMixin, serializers.Serializer):
     """
     Serializer for disabling 2FA
     """
     password = serializers.CharField(required=True, style={'input_type': 'password'})
+    # Clients that send the code as a number drop its leading zeros
+    token = serializers.RegexField(r'^\d{1,6}$', required=True)
     
     def validate_password(self, value):
         user = self.context['request'].user
-        if not user.check_password(value):
+        if not check_user_password(user, value):
             raise serializers.ValidationError("Incorrect password")
         return value
\ No newline at end of file
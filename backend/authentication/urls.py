@@ -1,9 +1,15 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from rest_framework_simplejwt.views import TokenVerifyView
 
 from .views import UserViewSet
-from .token_views import CustomTokenObtainPairView, CustomTokenRefreshView
+from .token_views import (
+    CustomTokenObtainPairView,
+    CustomTokenRefreshView,
+    CustomTokenVerifyView,
+    TokenIntrospectionView,
+)
+from .export_views import AuditLogExportView
 
 # Create a router and register our viewsets
 router = DefaultRouter()
@@ -16,7 +22,8 @@ urlpatterns = [
     # JWT Token-related URLs
     path('token/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', CustomTokenRefreshView.as_view(), name='token_refresh'),
-    path('token/verify/', TokenVerifyView.as_view(), name='token_verify'),
+    path('token/verify/', CustomTokenVerifyView.as_view(), name='token_verify'),
+    path('token/introspect/', TokenIntrospectionView.as_view(), name='token_introspect'),
     
     # Custom authentication-related URLs
     path('register/', UserViewSet.as_view({'post': 'create'}), name='user-register'),
@@ -24,6 +31,10 @@ urlpatterns = [
     path('reset-password-request/', UserViewSet.as_view({'post': 'reset_password_request'}), name='reset-password-request'),
     path('reset-password-confirm/', UserViewSet.as_view({'post': 'reset_password_confirm'}), name='reset-password-confirm'),
     path('verify-email/', UserViewSet.as_view({'post': 'verify_email'}), name='verify-email'),
+    path('profile/', UserViewSet.as_view({'get': 'profile', 'patch': 'profile'}), name='profile'),
+    path('sessions/', UserViewSet.as_view({'get': 'sessions'}), name='sessions'),
+    path('logout/', UserViewSet.as_view({'post': 'logout'}), name='logout'),
+    path('logout-all/', UserViewSet.as_view({'post': 'logout_all'}), name='logout-all'),
     path('user/<uuid:pk>/deactivate/', UserViewSet.as_view({'delete': 'deactivate_account'}), name='deactivate-account'),
     
     # Two-factor authentication endpoints
@@ -31,4 +42,10 @@ urlpatterns = [
     path('verify-2fa/', UserViewSet.as_view({'post': 'verify_2fa'}), name='verify-2fa'),
     path('disable-2fa/', UserViewSet.as_view({'post': 'disable_2fa'}), name='disable-2fa'),
     path('check-2fa-status/', UserViewSet.as_view({'get': 'check_2fa_status'}), name='check-2fa-status'),
-]
\ No newline at end of file
+
+    # Audit log exports (staff only)
+    path('audit/<str:kind>/export/', AuditLogExportView.as_view(), name='audit-export'),
+]
+
+if settings.ASYNC_AUTH_VIEWS:
+    urlpatterns = [path('', include('authentication.async_urls'))] + urlpatterns
@@ -0,0 +1,147 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import router, transaction
+
+from .instrumentation import record_cache_lookup
+
+# Bump when the shape of the cached user changes so stale entries are ignored
+USER_CACHE_VERSION = 3
+
+# Columns left out of the cache; they are loaded from the database on
+# first access, and saving a cached user does not write them
+UNCACHED_FIELDS = ('password',)
+
+# Token claims embedded by CustomTokenObtainPairSerializer.get_token
+CLAIM_FIELDS = ('username', 'email', 'is_staff', 'is_verified')
+
+
+def get_user_cache_key(user_id):
+    """
+    Cache key for a user instance
+    """
+    return f"user:v{USER_CACHE_VERSION}:{user_id}"
+
+
+def _cached_field_names():
+    return [
+        field.attname for field in get_user_model()._meta.concrete_fields
+        if field.attname not in UNCACHED_FIELDS
+    ]
+
+
+def dump_user(user):
+    """
+    Cache entry for a user: its column values, without UNCACHED_FIELDS
+    """
+    return {name: getattr(user, name) for name in _cached_field_names()}
+
+
+def load_user(data):
+    """
+    Rebuild a user from a dump_user entry, with UNCACHED_FIELDS deferred
+    """
+    User = get_user_model()
+    names = _cached_field_names()
+    return User.from_db(router.db_for_read(User), names, [data[name] for name in names])
+
+
+def get_cached_user(user_id):
+    """
+    Get a user by primary key from the shared cache, loading it on a miss
+
+    Returns:
+        The user, or None if it does not exist
+    """
+    key = get_user_cache_key(user_id)
+    data = cache.get(key)
+    record_cache_lookup(data is not None)
+    if data is None:
+        User = get_user_model()
+        try:
+            user = User.objects.get(pk=user_id)
+        except User.DoesNotExist:
+            return None
+        data = dump_user(user)
+        cache.set(key, data, settings.USER_CACHE_TTL)
+    return load_user(data)
+
+
+async def aget_cached_user(user_id):
+    """
+    Async variant of get_cached_user
+    """
+    key = get_user_cache_key(user_id)
+    data = await cache.aget(key)
+    record_cache_lookup(data is not None)
+    if data is None:
+        User = get_user_model()
+        try:
+            user = await User.objects.aget(pk=user_id)
+        except User.DoesNotExist:
+            return None
+        data = dump_user(user)
+        await cache.aset(key, data, settings.USER_CACHE_TTL)
+    return load_user(data)
+
+
+def get_cached_users(user_ids):
+    """
+    Batch variant of get_cached_user: one cache multi-get, and one query
+    for the users that were not cached
+
+    Returns:
+        A dict of user id to user, without the ids that do not exist
+    """
+    keys = {get_user_cache_key(user_id): user_id for user_id in set(map(str, user_ids))}
+    cached = cache.get_many(list(keys))
+    users = {}
+    for key, user_id in keys.items():
+        record_cache_lookup(key in cached)
+        if key in cached:
+            users[user_id] = load_user(cached[key])
+
+    missing = [user_id for user_id in keys.values() if user_id not in users]
+    if missing:
+        loaded = {
+            str(user.pk): dump_user(user)
+            for user in get_user_model().objects.filter(pk__in=missing)
+        }
+        cache.set_many(
+            {get_user_cache_key(user_id): data for user_id, data in loaded.items()},
+            settings.USER_CACHE_TTL,
+        )
+        users.update((user_id, load_user(data)) for user_id, data in loaded.items())
+    return users
+
+
+def invalidate_cached_user(user_id):
+    """
+    Drop a cached user after it changes
+
+    Inside a transaction the entry is dropped once it commits, so a
+    concurrent cache miss cannot reload the old row and cache it again.
+    """
+    key = get_user_cache_key(user_id)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def build_user_from_claims(user_id, claims):
+    """
+    Build a user from the claims embedded in an access token without a query
+
+    Fields that are not carried by the token are deferred and loaded from
+    the database on first access, and saving the instance only writes the
+    fields that were loaded.
+    """
+    User = get_user_model()
+    known = {'id': user_id}
+    known.update((name, claims[name]) for name in CLAIM_FIELDS if name in claims)
+
+    field_names = []
+    values = []
+    for field in User._meta.concrete_fields:
+        if field.attname in known:
+            field_names.append(field.attname)
+            values.append(field.to_python(known[field.attname]))
+    return User.from_db(router.db_for_read(User), field_names, values)
@@ -1,22 +1,43 @@
+import uuid
+
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError as APIValidationError
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
-from django.contrib.auth import get_user_model
-from django.core.mail import send_mail
 from django.conf import settings
-from django.utils.crypto import get_random_string
+from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
 
-from .models import LoginAttempt, UserActivity, TOTPDevice
-from .totp import create_totp_device, generate_totp_uri, confirm_totp_device, verify_totp_token
+from .models import TOTPDevice
+from .audit import log_activity
+from .hashing import set_user_password
+from .mail import queue_password_reset_email, queue_verification_email
+from .one_time_tokens import consume_token, get_valid_token, issue_token
+from .pagination import UserPagination
+from .profiles import get_cached_profile
+from .provisioning import FORMATS as IMPORT_FORMATS, parse_rows, provision_users
+from .revocation import revoke_token
+from .sessions import SESSION_CLAIM, end_all_sessions, end_session, live_sessions
+from .totp import (
+    create_totp_device,
+    generate_totp_uri,
+    confirm_totp_device,
+    get_user_totp_device,
+    verify_device_token,
+    invalidate_two_factor_state
+)
+from .throttles import EmailVerificationRateThrottle, PasswordResetRateThrottle
 from .two_factor_serializers import TOTPSetupSerializer, TOTPVerifySerializer, TOTPDisableSerializer
+from .utils import get_client_ip
 from .serializers import (
     UserRegistrationSerializer, 
     UserProfileSerializer, 
     PasswordChangeSerializer,
-    PasswordResetRequestSerializer
+    PasswordResetRequestSerializer,
+    UserSessionSerializer
 )
 
 User = get_user_model()
@@ -29,6 +50,32 @@ class UserViewSet(viewsets.ModelViewSet):
     serializer_class = UserProfileSerializer
     permission_classes = [IsAuthenticated]
 
+    pagination_class = UserPagination
+
+    # Boolean filters accepted by the list action
+    list_filter_fields = ('is_verified', 'is_active', 'two_factor_enabled')
+
+    # Queries allowed per action, enforced by RequestMetricsMiddleware; the
+    # counts the tests measure (savepoints included), with at most one spare
+    query_budget = {
+        'list': 2,
+        'retrieve': 2,
+        'profile': 2,
+        'create': 14,
+        'change_password': 5,
+        'reset_password_request': 11,
+        'reset_password_confirm': 8,
+        'verify_email': 6,
+        'deactivate_account': 5,
+        'setup_2fa': 4,
+        'verify_2fa': 7,
+        'disable_2fa': 7,
+        'check_2fa_status': 2,
+        'sessions': 2,
+        'logout': 6,
+        'logout_all': 3,
+    }
+
     def get_permissions(self):
         """
         Custom permission mapping
@@ -36,7 +83,7 @@ class UserViewSet(viewsets.ModelViewSet):
         - reset_password_request, verify_email, reset_password_confirm: Allow any user
         - Other actions: Require authentication
         """
-        if self.action in ['create', 'deactivate_account']:
+        if self.action in ['create', 'deactivate_account', 'bulk_import']:
             permission_classes = [IsAdminUser]
         elif self.action in ['reset_password_request', 'verify_email', 'reset_password_confirm']:
             permission_classes = [AllowAny]
@@ -44,6 +91,64 @@ class UserViewSet(viewsets.ModelViewSet):
             permission_classes = [IsAuthenticated]
         return [permission() for permission in permission_classes]
 
+    def get_throttles(self):
+        """
+        Add the endpoint specific throttles to the default ones
+        """
+        throttles = super().get_throttles()
+        if self.action == 'reset_password_request':
+            throttles.append(PasswordResetRateThrottle())
+        elif self.action == 'verify_email':
+            throttles.append(EmailVerificationRateThrottle())
+        return throttles
+
+    def get_queryset(self):
+        """
+        Apply the list filters and only load the columns being serialized
+        """
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            queryset = queryset.filter(**self.get_list_filters())
+            # date_joined is always loaded for the pagination cursor
+            queryset = queryset.only('date_joined', *self.get_list_fields())
+        return queryset
+
+    def get_list_filters(self):
+        """
+        Boolean filters from the query string, e.g. ?is_verified=true
+        """
+        filters = {}
+        for name in self.list_filter_fields:
+            value = self.request.query_params.get(name)
+            if value is None:
+                continue
+            if value.lower() in ('true', '1'):
+                filters[name] = True
+            elif value.lower() in ('false', '0'):
+                filters[name] = False
+            else:
+                raise APIValidationError({name: 'Must be true or false'})
+        return filters
+
+    def get_list_fields(self):
+        """
+        Fields requested with ?fields=id,username, defaulting to all of them
+        """
+        allowed = UserProfileSerializer.Meta.fields
+        requested = self.request.query_params.get('fields')
+        if not requested:
+            return list(allowed)
+        fields = [name.strip() for name in requested.split(',') if name.strip()]
+        unknown = set(fields) - set(allowed)
+        if unknown:
+            raise APIValidationError({'fields': f'Unknown fields: {", ".join(sorted(unknown))}'})
+        return fields
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action == 'list':
+            kwargs['fields'] = self.get_list_fields()
+        return super().get_serializer(*args, **kwargs)
+
     def get_serializer_class(self):
         """
         Return appropriate serializer based on action
@@ -60,6 +165,8 @@ class UserViewSet(viewsets.ModelViewSet):
             return TOTPVerifySerializer
         elif self.action == 'disable_2fa':
             return TOTPDisableSerializer
+        elif self.action == 'sessions':
+            return UserSessionSerializer
         return UserProfileSerializer
 
     def create(self, request):
@@ -71,26 +178,13 @@ class UserViewSet(viewsets.ModelViewSet):
         user = serializer.save()
         
         # Generate email verification token
-        verification_token = get_random_string(length=32)
-        user.email_verification_token = verification_token
-        user.save()
+        verification_token = issue_token(user, 'email_verification')
         
-        # Send verification email
-        try:
-            verification_link = f"{settings.FRONTEND_URL}/verify-email?token={verification_token}"
-            send_mail(
-                'Verify Your Email',
-                f'Click the link to verify your email: {verification_link}',
-                settings.DEFAULT_FROM_EMAIL,
-                [user.email],
-                fail_silently=False,
-            )
-        except Exception as e:
-            # Log email sending failure
-            print(f"Failed to send verification email: {e}")
+        # Queue verification email for the mail worker
+        queue_verification_email(user, verification_token)
         
         # Log user registration activity
-        UserActivity.objects.create(
+        log_activity(
             user=user,
             activity_type='registration',
             ip_address=self.get_client_ip(request),
@@ -102,6 +196,19 @@ class UserViewSet(viewsets.ModelViewSet):
             'message': 'User registered successfully. Verification email sent.'
         }, status=status.HTTP_201_CREATED)
 
+    def retrieve(self, request, pk=None):
+        """
+        Serve a user's profile from the cached read model
+        """
+        try:
+            user_id = uuid.UUID(str(pk))
+        except ValueError:
+            raise NotFound()
+        profile = get_cached_profile(user_id)
+        if profile is None:
+            raise NotFound()
+        return Response(profile)
+
     @action(detail=False, methods=['post'])
     def change_password(self, request):
         """
@@ -110,9 +217,11 @@ class UserViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user = serializer.save()
+        # Tokens issued for the old password stop working, including this one
+        end_all_sessions(user)
         
         # Log password change activity
-        UserActivity.objects.create(
+        log_activity(
             user=user,
             activity_type='password_change',
             ip_address=self.get_client_ip(request)
@@ -129,42 +238,24 @@ class UserViewSet(viewsets.ModelViewSet):
         """
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        email = serializer.validated_data['email']
+        user = serializer.validated_data['user']
         
-        try:
-            user = User.objects.get(email=email)
-            # Generate a random token
-            token = get_random_string(length=32)
-            # Store token with the user
-            user.password_reset_token = token
-            user.save()
-            
-            # Send email with reset link
-            reset_url = f"{settings.FRONTEND_URL}/reset-password/?token={token}"
-            send_mail(
-                'Password Reset Request',
-                f'Click the link to reset your password: {reset_url}',
-                settings.DEFAULT_FROM_EMAIL,
-                [email],
-                fail_silently=False,
-            )
-            
-            # Log password reset request activity
-            UserActivity.objects.create(
-                user=user,
-                activity_type='password_reset_request',
-                ip_address=self.get_client_ip(request)
-            )
-            
-            return Response({
-                'message': 'Password reset link sent to your email'
-            }, status=status.HTTP_200_OK)
-            
-        except User.DoesNotExist:
-            # We still return OK for security reasons
-            return Response({
-                'message': 'Password reset link sent to your email'
-            }, status=status.HTTP_200_OK)
+        # Generate a single-use token; only its digest is stored
+        token = issue_token(user, 'password_reset')
+        
+        # Queue email with reset link for the mail worker
+        queue_password_reset_email(user, token)
+        
+        # Log password reset request activity
+        log_activity(
+            user=user,
+            activity_type='password_reset_request',
+            ip_address=self.get_client_ip(request)
+        )
+        
+        return Response({
+            'message': 'Password reset link sent to your email'
+        }, status=status.HTTP_200_OK)
     
     @action(detail=False, methods=['post'])
     def reset_password_confirm(self, request):
@@ -179,34 +270,42 @@ class UserViewSet(viewsets.ModelViewSet):
                 'error': 'Token and new password are required'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        try:
-            user = User.objects.get(password_reset_token=token)
-            
-            # Validate password
-            try:
-                validate_password(new_password, user)
-            except ValidationError as e:
-                return Response({'error': list(e)}, status=status.HTTP_400_BAD_REQUEST)
-                
-            user.set_password(new_password)
-            user.password_reset_token = None  # Clear the token after use
-            user.save()
-            
-            # Log password reset activity
-            UserActivity.objects.create(
-                user=user,
-                activity_type='password_reset',
-                ip_address=self.get_client_ip(request)
-            )
-            
-            return Response({
-                'message': 'Password reset successful'
-            }, status=status.HTTP_200_OK)
-            
-        except User.DoesNotExist:
+        reset_token = get_valid_token(token, 'password_reset')
+        if reset_token is None:
             return Response({
                 'error': 'Invalid token'
             }, status=status.HTTP_400_BAD_REQUEST)
+        user = reset_token.user
+        
+        # Validate password
+        try:
+            validate_password(new_password, user)
+        except ValidationError as e:
+            return Response({'error': list(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Hash before locking the token, so the lock is not held for a full hash
+        set_user_password(user, new_password)
+        
+        with transaction.atomic():
+            # Redeemed by a concurrent request since it was read
+            if get_valid_token(token, 'password_reset', for_update=True) is None:
+                return Response({
+                    'error': 'Invalid token'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            user.save(update_fields=['password'])
+            reset_token.consume()  # The token cannot be used again
+            end_all_sessions(user)
+        
+        # Log password reset activity
+        log_activity(
+            user=user,
+            activity_type='password_reset',
+            ip_address=self.get_client_ip(request)
+        )
+        
+        return Response({
+            'message': 'Password reset successful'
+        }, status=status.HTTP_200_OK)
     
     @action(detail=False, methods=['post'])
     def verify_email(self, request):
@@ -217,22 +316,21 @@ class UserViewSet(viewsets.ModelViewSet):
         if not token:
             return Response({'error': 'Token is required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        try:
-            user = User.objects.get(email_verification_token=token)
-            user.is_verified = True
-            user.email_verification_token = None  # Clear the token
-            user.save()
-            
-            # Log email verification
-            UserActivity.objects.create(
-                user=user,
-                activity_type='email_verification',
-                ip_address=self.get_client_ip(request)
-            )
-            
-            return Response({'message': 'Email verified successfully'}, status=status.HTTP_200_OK)
-        except User.DoesNotExist:
+        user = consume_token(token, 'email_verification')
+        if user is None:
             return Response({'error': 'Invalid token'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        user.is_verified = True
+        user.save(update_fields=['is_verified'])
+        
+        # Log email verification
+        log_activity(
+            user=user,
+            activity_type='email_verification',
+            ip_address=self.get_client_ip(request)
+        )
+        
+        return Response({'message': 'Email verified successfully'}, status=status.HTTP_200_OK)
     
     @action(detail=True, methods=['delete'])
     def deactivate_account(self, request, pk=None):
@@ -242,10 +340,11 @@ class UserViewSet(viewsets.ModelViewSet):
         try:
             user = User.objects.get(pk=pk)
             user.is_active = False
-            user.save()
+            user.save(update_fields=['is_active'])
+            end_all_sessions(user)
             
             # Log account deactivation
-            UserActivity.objects.create(
+            log_activity(
                 user=user,
                 activity_type='account_deletion',
                 ip_address=self.get_client_ip(request),
@@ -310,10 +409,11 @@ class UserViewSet(viewsets.ModelViewSet):
         if confirm_totp_device(device, token):
             # Update user's 2FA status
             user.two_factor_enabled = True
-            user.save()
+            user.save(update_fields=['two_factor_enabled'])
+            invalidate_two_factor_state(user)
             
             # Log 2FA enabled
-            UserActivity.objects.create(
+            log_activity(
                 user=user,
                 activity_type='2fa_enabled',
                 ip_address=self.get_client_ip(request)
@@ -337,14 +437,10 @@ class UserViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        # Verify password
-        if not user.check_password(serializer.validated_data['password']):
-            return Response({
-                'error': 'Incorrect password'
-            }, status=status.HTTP_400_BAD_REQUEST)
-            
+        # The serializer has checked the password
+        
         # Get the user's device
-        device = TOTPDevice.objects.filter(user=user, confirmed=True).first()
+        device = get_user_totp_device(user)
         if not device:
             return Response({
                 'error': 'Two-factor authentication not enabled'
@@ -352,20 +448,21 @@ class UserViewSet(viewsets.ModelViewSet):
             
         # Verify token
         token = serializer.validated_data['token']
-        if not verify_totp_token(device.key, token):
+        if not verify_device_token(device, token):
             return Response({
                 'error': 'Invalid token'
             }, status=status.HTTP_400_BAD_REQUEST)
             
         # Disable 2FA
         user.two_factor_enabled = False
-        user.save()
+        user.save(update_fields=['two_factor_enabled'])
         
         # Delete all TOTP devices
         TOTPDevice.objects.filter(user=user).delete()
+        invalidate_two_factor_state(user)
         
         # Log 2FA disabled
-        UserActivity.objects.create(
+        log_activity(
             user=user,
             activity_type='2fa_disabled',
             ip_address=self.get_client_ip(request)
@@ -375,6 +472,122 @@ class UserViewSet(viewsets.ModelViewSet):
             'message': 'Two-factor authentication disabled successfully'
         })
         
+    @action(detail=False, methods=['post'], url_path='bulk-import')
+    def bulk_import(self, request):
+        """
+        Create users from an uploaded CSV or NDJSON file - Admin only
+
+        The file is sent as multipart field ``file``; the format comes from
+        ``format`` or the file extension. Returns one result per row.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'No file uploaded'}, status=status.HTTP_400_BAD_REQUEST)
+
+        input_format = request.data.get('format') or upload.name.rsplit('.', 1)[-1].lower()
+        if input_format not in IMPORT_FORMATS:
+            return Response({
+                'error': f'Unsupported format, use one of: {", ".join(IMPORT_FORMATS)}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            rows = parse_rows(upload.read().decode('utf-8-sig'), input_format)
+        except (UnicodeDecodeError, ValueError) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if len(rows) > settings.BULK_IMPORT_MAX_ROWS:
+            return Response({
+                'error': f'At most {settings.BULK_IMPORT_MAX_ROWS} rows per request, '
+                         f'use the import_users command for larger imports'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        results = provision_users(
+            rows,
+            created_by=request.user.username,
+            ip_address=self.get_client_ip(request),
+        )
+        created = sum(1 for result in results if result['status'] == 'created')
+        return Response({
+            'created': created,
+            'failed': len(results) - created,
+            'results': results,
+        })
+
+    @action(detail=False, methods=['get', 'patch'])
+    def profile(self, request):
+        """
+        Read or update the authenticated user's profile
+
+        Reads come from the cached read model; saving refreshes it.
+        Updates load the row again rather than saving request.user, which
+        is a cached or claims-built copy, and only write the changed
+        fields so concurrent password or session changes are kept.
+        """
+        if request.method == 'GET':
+            return Response(get_cached_profile(request.user.pk))
+        user = User.objects.get(pk=request.user.pk)
+        serializer = self.get_serializer(user, data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        for name, value in serializer.validated_data.items():
+            setattr(user, name, value)
+        user.save(update_fields=list(serializer.validated_data))
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'])
+    def sessions(self, request):
+        """
+        List the live sessions of the authenticated user
+        """
+        serializer = self.get_serializer(
+            live_sessions(request.user),
+            many=True,
+            context={'current_session_id': request.auth.get(SESSION_CLAIM)},
+        )
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['post'])
+    def logout(self, request):
+        """
+        End the current session, or the one given as ``session_id``
+        """
+        current_id = request.auth.get(SESSION_CLAIM)
+        session_id = request.data.get('session_id') or current_id
+        if session_id is not None:
+            try:
+                session_id = uuid.UUID(str(session_id)).hex
+            except ValueError:
+                return Response({'error': 'Invalid session id'}, status=status.HTTP_400_BAD_REQUEST)
+            if not end_session(request.user, session_id):
+                return Response({'error': 'Session not found'}, status=status.HTTP_404_NOT_FOUND)
+        if session_id == current_id:
+            # Refresh tokens are revoked with the session, this access token here
+            revoke_token(request.auth)
+
+        log_activity(
+            user=request.user,
+            activity_type='logout',
+            ip_address=self.get_client_ip(request),
+            additional_info={'session_id': session_id}
+        )
+
+        return Response({'message': 'Logged out successfully'})
+
+    @action(detail=False, methods=['post'], url_path='logout-all')
+    def logout_all(self, request):
+        """
+        End every session of the authenticated user
+        """
+        end_all_sessions(request.user)
+
+        log_activity(
+            user=request.user,
+            activity_type='logout',
+            ip_address=self.get_client_ip(request),
+            additional_info={'all_sessions': True}
+        )
+
+        return Response({'message': 'Logged out of all sessions'})
+
     @action(detail=False, methods=['get'])
     def check_2fa_status(self, request):
         """
@@ -389,9 +602,4 @@ class UserViewSet(viewsets.ModelViewSet):
         """
         Extract client IP address from request
         """
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR', '')
-        return ip
\ No newline at end of file
+        return get_client_ip(request)
\ No newline at end of file
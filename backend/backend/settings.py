@@ -1,7 +1,10 @@
+import importlib.util
 import os
 from pathlib import Path
 from datetime import timedelta
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -15,6 +18,10 @@ load_dotenv(os.path.join(BASE_DIR, '.env.development'))
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = os.environ.get('SECRET_KEY', 'your-secret-key-here-change-in-production')
 
+# Key for the secrets the app stores encrypted, such as queued email
+# bodies and cached TOTP secrets; derived from SECRET_KEY when unset
+FIELD_ENCRYPTION_KEY = os.environ.get('FIELD_ENCRYPTION_KEY', '')
+
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = os.environ.get('DEBUG', 'True') == 'True'
 
@@ -50,12 +57,14 @@ else:
     MIDDLEWARE = []
 
 MIDDLEWARE += [
+    'authentication.instrumentation.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'authentication.middleware.TwoFactorMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -91,6 +100,22 @@ DATABASES = {
         'PASSWORD': os.environ.get('DB_PASSWORD', 'November#09'),
         'HOST': os.environ.get('DB_HOST', 'localhost'),
         'PORT': os.environ.get('DB_PORT', '5432'),
+        # Keep each worker's connection open between requests instead of
+        # paying the TCP/TLS/auth handshake every time; see gunicorn.conf.py
+        # for how the connection count follows the worker count. Under ASGI
+        # every request runs its queries on a new thread, so set this to 0
+        # there and pool connections in PgBouncer instead
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 0 if DEBUG else 600)),
+        # Check a reused connection before the first query of each request
+        'CONN_HEALTH_CHECKS': True,
+        # PgBouncer in transaction mode hands each transaction to any server
+        # connection, so cursors cannot outlive one; set with the pooler
+        'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DB_DISABLE_SERVER_SIDE_CURSORS', 'False') == 'True',
+        'OPTIONS': {
+            'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 5)),
+            'keepalives': 1,
+            'keepalives_idle': 60,
+        },
     }
 }
 
@@ -106,10 +131,41 @@ if os.environ.get('REDIS_URL'):
         }
     }
 
+# Rate limiter used by the login, password reset and email verification
+# throttles. The local backend only limits within a single process, which
+# multiplies every limit by the worker count, so it is refused outside DEBUG
+THROTTLE_BACKEND = os.environ.get(
+    'THROTTLE_BACKEND',
+    'authentication.throttles.RedisThrottleBackend' if os.environ.get('REDIS_URL')
+    else 'authentication.throttles.LocalThrottleBackend'
+)
+if not DEBUG and THROTTLE_BACKEND == 'authentication.throttles.LocalThrottleBackend':
+    raise ImproperlyConfigured('LocalThrottleBackend only limits one process; set REDIS_URL')
+
+# Store of revoked JWT ids checked on refresh, verification and
+# authentication. Each process keeps a Bloom filter of revocations in front
+# of it and pulls other processes' revocations every
+# TOKEN_REVOCATION_SYNC_INTERVAL seconds. Without Redis the database store
+# stands in, except under DEBUG; the local store only sees its own
+# process's revocations, so a token revoked on one worker would still be
+# accepted by the others
+TOKEN_REVOCATION_STORE = os.environ.get(
+    'TOKEN_REVOCATION_STORE',
+    'authentication.revocation.RedisRevocationStore' if os.environ.get('REDIS_URL')
+    else 'authentication.revocation.LocalRevocationStore' if DEBUG
+    else 'authentication.revocation.DatabaseRevocationStore'
+)
+TOKEN_REVOCATION_SYNC_INTERVAL = float(os.environ.get('TOKEN_REVOCATION_SYNC_INTERVAL', 1.0))
+# Peak revocations per second (refreshes plus logouts). The Bloom filter
+# is sized for this rate over the longest token lifetime unless
+# TOKEN_REVOCATION_BLOOM_CAPACITY gives the item count directly
+TOKEN_REVOCATION_RATE = float(os.environ.get('TOKEN_REVOCATION_RATE', 5))
+TOKEN_REVOCATION_BLOOM_CAPACITY = int(os.environ.get('TOKEN_REVOCATION_BLOOM_CAPACITY', 0)) or None
+
 # REST Framework and Authentication Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'authentication.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -126,8 +182,14 @@ REST_FRAMEWORK = {
         'email_verification': '10/hour',  # Limit email verification attempts
     },
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # Reverse proxies in front of the app; only that many X-Forwarded-For
+    # entries are trusted when throttles and lockouts identify clients
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
 }
 
+# Default page size of the keyset paginated lists; see authentication.pagination
+API_PAGE_SIZE = int(os.environ.get('API_PAGE_SIZE', 50))
+
 # API Documentation with DRF Spectacular
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Authentication API',
@@ -140,14 +202,76 @@ SPECTACULAR_SETTINGS = {
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=int(os.environ.get('JWT_ACCESS_TOKEN_LIFETIME_MINUTES', 60))),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=int(os.environ.get('JWT_REFRESH_TOKEN_LIFETIME_DAYS', 1))),
+    # A rotated refresh token is revoked in TOKEN_REVOCATION_STORE
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
     'SIGNING_KEY': os.environ.get('SIMPLE_JWT_SIGNING_KEY', SECRET_KEY),
     'UPDATE_LAST_LOGIN': True,  # Add this to update the last_login field
     'USER_ID_FIELD': 'id',      # Add this to specify the user ID field
     'USER_ID_CLAIM': 'user_id', # Add this to specify the user ID claim
+    # Signed and verified through JWT_SIGNING_ALGORITHM's backend
+    'AUTH_TOKEN_CLASSES': ('authentication.signing.AccessToken',),
 }
 
+# RS256 and EdDSA tokens are signed with the newest active key of the key
+# ring in the SigningKey table and name it in their kid header; other
+# services verify them with the public keys served at
+# /.well-known/jwks.json. HS256 signs with SIMPLE_JWT_SIGNING_KEY as before
+JWT_SIGNING_ALGORITHM = os.environ.get('JWT_SIGNING_ALGORITHM', 'RS256')
+JWT_RSA_KEY_SIZE = int(os.environ.get('JWT_RSA_KEY_SIZE', 2048))
+
+# rotate_signing_keys replaces the signing key once it is this old. The new
+# key is published for JWT_KEY_PUBLISH_AHEAD_SECONDS before it signs, which
+# must exceed JWKS_MAX_AGE so every cached key set has it by then
+JWT_KEY_ROTATION_DAYS = int(os.environ.get('JWT_KEY_ROTATION_DAYS', 30))
+JWT_KEY_PUBLISH_AHEAD_SECONDS = int(os.environ.get('JWT_KEY_PUBLISH_AHEAD_SECONDS', 3600))
+JWKS_MAX_AGE = int(os.environ.get('JWKS_MAX_AGE', 300))
+
+# Seconds each process keeps its copy of the key ring
+JWT_KEY_RING_REFRESH_SECONDS = float(os.environ.get('JWT_KEY_RING_REFRESH_SECONDS', 60))
+
+# Keep accepting HS256 tokens issued before switching to a key ring; turn
+# off once REFRESH_TOKEN_LIFETIME has passed since the switch
+JWT_ACCEPT_LEGACY_HS256 = os.environ.get('JWT_ACCEPT_LEGACY_HS256', 'True') == 'True'
+
+# Batch token introspection at /api/auth/token/introspect/. With
+# TOKEN_INTROSPECTION_SECRET set callers send it as a bearer token,
+# otherwise a staff user's JWT is required
+TOKEN_INTROSPECTION_SECRET = os.environ.get('TOKEN_INTROSPECTION_SECRET', '')
+TOKEN_INTROSPECTION_MAX_TOKENS = int(os.environ.get('TOKEN_INTROSPECTION_MAX_TOKENS', 100))
+
+# Seconds a user loaded by CachedJWTAuthentication stays in the cache
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 300))
+
+# Seconds a serialized profile stays in the cache; saves refresh it, so
+# this only bounds staleness after queryset.update() calls
+PROFILE_CACHE_TTL = int(os.environ.get('PROFILE_CACHE_TTL', 3600))
+
+# Build request.user from the access token claims instead of loading it;
+# deactivation then only takes effect when the access token expires
+JWT_USER_FROM_CLAIMS = os.environ.get('JWT_USER_FROM_CLAIMS', 'False') == 'True'
+
+# Per-request query, cache and serializer metrics collected by
+# RequestMetricsMiddleware
+REQUEST_METRICS_ENABLED = os.environ.get('REQUEST_METRICS_ENABLED', 'True') == 'True'
+
+# Expose those metrics to clients in a Server-Timing header
+SERVER_TIMING_HEADER = os.environ.get('SERVER_TIMING_HEADER', str(DEBUG)) == 'True'
+
+# Raise instead of logging when a view exceeds its declared query budget
+# or repeats a statement QUERY_REPEAT_THRESHOLD times (enabled in tests)
+QUERY_BUDGET_STRICT = os.environ.get('QUERY_BUDGET_STRICT', 'False') == 'True'
+QUERY_REPEAT_THRESHOLD = int(os.environ.get('QUERY_REPEAT_THRESHOLD', 5))
+
+# Prometheus scrape endpoint at /api/metrics/; the scraper must send
+# METRICS_TOKEN as a bearer token, and without one only staff sessions can
+# read it. Set PROMETHEUS_MULTIPROC_DIR to aggregate metrics across
+# gunicorn workers.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True') == 'True'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+# Seconds the database-backed gauges are reused between scrapes
+METRICS_DB_STATE_TTL = float(os.environ.get('METRICS_DB_STATE_TTL', 15))
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -167,6 +291,33 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing profile: scrypt (default), argon2 (needs argon2-cffi,
+# falls back to scrypt without it) or pbkdf2. The profile's hasher makes new
+# hashes; the rest stay listed so existing hashes verify and are upgraded on
+# the next successful login. Tune the costs per node type with
+# `manage.py calibrate_password_hasher --target-ms 250`.
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'scrypt')
+if PASSWORD_HASHER == 'argon2' and importlib.util.find_spec('argon2') is None:
+    PASSWORD_HASHER = 'scrypt'
+_PROFILE_HASHERS = {
+    'scrypt': 'authentication.hashers.TunedScryptPasswordHasher',
+    'argon2': 'authentication.hashers.TunedArgon2PasswordHasher',
+    'pbkdf2': 'authentication.hashers.TunedPBKDF2PasswordHasher',
+}
+PASSWORD_HASHERS = [_PROFILE_HASHERS[PASSWORD_HASHER]] + [
+    path for profile, path in _PROFILE_HASHERS.items() if profile != PASSWORD_HASHER
+] + [
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+PASSWORD_PBKDF2_ITERATIONS = int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS', 600000))
+PASSWORD_SCRYPT_WORK_FACTOR = int(os.environ.get('PASSWORD_SCRYPT_WORK_FACTOR', 2 ** 14))
+PASSWORD_SCRYPT_BLOCK_SIZE = int(os.environ.get('PASSWORD_SCRYPT_BLOCK_SIZE', 8))
+PASSWORD_SCRYPT_PARALLELISM = int(os.environ.get('PASSWORD_SCRYPT_PARALLELISM', 1))
+PASSWORD_ARGON2_TIME_COST = int(os.environ.get('PASSWORD_ARGON2_TIME_COST', 2))
+PASSWORD_ARGON2_MEMORY_COST = int(os.environ.get('PASSWORD_ARGON2_MEMORY_COST', 102400))  # KiB
+PASSWORD_ARGON2_PARALLELISM = int(os.environ.get('PASSWORD_ARGON2_PARALLELISM', 8))
+
 # Security Settings
 SESSION_COOKIE_HTTPONLY = True
 CSRF_COOKIE_HTTPONLY = True
@@ -185,8 +336,41 @@ if not DEBUG:
 # Rate Limiting Configuration
 LOGIN_ATTEMPT_WINDOW_MINUTES = int(os.environ.get('LOGIN_ATTEMPT_WINDOW_MINUTES', 15))
 
+# Progressive lockout: after LOCKOUT_ACCOUNT_THRESHOLD failed logins for one
+# account, or LOCKOUT_IP_THRESHOLD from one address, within
+# LOGIN_ATTEMPT_WINDOW_MINUTES, logins are refused without checking the
+# password for LOCKOUT_BASE_SECONDS, doubling with every further failure up
+# to LOCKOUT_MAX_SECONDS. The local backend only counts within one process,
+# which allows the threshold once per worker, so it is refused outside DEBUG
+LOCKOUT_BACKEND = os.environ.get(
+    'LOCKOUT_BACKEND',
+    'authentication.lockout.RedisLockoutBackend' if os.environ.get('REDIS_URL')
+    else 'authentication.lockout.LocalLockoutBackend'
+)
+if not DEBUG and LOCKOUT_BACKEND == 'authentication.lockout.LocalLockoutBackend':
+    raise ImproperlyConfigured('LocalLockoutBackend only counts failures in one process; set REDIS_URL')
+LOCKOUT_ACCOUNT_THRESHOLD = int(os.environ.get('LOCKOUT_ACCOUNT_THRESHOLD', 5))
+LOCKOUT_IP_THRESHOLD = int(os.environ.get('LOCKOUT_IP_THRESHOLD', 20))
+LOCKOUT_BASE_SECONDS = int(os.environ.get('LOCKOUT_BASE_SECONDS', 30))
+LOCKOUT_MAX_SECONDS = int(os.environ.get('LOCKOUT_MAX_SECONDS', 3600))
+
+# Audit Log Configuration
+# When enabled, UserActivity and LoginAttempt rows are buffered and written in
+# batches by a background thread; sensitive activities are always written inline
+AUDIT_LOG_ASYNC = os.environ.get('AUDIT_LOG_ASYNC', 'False') == 'True'
+AUDIT_LOG_BATCH_SIZE = int(os.environ.get('AUDIT_LOG_BATCH_SIZE', 100))
+AUDIT_LOG_FLUSH_INTERVAL = float(os.environ.get('AUDIT_LOG_FLUSH_INTERVAL', 1.0))
+AUDIT_LOG_MAX_QUEUE_SIZE = int(os.environ.get('AUDIT_LOG_MAX_QUEUE_SIZE', 10000))
+
+# Months of audit rows kept by manage_audit_partitions (0 keeps everything)
+# and how many monthly partitions it creates in advance
+AUDIT_LOG_RETENTION_MONTHS = int(os.environ.get('AUDIT_LOG_RETENTION_MONTHS', 12))
+AUDIT_PARTITIONS_AHEAD = int(os.environ.get('AUDIT_PARTITIONS_AHEAD', 3))
+
 # Two-Factor Authentication
 TWO_FACTOR_ENABLED = os.environ.get('TWO_FACTOR_ENABLED', 'False') == 'True'
+# Seconds a user's 2FA/device state is cached by TwoFactorMiddleware
+TWO_FACTOR_STATE_CACHE_TTL = int(os.environ.get('TWO_FACTOR_STATE_CACHE_TTL', 60))
 
 # Email Configuration
 EMAIL_BACKEND = os.environ.get(
@@ -203,6 +387,46 @@ if EMAIL_BACKEND == 'django.core.mail.backends.smtp.EmailBackend':
     EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD')
     EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', 'True') == 'True'
 
+# Lifetimes of the single-use tokens sent by email
+EMAIL_VERIFICATION_TOKEN_LIFETIME_HOURS = int(os.environ.get('EMAIL_VERIFICATION_TOKEN_LIFETIME_HOURS', 48))
+PASSWORD_RESET_TOKEN_LIFETIME_MINUTES = int(os.environ.get('PASSWORD_RESET_TOKEN_LIFETIME_MINUTES', 60))
+
+# Outbound mail queue, drained by `manage.py send_queued_mail`
+MAIL_QUEUE_BATCH_SIZE = int(os.environ.get('MAIL_QUEUE_BATCH_SIZE', 50))
+MAIL_QUEUE_MAX_ATTEMPTS = int(os.environ.get('MAIL_QUEUE_MAX_ATTEMPTS', 5))
+MAIL_QUEUE_RETRY_BACKOFF_SECONDS = int(os.environ.get('MAIL_QUEUE_RETRY_BACKOFF_SECONDS', 30))
+MAIL_QUEUE_MAX_RETRY_DELAY_SECONDS = int(os.environ.get('MAIL_QUEUE_MAX_RETRY_DELAY_SECONDS', 3600))
+MAIL_QUEUE_POLL_INTERVAL = float(os.environ.get('MAIL_QUEUE_POLL_INTERVAL', 2.0))
+# Seconds a worker holds the messages it claimed before another may retry
+# them; longer than sending a batch takes
+MAIL_QUEUE_CLAIM_SECONDS = int(os.environ.get('MAIL_QUEUE_CLAIM_SECONDS', 300))
+# Days sent and failed messages are kept before purge_expired_tokens deletes them
+MAIL_RETENTION_DAYS = int(os.environ.get('MAIL_RETENTION_DAYS', 7))
+
+# Serve login, token refresh, email verification and 2FA verification from
+# async views. Only worthwhile under an ASGI server, see gunicorn.conf.py
+ASYNC_AUTH_VIEWS = os.environ.get('ASYNC_AUTH_VIEWS', 'False') == 'True'
+
+# Password hashing runs in a process pool per web worker. Size it so that
+# GUNICORN_WORKERS * PASSWORD_HASHING_PROCESSES roughly matches the cores;
+# each worker queues at most PASSWORD_HASHING_MAX_PENDING operations and
+# answers 503 after waiting PASSWORD_HASHING_TIMEOUT seconds for a slot.
+# 0 processes hashes inline on the request thread.
+PASSWORD_HASHING_PROCESSES = int(os.environ.get(
+    'PASSWORD_HASHING_PROCESSES',
+    max(1, (os.cpu_count() or 1) // int(os.environ.get('GUNICORN_WORKERS', 4))),
+))
+PASSWORD_HASHING_MAX_PENDING = int(os.environ.get('PASSWORD_HASHING_MAX_PENDING', 8))
+PASSWORD_HASHING_TIMEOUT = float(os.environ.get('PASSWORD_HASHING_TIMEOUT', 10))
+
+# Bulk user import (users/bulk-import/ and `manage.py import_users`): rows
+# per insert, hashing processes for the command (the endpoint uses the
+# shared hashing pool), and the most rows one API request may carry;
+# larger imports go through the management command
+BULK_IMPORT_CHUNK_SIZE = int(os.environ.get('BULK_IMPORT_CHUNK_SIZE', 500))
+BULK_IMPORT_PROCESSES = int(os.environ.get('BULK_IMPORT_PROCESSES', min(4, os.cpu_count() or 1)))
+BULK_IMPORT_MAX_ROWS = int(os.environ.get('BULK_IMPORT_MAX_ROWS', 1000))
+
 # Frontend URL for email links
 FRONTEND_URL = os.environ.get('FRONTEND_URL', 'http://localhost:3000')
 
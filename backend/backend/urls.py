@@ -4,12 +4,19 @@ from django.conf import settings
 from django.conf.urls.static import static
 from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
 
+from authentication.metrics import metrics_view
+from authentication.signing import jwks_view
+
 urlpatterns = [
     # Django admin
     path('admin/', admin.site.urls),
     
     # API endpoints
     path('api/auth/', include('authentication.urls')),
+    path('api/metrics/', metrics_view, name='metrics'),
+
+    # Public keys for verifying our JWTs
+    path('.well-known/jwks.json', jwks_view, name='jwks'),
     
     # API documentation with drf-spectacular
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
@@ -0,0 +1,70 @@
+"""
+Gunicorn configuration for the backend
+
+Each worker thread keeps one persistent database connection (see
+CONN_MAX_AGE in backend/settings.py), so the connection count is
+workers * threads per container. Size these so the total across all
+containers stays below the Postgres max_connections.
+
+With GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker the workers serve
+backend.asgi:application and each handles many requests concurrently;
+set ASYNC_AUTH_VIEWS=True so the auth endpoints run as async views, and
+DB_CONN_MAX_AGE=0, since connections are then opened per request thread.
+Point DB_HOST at PgBouncer then, as docker-compose.yml does, so those
+connections do not each pay the Postgres handshake.
+"""
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 4))
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+
+# Connections this container may open; DB_MAX_CONNECTIONS is the share of
+# the server's max_connections reserved for it
+db_connections = workers * threads
+db_max_connections = int(os.environ.get('DB_MAX_CONNECTIONS', 90))
+
+
+def on_starting(server):
+    if worker_class != 'sync':
+        server.log.info('%d %s workers; size DB_MAX_CONNECTIONS for peak concurrency', workers, worker_class)
+        return
+    server.log.info(
+        'Database connections: %d workers x %d threads = %d persistent connections',
+        workers, threads, db_connections,
+    )
+    if db_connections > db_max_connections:
+        server.log.warning(
+            'Persistent connections (%d) exceed DB_MAX_CONNECTIONS (%d); '
+            'lower GUNICORN_WORKERS/GUNICORN_THREADS or DB_CONN_MAX_AGE',
+            db_connections, db_max_connections,
+        )
+
+
+def when_ready(server):
+    # Start each run with empty multiprocess metric files
+    metrics_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if metrics_dir:
+        os.makedirs(metrics_dir, exist_ok=True)
+        for name in os.listdir(metrics_dir):
+            os.remove(os.path.join(metrics_dir, name))
+
+
+def child_exit(server, worker):
+    # Stop counting a dead worker's live gauges
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def worker_exit(server, worker):
+    # Flush buffered audit rows and close persistent connections cleanly
+    from django.db import connections
+    from authentication.audit import get_audit_writer
+    from authentication.hashing import get_hasher_pool
+
+    get_audit_writer().shutdown()
+    get_hasher_pool().shutdown()
+    connections.close_all()